@@ -0,0 +1,163 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticAnswerCache:
+    """
+    Reuses generated answers for paraphrased questions over the same context.
+
+    Entries are grouped by a key over the model name, the set of retrieved chunk
+    ids and the chat history in the prompt; within a group, an answer is reused when the cosine similarity between the
+    new and the cached query embedding reaches the threshold. The cache is bounded
+    (least recently used entries are evicted) and persisted as an append-only JSON-lines
+    log: storing an answer appends one line, and the log is rewritten with the live
+    entries once it holds twice as many records.
+    """
+
+    def __init__(self, path: Path, threshold: float = 0.95, max_entries: int = 1000):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+        self._entries = OrderedDict()
+        self._groups: Dict[str, List[int]] = {}
+        self._next_id = 0
+        self._log_records = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def context_key(model: str, chunk_ids: List[str], chat_history: Optional[List[Dict[str, str]]] = None) -> str:
+        """Key over the model, the retrieved chunks and the chat turns the prompt carries."""
+        key = "|".join([model] + sorted(set(chunk_ids)))
+        if chat_history:
+            key += "\0" + json.dumps([[msg['role'], msg['content']] for msg in chat_history], ensure_ascii=False)
+        return hashlib.md5(key.encode()).hexdigest()
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, query_embedding, context_key: str) -> Optional[Dict[str, any]]:
+        """Return the closest cached entry for this context if it is similar enough."""
+        with self._lock:
+            entry_ids = self._groups.get(context_key)
+            if entry_ids:
+                query = self._normalize(query_embedding)
+                matrix = np.stack([self._entries[entry_id]['embedding'] for entry_id in entry_ids])
+                similarities = matrix @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry_id = entry_ids[best]
+                    entry = self._entries[entry_id]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    self.latency_saved += entry['generation_seconds']
+                    return {'answer': entry['answer'], 'similarity': float(similarities[best])}
+            self.misses += 1
+            return None
+
+    def put(self, query_embedding, context_key: str, answer: str, generation_seconds: float):
+        with self._lock:
+            entry = self._insert(self._normalize(query_embedding), context_key, answer, generation_seconds)
+            self._append(entry)
+
+    def _insert(self, embedding: np.ndarray, context_key: str, answer: str, generation_seconds: float) -> Dict[str, any]:
+        entry_id = self._next_id
+        self._next_id += 1
+        entry = self._entries[entry_id] = {
+            'embedding': embedding,
+            'context_key': context_key,
+            'answer': answer,
+            'generation_seconds': generation_seconds,
+        }
+        self._groups.setdefault(context_key, []).append(entry_id)
+        while len(self._entries) > self.max_entries:
+            old_id, old_entry = self._entries.popitem(last=False)
+            group = self._groups[old_entry['context_key']]
+            group.remove(old_id)
+            if not group:
+                del self._groups[old_entry['context_key']]
+        return entry
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.error("Error reading answer cache: %s", e)
+            return
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+                embedding = np.frombuffer(base64.b64decode(record['embedding']), dtype=np.float32)
+            except (ValueError, KeyError, TypeError):
+                # A record cut short by a crash, or a cache file in an older format.
+                continue
+            self._insert(embedding, record['context_key'], record['answer'], record['generation_seconds'])
+            self._log_records += 1
+        logger.info("Loaded %s cached answers.", len(self._entries))
+        if data and (not data.endswith("\n") or self._log_records > 2 * len(self._entries)):
+            self._compact()
+
+    @staticmethod
+    def _record(entry: Dict[str, any]) -> str:
+        return json.dumps({
+            'embedding': base64.b64encode(entry['embedding'].tobytes()).decode("ascii"),
+            'context_key': entry['context_key'],
+            'answer': entry['answer'],
+            'generation_seconds': entry['generation_seconds'],
+        }, ensure_ascii=False) + "\n"
+
+    def _append(self, entry: Dict[str, any]):
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(self._record(entry))
+            self._log_records += 1
+        except Exception as e:
+            logger.error("Error saving answer cache: %s", e)
+            return
+        # Rewriting at twice the live entries keeps the cost per stored answer constant.
+        if self._log_records > 2 * max(self.max_entries, 1):
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the log with only the live entries, least recently used first."""
+        try:
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(self._record(entry) for entry in self._entries.values())
+            os.replace(tmp_path, self.path)
+            self._log_records = len(self._entries)
+        except Exception as e:
+            logger.error("Error compacting answer cache: %s", e)
+
+    def stats(self) -> Dict[str, any]:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'latency_saved_seconds': self.latency_saved,
+        }
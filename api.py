@@ -0,0 +1,289 @@
+"""
+Headless HTTP API over the shared RAGEngine and LLMHandler.
+
+    uvicorn api:app --host 0.0.0.0 --port 8000
+
+Every endpoint passes an admission gate: a fixed number of requests run at once,
+a bounded number wait in line, and anything beyond that gets 429 with its would-be
+queue position and a Retry-After hint instead of piling up in front of Ollama.
+"""
+import asyncio
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import iterate_in_threadpool
+
+import config
+import metrics
+import startup
+from ingest_queue import IngestQueue
+from ingest_worker import start_background_worker
+from llm_handler import get_shared_llm_handler
+from rag_engine import get_shared_engine
+from utils import upload_filename
+
+
+class QueueFull(Exception):
+    def __init__(self, gate: "AdmissionGate", position: int):
+        super().__init__(f"{gate.name} queue is full")
+        self.gate = gate
+        self.position = position
+
+
+class AdmissionGate:
+    """Concurrency cap plus a bounded FIFO wait line for one kind of work."""
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, retry_after: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def admit(self) -> int:
+        """Reserve a place and return the queue position (0 = runs immediately), or raise QueueFull."""
+        position = max(0, self.active + self.waiting - self.concurrency + 1)
+        if position > self.queue_size:
+            self.rejected += 1
+            raise QueueFull(self, position)
+        self.waiting += 1
+        return position
+
+    async def wait(self):
+        """Wait for a slot after admit(); the place is given back if waiting fails."""
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=config.API_QUEUE_TIMEOUT)
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def withdraw(self):
+        """Give back a place reserved by admit() that will never wait()."""
+        self.waiting -= 1
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'active': self.active,
+            'waiting': self.waiting,
+            'rejected': self.rejected,
+            'concurrency': self.concurrency,
+            'queue_size': self.queue_size,
+        }
+
+
+class SearchRequest(BaseModel):
+    query: str
+    k: int = config.TOP_K_RESULTS
+    search_type: str = config.SEARCH_TYPE
+
+
+class AnswerRequest(BaseModel):
+    query: str
+    k: int = config.TOP_K_RESULTS
+    chat_history: Optional[List[Dict[str, str]]] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    metrics.setup_logging()
+    app.state.pool = ThreadPoolExecutor(max_workers=config.API_WORKERS, thread_name_prefix="api")
+    app.state.search_gate = AdmissionGate("search", config.API_SEARCH_CONCURRENCY, config.API_SEARCH_QUEUE_SIZE, 1)
+    app.state.llm_gate = AdmissionGate("answer", config.API_LLM_CONCURRENCY, config.API_LLM_QUEUE_SIZE, 10)
+    app.state.ingest_queue = IngestQueue()
+    loop = asyncio.get_running_loop()
+    app.state.engine = await loop.run_in_executor(app.state.pool, get_shared_engine)
+    app.state.llm = await loop.run_in_executor(app.state.pool, get_shared_llm_handler)
+    start_background_worker(app.state.engine)
+    yield
+    app.state.pool.shutdown(wait=False)
+
+
+app = FastAPI(title="RAG Agri API", lifespan=lifespan)
+
+
+@app.exception_handler(QueueFull)
+async def queue_full_handler(request: Request, exc: QueueFull):
+    return JSONResponse(
+        status_code=429,
+        content={'detail': str(exc), 'queue_position': exc.position, 'queue': exc.gate.stats()},
+        headers={'Retry-After': str(exc.gate.retry_after)}
+    )
+
+
+async def _run(func, *args):
+    # Carry the request's trace into the pool thread.
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(app.state.pool, partial(context.run, func, *args))
+
+
+async def _search(query: str, search_type: str, k: int):
+    gate = app.state.search_gate
+    position = gate.admit()
+    try:
+        await gate.wait()
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Timed out waiting for a search slot")
+    try:
+        return position, await _run(app.state.engine.search, query, search_type, k)
+    finally:
+        gate.release()
+
+
+def _serialize_results(results) -> List[Dict]:
+    return [
+        {'content': doc.page_content, 'metadata': doc.metadata, 'score': float(score)}
+        for doc, score in results
+    ]
+
+
+@app.get("/health")
+async def health():
+    return {
+        'status': 'ok',
+        'generation': app.state.engine.generation,
+        'search_queue': app.state.search_gate.stats(),
+        'answer_queue': app.state.llm_gate.stats(),
+        'ingest_jobs': app.state.ingest_queue.counts(),
+    }
+
+
+@app.get("/ready")
+async def ready():
+    """503 until the embedding model and indexes are loaded; 'warm' also covers the warm-ups."""
+    status = startup.STATUS.snapshot()
+    return JSONResponse(content=status, status_code=200 if status['ready'] else 503)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/search")
+async def search(request: SearchRequest):
+    with metrics.use_trace(metrics.Trace()) as trace:
+        position, results = await _search(request.query, request.search_type, request.k)
+    return JSONResponse(
+        content={'results': _serialize_results(results), 'trace_id': trace.trace_id, 'stages': trace.stages()},
+        headers={'X-Queue-Position': str(position), 'X-Trace-Id': trace.trace_id}
+    )
+
+
+@app.post("/answer")
+async def answer(request: AnswerRequest):
+    """
+    Stream the answer as newline-delimited JSON events: an optional
+    {'type': 'queued', 'position': n}, then 'token' events and one 'final' record
+    carrying the trace id and per-stage timings of the search and the answer.
+    """
+    # Admit before searching so a full generation queue is refused right away.
+    llm_gate = app.state.llm_gate
+    position = llm_gate.admit()
+    trace = metrics.Trace()
+    try:
+        with metrics.use_trace(trace):
+            _, results = await _search(request.query, config.SEARCH_TYPE, request.k)
+            # The answer cache is keyed by the query embedding; skip it rather than wait for the model.
+            query_embedding = None
+            if app.state.engine.embeddings_ready:
+                query_embedding = await _run(app.state.engine.embed_query, request.query)
+            docs = [doc for doc, _ in results]
+            # The stream is bound to this trace whichever thread later pulls from it.
+            stream = app.state.llm.stream_answer(request.query, docs, request.chat_history, query_embedding)
+    except BaseException:
+        llm_gate.withdraw()
+        raise
+
+    async def events():
+        # The client may disconnect at any yield; the finally block returns the place or slot.
+        reserved = True
+        acquired = False
+        try:
+            if position:
+                yield json.dumps({'type': 'queued', 'position': position}) + "\n"
+            reserved = False
+            await llm_gate.wait()
+            acquired = True
+            async for event in iterate_in_threadpool(stream):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except asyncio.TimeoutError:
+            yield json.dumps({'type': 'error', 'detail': "Timed out waiting for the model"}) + "\n"
+        finally:
+            if reserved:
+                llm_gate.withdraw()
+            if acquired:
+                llm_gate.release()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson", headers={'X-Trace-Id': trace.trace_id})
+
+
+def _upload_path(name: str) -> Path:
+    """Where an uploaded file lives; client-supplied names never leave PDF_UPLOAD_DIR."""
+    try:
+        return config.PDF_UPLOAD_DIR / upload_filename(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/ingest", status_code=202)
+async def ingest(files: List[UploadFile] = File(...)):
+    """Save the uploads and queue one durable ingest job per file."""
+    queue = app.state.ingest_queue
+    pending = await _run(queue.pending)
+    if pending + len(files) > config.API_INGEST_QUEUE_SIZE:
+        return JSONResponse(
+            status_code=429,
+            content={'detail': "ingest queue is full", 'queue_position': pending + 1},
+            headers={'Retry-After': '30'}
+        )
+
+    pdf_paths = []
+    for upload in files:
+        pdf_path = _upload_path(upload.filename)
+        if pdf_path.suffix.lower() != ".pdf":
+            raise HTTPException(status_code=400, detail=f"Not a PDF: {upload.filename}")
+        content = await upload.read()
+        await _run(pdf_path.write_bytes, content)
+        pdf_paths.append(str(pdf_path))
+
+    job_ids = await _run(queue.enqueue, pdf_paths)
+    return {'job_ids': job_ids, 'queue_position': pending}
+
+
+@app.delete("/documents/{name}", status_code=202)
+async def delete_document(name: str):
+    """Remove an uploaded PDF and queue the removal of its chunks."""
+    pdf_path = _upload_path(name)
+    if pdf_path.exists():
+        await _run(pdf_path.unlink)
+    job_ids = await _run(partial(app.state.ingest_queue.enqueue, [str(pdf_path)], action='delete'))
+    return {'job_ids': job_ids}
+
+
+@app.get("/ingest/{job_id}")
+async def ingest_status(job_id: int):
+    job = await _run(app.state.ingest_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown ingest job")
+    return job
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=config.API_HOST, port=config.API_PORT)
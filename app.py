@@ -3,9 +3,13 @@ import os
 from pathlib import Path
 
 import config
-from rag_engine import RAGEngine
-from llm_handler import LLMHandler
-from utils import format_source_reference, highlight_text
+import metrics
+import startup
+from rag_engine import get_shared_engine
+from llm_handler import get_shared_llm_handler
+from ingest_queue import IngestQueue
+from ingest_worker import start_background_worker
+from utils import format_source_reference, highlight_text, upload_filename
 
 
 # Page configuration
@@ -43,58 +47,102 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-# Initialize session state
+# Initialize session state; the engine and LLM handler are shared by all sessions in the process
 if 'rag_engine' not in st.session_state:
     st.session_state.rag_engine = None
     st.session_state.llm_handler = None
     st.session_state.chat_history = []
+    st.session_state.ingest_job_ids = []
     st.session_state.initialized = False
 
     # Auto-initialize on startup
+    metrics.setup_logging()
+    metrics.start_http_server(config.METRICS_PORT)
     try:
         with st.spinner("🚀 Đang khởi động hệ thống..."):
-            st.session_state.rag_engine = RAGEngine()
-            st.session_state.llm_handler = LLMHandler()
+            st.session_state.rag_engine = get_shared_engine()
+            st.session_state.llm_handler = get_shared_llm_handler()
+            st.session_state.ingest_queue = IngestQueue()
+            start_background_worker(st.session_state.rag_engine)
             st.session_state.initialized = True
     except Exception as e:
         st.error(f"Lỗi khởi động: {str(e)}")
 
 
+JOB_STATUS_LABELS = {
+    'queued': "⏳ Đang chờ",
+    'running': "⚙️ Đang xử lý",
+    'done': "✅ Hoàn tất",
+    'skipped': "⏭️ Đã xử lý trước đó",
+    'failed': "❌ Lỗi",
+}
+
+
 def upload_pdfs(uploaded_files):
+    """Save the uploads and queue them for the background ingest worker."""
     if not uploaded_files:
         return
     
-    total_chunks = 0
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    for i, uploaded_file in enumerate(uploaded_files):
+    pdf_paths = []
+    for uploaded_file in uploaded_files:
         try:
-            pdf_path = config.PDF_UPLOAD_DIR / uploaded_file.name
+            pdf_path = config.PDF_UPLOAD_DIR / upload_filename(uploaded_file.name)
             with open(pdf_path, "wb") as f:
                 f.write(uploaded_file.getbuffer())
-            
-            status_text.text(f"Đang xử lý: {uploaded_file.name}")
-            
-            # Process PDF
-            chunks = st.session_state.rag_engine.process_pdf(str(pdf_path))
-            total_chunks += chunks
-            
-            progress_bar.progress((i + 1) / len(uploaded_files))
-        
+            pdf_paths.append(str(pdf_path))
         except Exception as e:
             st.error(f"Lỗi xử lý {uploaded_file.name}: {str(e)}")
     
-    progress_bar.empty()
-    status_text.empty()
-    
-    if total_chunks > 0:
-        st.success(f"✅ Đã xử lý {len(uploaded_files)} tài liệu, tạo {total_chunks} chunks!")
-    else:
-        st.info("Các tài liệu đã được xử lý trước đó.")
+    job_ids = st.session_state.ingest_queue.enqueue(pdf_paths)
+    st.session_state.ingest_job_ids = list(dict.fromkeys(st.session_state.ingest_job_ids + job_ids))
+
+
+def delete_document(pdf_name: str):
+    """Remove the uploaded file and queue the removal of its chunks."""
+    pdf_path = config.PDF_UPLOAD_DIR / upload_filename(pdf_name)
+    try:
+        if pdf_path.exists():
+            pdf_path.unlink()
+    except Exception as e:
+        st.error(f"Lỗi xóa {pdf_name}: {str(e)}")
+        return
+    job_ids = st.session_state.ingest_queue.enqueue([str(pdf_path)], action='delete')
+    st.session_state.ingest_job_ids = list(dict.fromkeys(st.session_state.ingest_job_ids + job_ids))
+
+
+def show_ingest_jobs():
+    """Per-file status of this session's uploads."""
+    jobs = st.session_state.ingest_queue.jobs(st.session_state.ingest_job_ids)
+    if not jobs:
+        return
+    finished = sum(1 for job in jobs if job['status'] not in ('queued', 'running'))
+    st.progress(finished / len(jobs), text=f"Đã xử lý {finished}/{len(jobs)} tài liệu")
+    for job in jobs:
+        line = f"{JOB_STATUS_LABELS.get(job['status'], job['status'])} · {job['source']}"
+        if job['action'] == 'delete':
+            line += " · xóa"
+        if job['status'] == 'done':
+            line += f" ({job['chunks']} chunks)"
+        if job['attempts'] > 1:
+            line += f" · lần thử {job['attempts']}"
+        if job['error'] and job['status'] in ('failed', 'queued'):
+            line += f" · {job['error']}"
+        st.caption(line)
+    if finished < len(jobs):
+        if st.button("🔄 Cập nhật trạng thái", use_container_width=True):
+            st.rerun()
+    elif st.button("Ẩn trạng thái", use_container_width=True):
+        st.session_state.ingest_job_ids = []
+        st.rerun()
 
 
 def process_query(query: str, top_k: int):
+    # One trace covers the search and the answer, so its stages show where the time went.
+    with metrics.use_trace(metrics.Trace()):
+        _process_query(query, top_k)
+
+
+def _process_query(query: str, top_k: int):
     try:
         with st.spinner("🔍 Đang tìm kiếm tài liệu liên quan..."):
             results = st.session_state.rag_engine.search(
@@ -107,15 +155,41 @@ def process_query(query: str, top_k: int):
             st.warning("Không tìm thấy tài liệu liên quan.")
             return
         docs = [doc for doc, score in results]
-        with st.spinner("🤖 Đang tạo câu trả lời..."):
-            response = st.session_state.llm_handler.generate_answer(
-                query=query,
-                context_docs=docs,
-                chat_history=st.session_state.chat_history
-            )
+        engine = st.session_state.rag_engine
+        # The answer cache is keyed by the query embedding; skip it rather than wait for the model.
+        query_embedding = engine.embed_query(query) if engine.embeddings_ready else None
         st.markdown('<div class="answer-box">', unsafe_allow_html=True)
         st.markdown("### 🤖 Câu trả lời")
-        st.markdown(response['answer'])
+        placeholder = st.empty()
+        streamed = ""
+        response = {}
+        for event in st.session_state.llm_handler.stream_answer(
+            query=query,
+            context_docs=docs,
+            chat_history=st.session_state.chat_history,
+            query_embedding=query_embedding
+        ):
+            if event['type'] == 'token':
+                streamed += event['text']
+                placeholder.markdown(streamed + "▌")
+            else:
+                response = event
+        placeholder.markdown(response['answer'])
+        if response.get('cached'):
+            st.caption("⚡ Câu trả lời từ bộ nhớ đệm")
+        timings = response.get('timings', {})
+        if timings:
+            st.caption(
+                f"⏱️ Token đầu tiên: {timings['time_to_first_token']:.2f}s · "
+                f"Tổng: {timings['total']:.2f}s"
+            )
+        prompt_tokens = response.get('prompt_tokens')
+        if prompt_tokens:
+            st.caption(f"🧮 Prompt: {prompt_tokens['before']} → {prompt_tokens['after']} token (ước tính)")
+        if response.get('stages'):
+            with st.expander(f"🔬 Chi tiết thời gian (trace {response['trace_id']})"):
+                for stage in response['stages']:
+                    st.caption(f"{stage['stage']}: {stage['duration_ms']:.1f} ms (bắt đầu +{stage['start_ms']:.0f} ms)")
         st.markdown('</div>', unsafe_allow_html=True)
         st.markdown("### 📚 Nguồn tham khảo")
         for i, source in enumerate(response['sources'], 1):
@@ -135,6 +209,24 @@ def process_query(query: str, top_k: int):
         st.error(f"Lỗi xử lý câu hỏi: {str(e)}")
 
 
+def show_startup_status():
+    """Show which startup stages are still running until the system is warm."""
+    status = startup.STATUS.snapshot()
+    if status['warm']:
+        return
+    labels = {
+        'embeddings.load': "mô hình embedding",
+        'embeddings.warmup': "khởi động embedding",
+        'llm.warmup': "nạp mô hình ngôn ngữ",
+    }
+    pending = [labels.get(name, name) for name, entry in status['stages'].items() if entry['state'] in (startup.PENDING, startup.RUNNING)]
+    failed = [f"{labels.get(name, name)}: {entry['error']}" for name, entry in status['stages'].items() if entry['state'] == startup.FAILED]
+    if pending:
+        st.info(f"⏳ Đang chuẩn bị: {', '.join(pending)}. Câu hỏi đầu tiên có thể chậm hơn.")
+    for failure in failed:
+        st.warning(f"⚠️ Lỗi khởi động {failure}")
+
+
 def main():
     st.markdown('<h1 class="main-header">📚 Hệ thống RAG - Hỏi đáp Tài liệu PDF</h1>', unsafe_allow_html=True)
     with st.sidebar:
@@ -144,6 +236,9 @@ def main():
             
             st.metric("📄 Tổng số tài liệu", stats['total_documents'])
             st.metric("📦 Tổng số chunks", stats['total_chunks'])           
+            cache_stats = st.session_state.rag_engine.cache_stats()['search_results']
+            st.caption(f"⚡ Cache tìm kiếm: {cache_stats['hit_rate']:.0%} ({cache_stats['hits']} lượt)")
+            show_startup_status()
             st.divider()
             top_k = st.slider(
                 "Số lượng kết quả",
@@ -154,6 +249,11 @@ def main():
             )
             
             st.divider()
+            if stats['document_names']:
+                doc_to_delete = st.selectbox("Tài liệu", sorted(stats['document_names']))
+                if st.button("🗑️ Xóa tài liệu này", use_container_width=True):
+                    delete_document(doc_to_delete)
+                    st.rerun()
             if st.button("🗑️ Xóa toàn bộ dữ liệu", use_container_width=True, type="secondary"):
                 if st.session_state.rag_engine:
                     st.session_state.rag_engine.clear_all()
@@ -176,7 +276,7 @@ def main():
     if uploaded_files:
         if st.button("🔄 Xử lý tài liệu", use_container_width=True, type="primary"):
             upload_pdfs(uploaded_files)
-            st.rerun()
+    show_ingest_jobs()
     
     st.divider()
     st.header("💬 Đặt câu hỏi")
@@ -0,0 +1,643 @@
+"""
+Offline retrieval and end-to-end benchmark.
+
+    python benchmark.py --docs 50 --pages 8 --json results/bench.json
+    python benchmark.py --docs 50 --compare results/bench.json
+    python benchmark.py --chunk-store 100000    # chunk payload memory only
+
+Generates a synthetic Vietnamese agricultural corpus as PDFs, ingests it through
+RAGEngine.process_pdf into a throwaway data directory and measures ingest
+throughput, per-leg and hybrid search latency (p50/p95/p99), recall@k of the
+vector store against exact brute-force search, answer latency against a stub
+Ollama server, and memory use. Nothing touches data/ or needs a network:
+local Qdrant (or the NumPy store) and, by default, hashing embeddings stand in
+for the real services. Use --embeddings model to measure the real embedding
+model when it is available locally.
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import config
+import metrics
+import startup
+from synthetic_corpus import synthetic_page
+
+ANSWER_WORDS = "Theo tài liệu , cần bón phân cân đối và theo dõi sâu bệnh thường xuyên trên đồng ruộng .".split()
+
+
+def write_pdf(path: Path, pages: List[str]):
+    """
+    Minimal PDF writer for Unicode text. Glyph codes are the UTF-16 code units and the
+    ToUnicode map is the identity, so text extraction returns the original Vietnamese.
+    """
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    ranges = " ".join(f"<{high:02X}00> <{high:02X}FF> <{high:02X}00>" for high in range(256))
+    cmap = (
+        "/CIDInit /ProcSet findresource begin 12 dict begin begincmap /CMapName /Identity-UTF16 def "
+        "/CMapType 2 def 1 begincodespacerange <0000> <FFFF> endcodespacerange "
+        f"256 beginbfrange {ranges} endbfrange endcmap CMapName currentdict /CMap defineresource pop end end"
+    ).encode()
+    to_unicode = add(b"<< /Length %d >>\nstream\n" % len(cmap) + cmap + b"\nendstream")
+    cid_font = add(
+        b"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /Arial /CIDToGIDMap /Identity "
+        b"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> >>"
+    )
+    font = add(
+        b"<< /Type /Font /Subtype /Type0 /BaseFont /Arial /Encoding /Identity-H "
+        b"/DescendantFonts [%d 0 R] /ToUnicode %d 0 R >>" % (cid_font, to_unicode)
+    )
+    pages_id = len(objects) + 2 * len(pages) + 1
+    kids = []
+    for text in pages:
+        lines = textwrap.wrap(text, 90)
+        ops = b"BT /F1 10 Tf 40 800 Td 12 TL " + b" ".join(
+            b"<" + line.encode("utf-16-be").hex().encode() + b"> '" for line in lines
+        ) + b" ET"
+        content = add(b"<< /Length %d >>\nstream\n" % len(ops) + ops + b"\nendstream")
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, content, font)
+        ))
+    add(b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % kid for kid in kids) + b"] /Count %d >>" % len(kids))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    Path(path).write_bytes(bytes(out))
+
+
+def generate_corpus(directory: Path, docs: int, pages: int, sentences: int, seed: int) -> List[Path]:
+    rng = random.Random(seed)
+    paths = []
+    for i in range(docs):
+        path = directory / f"tai_lieu_nong_nghiep_{i:04d}.pdf"
+        write_pdf(path, [synthetic_page(rng, sentences) for _ in range(pages)])
+        paths.append(path)
+    return paths
+
+
+def synthetic_payloads(count: int, seed: int = 0) -> Iterator[Tuple[str, Dict]]:
+    """Chunk payloads as ingestion stores them: 1000-character chunks overlapping by 200, 40 per document."""
+    rng = random.Random(seed)
+    chunks_per_doc = 40
+    text = ""
+    for i in range(count):
+        if len(text) < 1000:
+            text += synthetic_page(rng, 20)
+        content, text = text[:1000], text[800:]
+        chunk_id = hashlib.md5(f"{i}:{content}".encode("utf-8")).hexdigest()
+        yield chunk_id, {
+            'page_content': content,
+            'metadata': {
+                'source': f"tai_lieu_{i // chunks_per_doc:05d}.pdf",
+                'page': (i % chunks_per_doc) // 4,
+                'chunk_index': i % chunks_per_doc,
+                'chunk_id': chunk_id,
+            },
+        }
+
+
+class HashingEmbeddings:
+    """
+    Deterministic bag-of-words embeddings (signed feature hashing of words and word
+    pairs). No model download, and similar texts still get similar vectors.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = text.lower().split()
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.md5(feature.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Answers /api/generate with a fixed streamed answer, like Ollama's NDJSON stream."""
+
+    tokens = 64
+    token_delay = 0.002
+
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"Ollama is running")
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for i in range(self.tokens):
+            time.sleep(self.token_delay)
+            chunk = {'model': body.get('model'), 'response': ANSWER_WORDS[i % len(ANSWER_WORDS)] + " ", 'done': False}
+            self.wfile.write(json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.wfile.flush()
+        self.wfile.write(json.dumps({'model': body.get('model'), 'response': "", 'done': True}).encode() + b"\n")
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_ollama(tokens: int, token_ms: float) -> ThreadingHTTPServer:
+    StubOllamaHandler.tokens = tokens
+    StubOllamaHandler.token_delay = token_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def latency_summary(samples_ms: List[float]) -> Dict[str, float]:
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    if not len(samples):
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'mean_ms': float(samples.mean()),
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        'max_ms': float(samples.max()),
+    }
+
+
+def memory_snapshot() -> Dict[str, float]:
+    """Current and peak resident set size of this process in MB."""
+    current = None
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    current = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak = peak / 2**20 if sys.platform == "darwin" else peak / 1024
+    return {'rss_mb': current, 'peak_rss_mb': peak}
+
+
+def directory_size_mb(path: Path) -> float:
+    if not path.exists():
+        return 0.0
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) / 2**20
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=config.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+@contextlib.contextmanager
+def quiet(enabled: bool = True):
+    """Silence stray stdout output (e.g. model loading) while timing; the engine itself logs."""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def use_work_dir(work_dir: Path, args):
+    """Point every data path at the benchmark directory and switch to the offline stand-ins."""
+    config.DATA_DIR = work_dir
+    config.PDF_UPLOAD_DIR = work_dir / "uploaded_pdfs"
+    config.KEYWORD_INDEX_DIR = work_dir / "keyword_index"
+    config.VECTOR_STORE_DIR = work_dir / "vector_store"
+    config.QDRANT_PATH = work_dir / "qdrant_db"
+    config.INGEST_MANIFEST_PATH = work_dir / "ingest_manifest.json"
+    config.INGEST_QUEUE_PATH = work_dir / "ingest_queue.db"
+    config.EMBEDDING_CACHE_DIR = work_dir / "embedding_cache"
+    config.ANSWER_CACHE_PATH = work_dir / "answer_cache.jsonl"
+    for path in (config.PDF_UPLOAD_DIR, config.KEYWORD_INDEX_DIR, config.VECTOR_STORE_DIR):
+        path.mkdir(parents=True, exist_ok=True)
+    config.VECTOR_STORE_TYPE = args.store
+    config.INGEST_WORKER_MODE = "thread"
+    # Measure the work itself, not cache hits.
+    config.EMBEDDING_CACHE_ENABLED = False
+    config.ANSWER_CACHE_ENABLED = False
+    config.QUERY_EMBEDDING_CACHE_SIZE = 0
+    config.SEARCH_CACHE_SIZE = 0
+
+
+def create_engine(args):
+    from rag_engine import RAGEngine
+
+    class OfflineEngine(RAGEngine):
+        def _create_embeddings(self):
+            return HashingEmbeddings(config.EMBEDDING_DIMENSION)
+
+    return OfflineEngine() if args.embeddings == "hashing" else RAGEngine()
+
+
+def bench_ingest(engine, paths: List[Path], pages: int, verbose: bool) -> Dict[str, any]:
+    per_file = []
+    chunks = 0
+    started = time.perf_counter()
+    for path in paths:
+        target = config.PDF_UPLOAD_DIR / path.name
+        shutil.copy(path, target)
+        file_started = time.perf_counter()
+        with quiet(not verbose):
+            chunks += engine.process_pdf(str(target))
+        per_file.append((time.perf_counter() - file_started) * 1000)
+    seconds = time.perf_counter() - started
+    return {
+        'files': len(paths),
+        'pages': len(paths) * pages,
+        'chunks': chunks,
+        'seconds': seconds,
+        'files_per_sec': len(paths) / seconds,
+        'pages_per_sec': len(paths) * pages / seconds,
+        'chunks_per_sec': chunks / seconds,
+        'per_file': latency_summary(per_file),
+    }
+
+
+def sample_queries(engine, count: int, seed: int) -> Tuple[List[Dict[str, str]], List[Tuple[str, Dict]]]:
+    """Short phrases cut from random stored chunks; the chunk they came from is the expected hit."""
+    rng = random.Random(seed)
+    chunks = [(chunk_id, payload) for batch in engine.vector_store.scroll(1000) for chunk_id, payload in batch]
+    queries = []
+    for chunk_id, payload in rng.sample(chunks, min(count, len(chunks))):
+        words = payload['page_content'].split()
+        length = min(len(words), rng.randint(8, 16))
+        start = rng.randint(0, len(words) - length)
+        queries.append({'query': " ".join(words[start:start + length]), 'chunk_id': chunk_id})
+    return queries, chunks
+
+
+def bench_search(engine, queries: List[Dict[str, str]], k: int, verbose: bool) -> Dict[str, any]:
+    legs = {
+        'semantic': engine._semantic_search,
+        'keyword': engine._keyword_search,
+        'hybrid': engine._hybrid_search,
+        'search': lambda query, k: engine.search(query, "hybrid", k),
+    }
+    results = {}
+    for name, run in legs.items():
+        latencies = []
+        hits = 0
+        with quiet(not verbose):
+            for item in queries:
+                started = time.perf_counter()
+                found = run(item['query'], k)
+                latencies.append((time.perf_counter() - started) * 1000)
+                hits += any(doc.metadata.get('chunk_id') == item['chunk_id'] for doc, _ in found)
+        results[name] = dict(latency_summary(latencies), hit_rate=hits / len(queries) if queries else 0.0)
+
+    with quiet(not verbose):
+        started = time.perf_counter()
+        engine.search_many([item['query'] for item in queries], "hybrid", k)
+        batch_seconds = time.perf_counter() - started
+    results['search_many'] = {
+        'queries': len(queries),
+        'seconds': batch_seconds,
+        'queries_per_sec': len(queries) / batch_seconds if batch_seconds else 0.0,
+    }
+    return results
+
+
+def bench_recall(engine, queries: List[Dict[str, str]], chunks, k: int, verbose: bool) -> Dict[str, any]:
+    """Vector store top-k against exact cosine search over every stored chunk."""
+    ids = [chunk_id for chunk_id, _ in chunks]
+    started = time.perf_counter()
+    matrix = np.asarray(engine.embeddings.embed_documents([payload['page_content'] for _, payload in chunks]), dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    recalls = []
+    with quiet(not verbose):
+        for item in queries:
+            query = np.asarray(engine.embed_query(item['query']), dtype=np.float32)
+            exact = np.argsort(-(matrix @ query), kind="stable")[:k]
+            truth = {ids[row] for row in exact}
+            found = {doc.metadata.get('chunk_id') for doc, _ in engine._semantic_search(item['query'], k)}
+            recalls.append(len(found & truth) / len(truth) if truth else 1.0)
+    return {
+        'k': k,
+        'recall': float(np.mean(recalls)) if recalls else 0.0,
+        'min_recall': float(np.min(recalls)) if recalls else 0.0,
+        'exact_index_seconds': time.perf_counter() - started,
+    }
+
+
+def bench_answers(engine, queries: List[Dict[str, str]], k: int, count: int, verbose: bool) -> Dict[str, any]:
+    from llm_handler import LLMHandler
+
+    with quiet(not verbose):
+        llm = LLMHandler()
+        startup.STATUS.wait(warm=True)
+    first_token = []
+    totals = []
+    prompt_tokens = []
+    stages = {}
+    for item in queries[:count]:
+        with quiet(not verbose), metrics.use_trace(metrics.Trace()):
+            docs = [doc for doc, _ in engine.search(item['query'], "hybrid", k)]
+            started = time.perf_counter()
+            final = {}
+            for event in llm.stream_answer(item['query'], docs):
+                if event['type'] == 'final':
+                    final = event
+        totals.append((time.perf_counter() - started) * 1000)
+        if final.get('timings', {}).get('time_to_first_token') is not None:
+            first_token.append(final['timings']['time_to_first_token'] * 1000)
+        if final.get('prompt_tokens'):
+            prompt_tokens.append(final['prompt_tokens']['after'])
+        for stage in final.get('stages', []):
+            stages.setdefault(stage['stage'], []).append(stage['duration_ms'])
+    return {
+        'answers': len(totals),
+        'time_to_first_token': latency_summary(first_token),
+        'total': latency_summary(totals),
+        'mean_prompt_tokens': float(np.mean(prompt_tokens)) if prompt_tokens else None,
+        'stages': {stage: latency_summary(durations) for stage, durations in sorted(stages.items())},
+    }
+
+
+def measure_heap(build):
+    """Run build() under tracemalloc; returns its result, the heap it left allocated and the seconds it took."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - started
+    heap = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, heap, seconds
+
+
+def bench_chunk_store(chunks: int, k: int, lookups: int):
+    """Chunk payload memory and top-k Document build time: per-chunk dicts against the columnar store."""
+    from langchain_core.documents import Document
+
+    from chunk_store import ChunkStore
+
+    # Payloads as they arrive from a JSON log, like the NumPy store used to keep them.
+    records = [json.dumps({'id': chunk_id, 'payload': payload}, ensure_ascii=False)
+               for chunk_id, payload in synthetic_payloads(chunks)]
+    ids = [json.loads(record)['id'] for record in records]
+    text_bytes = sum(len(json.loads(record)['payload']['page_content'].encode("utf-8")) for record in records)
+
+    def build_dicts():
+        payloads = {}
+        for record in records:
+            decoded = json.loads(record)
+            payloads[decoded['id']] = decoded['payload']
+        return payloads
+
+    def build_store():
+        store = ChunkStore()
+        store.ensure_rows(len(records))
+        for row, record in enumerate(records):
+            decoded = json.loads(record)
+            store.set(row, decoded['id'], decoded['payload'])
+        return store
+
+    payloads, dict_heap, dict_seconds = measure_heap(build_dicts)
+    store, store_heap, store_seconds = measure_heap(build_store)
+    path = Path(tempfile.gettempdir()) / f"chunk_store_bench_{os.getpid()}.bin"
+    try:
+        store.save(path)
+        (mapped, _), mapped_heap, mapped_seconds = measure_heap(lambda: ChunkStore.load(path))
+        file_size = path.stat().st_size
+
+        rng = np.random.default_rng(0)
+        picks = rng.integers(0, len(ids), size=(lookups, k))
+        started = time.perf_counter()
+        for rows in picks:
+            [Document(page_content=payloads[ids[row]]['page_content'], metadata=payloads[ids[row]]['metadata']) for row in rows]
+        dict_lookup = (time.perf_counter() - started) / lookups
+        timings = {}
+        for name, candidate in (("store", store), ("mapped", mapped)):
+            started = time.perf_counter()
+            for rows in picks:
+                [candidate.document(int(row), ids[row]) for row in rows]
+            timings[name] = (time.perf_counter() - started) / lookups
+
+        mb = 1024 ** 2
+        print(f"{chunks} chunks, {text_bytes / mb:.1f} MB of UTF-8 text\n")
+        print(f"{'layout':<22} {'heap MB':>9} {'bytes/chunk':>12} {'load s':>8} {'top-{k} ms':>10}".replace("{k}", str(k)))
+        for name, heap, seconds, lookup in (
+            ("payload dicts", dict_heap, dict_seconds, dict_lookup),
+            ("columnar (memory)", store_heap, store_seconds, timings['store']),
+            ("columnar (mapped)", mapped_heap, mapped_seconds, timings['mapped']),
+        ):
+            print(f"{name:<22} {heap / mb:9.1f} {heap / chunks:12.0f} {seconds:8.2f} {lookup * 1000:10.3f}")
+        print(f"\nSnapshot file: {file_size / mb:.1f} MB (paged in on demand, shared between processes)")
+        mapped.close()
+    finally:
+        path.unlink(missing_ok=True)
+
+
+
+def flatten(data: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+
+def compare(result: Dict, baseline_path: str):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (revision {baseline.get('environment', {}).get('revision')}):")
+    changed = {
+        key: (value, result['settings'].get(key))
+        for key, value in baseline.get('settings', {}).items() if result['settings'].get(key) != value
+    }
+    if changed:
+        print("  Settings differ: " + ", ".join(f"{key} {old} -> {new}" for key, (old, new) in changed.items()))
+    old, new = flatten(baseline['results']), flatten(result['results'])
+    for name in sorted(set(old) & set(new)):
+        if not name.endswith(("_ms", "per_sec", "recall", "hit_rate", "rss_mb", "_mb")) or not old[name]:
+            continue
+        change = (new[name] - old[name]) / old[name] * 100
+        print(f"  {name:<45} {old[name]:>10.2f} -> {new[name]:>10.2f} ({change:+.1f}%)")
+
+
+def print_summary(result: Dict):
+    results = result['results']
+    ingest = results['ingest']
+    print(
+        f"\nIngest: {ingest['files']} files, {ingest['pages']} pages, {ingest['chunks']} chunks in {ingest['seconds']:.1f}s "
+        f"({ingest['pages_per_sec']:.1f} pages/s, {ingest['chunks_per_sec']:.1f} chunks/s)"
+    )
+    print(f"\n{'leg':<10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'hit@k':>7}")
+    for name in ('semantic', 'keyword', 'hybrid', 'search'):
+        leg = results['search'][name]
+        print(f"{name:<10} {leg['p50_ms']:>8.2f} {leg['p95_ms']:>8.2f} {leg['p99_ms']:>8.2f} {leg['hit_rate']:>7.2f}")
+    print(f"search_many: {results['search']['search_many']['queries_per_sec']:.1f} queries/s")
+    print(f"Vector recall@{results['recall']['k']} vs exact: {results['recall']['recall']:.3f}")
+    answers = results.get('answers')
+    if answers and answers['answers']:
+        print(
+            f"Answers: first token p50 {answers['time_to_first_token'].get('p50_ms', 0):.1f} ms, "
+            f"total p50 {answers['total']['p50_ms']:.1f} ms"
+        )
+    memory = results['memory']
+    print(
+        f"Memory: peak RSS {memory['after_search']['peak_rss_mb']:.0f} MB, "
+        f"store on disk {memory['disk']['vector_store_mb']:.1f} MB, keyword index {memory['disk']['keyword_index_mb']:.1f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval and end-to-end benchmark.")
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--sentences", type=int, default=30, help="sentences per page")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--answers", type=int, default=20, help="end-to-end answers against the stub LLM (0 to skip)")
+    parser.add_argument("--k", type=int, default=config.TOP_K_RESULTS)
+    parser.add_argument("--store", default="qdrant_local", choices=["qdrant_local", "numpy"])
+    parser.add_argument("--embeddings", default="hashing", choices=["hashing", "model"])
+    parser.add_argument("--llm-tokens", type=int, default=64)
+    parser.add_argument("--llm-token-ms", type=float, default=2.0, help="stub LLM delay per token")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="keep the corpus and stores here instead of a temporary directory")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="print changes against an earlier --json result")
+    parser.add_argument("--verbose", action="store_true", help="show the engine's own output")
+    parser.add_argument(
+        "--chunk-store", type=int, metavar="CHUNKS",
+        help="only compare chunk payload memory, per-chunk dicts against the columnar store, for this many chunks"
+    )
+    parser.add_argument("--lookups", type=int, default=2000, help="top-k Document builds timed by --chunk-store")
+    args = parser.parse_args()
+    if args.chunk_store:
+        bench_chunk_store(args.chunk_store, args.k, args.lookups)
+        return
+    metrics.setup_logging("INFO" if args.verbose else "WARNING")
+
+    work_dir = Path(args.work_dir) if args.work_dir else Path(tempfile.mkdtemp(prefix="rag_bench_"))
+    if args.work_dir and work_dir.exists() and any(work_dir.iterdir()):
+        raise SystemExit(f"{work_dir} is not empty.")
+    work_dir.mkdir(parents=True, exist_ok=True)
+    use_work_dir(work_dir, args)
+    server = start_stub_ollama(args.llm_tokens, args.llm_token_ms)
+    config.OLLAMA_BASE_URL = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        print(f"Generating {args.docs} PDFs x {args.pages} pages in {work_dir} ...")
+        corpus_dir = work_dir / "corpus"
+        corpus_dir.mkdir()
+        paths = generate_corpus(corpus_dir, args.docs, args.pages, args.sentences, args.seed)
+
+        memory = {'start': memory_snapshot()}
+        print(f"Starting engine ({args.store}, {args.embeddings} embeddings) ...")
+        started = time.perf_counter()
+        with quiet(not args.verbose):
+            engine = create_engine(args)
+            # The constructor returns before the model has loaded; time until it can embed.
+            startup.STATUS.wait(warm=True)
+        startup_seconds = time.perf_counter() - started
+        memory['after_startup'] = memory_snapshot()
+
+        print("Ingesting ...")
+        ingest = bench_ingest(engine, paths, args.pages, args.verbose)
+        with quiet(not args.verbose):
+            engine.persist_keyword_index()
+        memory['after_ingest'] = memory_snapshot()
+
+        print(f"Searching {args.queries} queries ...")
+        queries, chunks = sample_queries(engine, args.queries, args.seed)
+        search = bench_search(engine, queries, args.k, args.verbose)
+        recall = bench_recall(engine, queries, chunks, args.k, args.verbose)
+        memory['after_search'] = memory_snapshot()
+        memory['disk'] = {
+            'corpus_mb': directory_size_mb(corpus_dir),
+            'vector_store_mb': directory_size_mb(config.QDRANT_PATH if args.store == "qdrant_local" else config.VECTOR_STORE_DIR),
+            'keyword_index_mb': directory_size_mb(config.KEYWORD_INDEX_DIR),
+        }
+
+        answers = None
+        if args.answers:
+            print(f"Answering {args.answers} queries against the stub LLM ...")
+            answers = bench_answers(engine, queries, args.k, args.answers, args.verbose)
+
+        result = {
+            'environment': {
+                'revision': git_revision(),
+                'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+            },
+            'settings': {
+                key: value for key, value in vars(args).items() if key not in ('json', 'compare', 'work_dir', 'verbose')
+            },
+            'results': {
+                'startup_seconds': startup_seconds,
+                'startup_stages': {entry['stage']: entry['seconds'] for entry in startup.STATUS.profile() if 'seconds' in entry},
+                'ingest': ingest,
+                'search': search,
+                'recall': recall,
+                'answers': answers,
+                'memory': memory,
+            },
+        }
+    finally:
+        server.shutdown()
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_summary(result)
+    if args.compare:
+        compare(result, args.compare)
+    if args.json:
+        Path(args.json).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
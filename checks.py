@@ -0,0 +1,638 @@
+"""
+Offline consistency checks.
+
+    python checks.py                  # run every check
+    python checks.py numpy_reopen     # run the named checks
+
+Each check builds what it needs in a temporary directory (synthetic corpus,
+hashing embeddings from benchmark.py), so nothing touches data/ or needs a
+network. A failed check prints why; the exit status is the number of failures.
+"""
+import argparse
+import hashlib
+import sys
+import tempfile
+import traceback
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+import config
+import metrics
+
+CHECKS = {}
+# benchmark.use_work_dir turns the in-memory caches off; checks of cache invalidation need them.
+CACHE_SIZES = {name: getattr(config, name) for name in ("QUERY_EMBEDDING_CACHE_SIZE", "SEARCH_CACHE_SIZE")}
+
+
+class SkipCheck(Exception):
+    """Raised by a check that cannot run here, e.g. for want of an optional package."""
+
+
+def check(function):
+    CHECKS[function.__name__.removeprefix("check_")] = function
+    return function
+
+
+def _engine(directory: Path, store: str = "numpy", caches: bool = False):
+    """
+    A RAGEngine on a fresh data directory with hashing embeddings, ready to embed.
+    With caches set, the query-embedding and search-result caches keep their configured sizes.
+    """
+    import benchmark
+    import startup
+
+    with benchmark.quiet():
+        benchmark.use_work_dir(directory, argparse.Namespace(store=store))
+        if caches:
+            for name, size in CACHE_SIZES.items():
+                setattr(config, name, size)
+        engine = benchmark.create_engine(argparse.Namespace(embeddings="hashing"))
+        startup.STATUS.wait(warm=True)
+    return engine
+
+
+def _write_pdfs(directory: Path, documents: Dict[str, List[str]]) -> Dict[str, str]:
+    from benchmark import write_pdf
+
+    paths = {}
+    for name, pages in documents.items():
+        paths[name] = str(directory / name)
+        write_pdf(Path(paths[name]), pages)
+    return paths
+
+
+@check
+def check_hybrid_while_loading(directory: Path):
+    """Concurrent hybrid searches return keyword results at once while the model is still loading."""
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    import benchmark
+    import random
+
+    engine = _engine(directory)
+    rng = random.Random(3)
+    paths = _write_pdfs(config.PDF_UPLOAD_DIR, {"a.pdf": [benchmark.synthetic_page(rng, 12) for _ in range(4)]})
+    with benchmark.quiet():
+        engine.process_pdf(paths["a.pdf"])
+        engine.persist_keyword_index()
+
+    loaded = threading.Event()
+
+    class SlowEngine(type(engine)):
+        def _create_embeddings(self):
+            loaded.wait(60)
+            return super()._create_embeddings()
+
+    with benchmark.quiet():
+        slow = SlowEngine()
+    try:
+        assert not slow.embeddings_ready
+        queries = [f"phòng trừ sâu bệnh trên cây lúa {i}" for i in range(4 * config.SEARCH_WORKERS)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(len(queries)) as pool:
+            results = list(pool.map(lambda query: slow.search(query, "hybrid", 3), queries))
+        seconds = time.perf_counter() - started
+        assert all(results), "keyword results missing while the model loads"
+        assert seconds < config.KEYWORD_SEARCH_TIMEOUT, f"searches took {seconds:.1f}s while the model loads"
+    finally:
+        loaded.set()
+    assert slow.embeddings is not None and slow._semantic_search(queries[0], 3), "semantic search after the load"
+
+
+@check
+def check_numpy_reopen(directory: Path):
+    """A reopened NumPy store maps its chunk snapshot and still finds every vector."""
+    from vector_backends import NumpyBackend
+
+    snapshot_records = config.VECTOR_STORE_SNAPSHOT_RECORDS
+    config.VECTOR_STORE_SNAPSHOT_RECORDS = 100
+    try:
+        rng = np.random.default_rng(0)
+        ids = [hashlib.md5(str(i).encode()).hexdigest() for i in range(300)]
+        vectors = rng.normal(size=(len(ids), 16))
+        payloads = [{'page_content': f"đoạn {i}", 'metadata': {'source': f"tai_lieu_{i % 3}.pdf", 'page': i}} for i in range(len(ids))]
+        store = NumpyBackend(directory, 16)
+        store.upsert(ids, vectors, payloads)
+        expected = store.search_ids(vectors[7], 5)
+        assert store.chunks_path.exists(), "no chunk snapshot was written"
+
+        # The payload log has nothing past the snapshot, so only the snapshot is mapped.
+        reopened = NumpyBackend(directory, 16)
+        assert reopened.count() == len(ids), f"reopened count {reopened.count()} != {len(ids)}"
+        found = reopened.search_ids(vectors[7], 5)
+        assert [chunk_id for chunk_id, _ in found] == [chunk_id for chunk_id, _ in expected], f"{found} != {expected}"
+        document = reopened.search(vectors[7], 1)[0][0]
+        assert document.page_content == "đoạn 7", document
+        reopened.chunks.close()
+        store.chunks.close()
+    finally:
+        config.VECTOR_STORE_SNAPSHOT_RECORDS = snapshot_records
+
+
+@check
+def check_stale_jobs(directory: Path):
+    """A job whose worker keeps dying is requeued until INGEST_MAX_ATTEMPTS, then fails."""
+    from ingest_queue import IngestQueue
+
+    queue = IngestQueue(directory / "queue.db")
+    job_id = queue.enqueue([str(directory / "crash.pdf")])[0]
+    for attempt in range(1, config.INGEST_MAX_ATTEMPTS + 1):
+        claimed = queue.claim("dead-worker")
+        assert [job['id'] for job in claimed] == [job_id], f"attempt {attempt}: claimed {claimed}"
+        queue.requeue_stale(timeout=-1)
+        expected = 'queued' if attempt < config.INGEST_MAX_ATTEMPTS else 'failed'
+        job = queue.get(job_id)
+        assert job['status'] == expected, f"attempt {attempt}: {job['status']} != {expected}"
+    assert job['error'] and not queue.claim("dead-worker"), job
+
+
+@check
+def check_upload_names(directory: Path):
+    """Client-supplied upload names cannot leave the upload directory."""
+    from utils import upload_filename
+
+    for name, expected in (("a.pdf", "a.pdf"), ("../../app.py.pdf", "app.py.pdf"), ("..\\..\\x.pdf", "x.pdf"), ("/etc/x.pdf", "x.pdf")):
+        assert upload_filename(name) == expected, f"{name!r} -> {upload_filename(name)!r}"
+    for name in ("", "..", "uploads/"):
+        try:
+            upload_filename(name)
+        except ValueError:
+            continue
+        raise AssertionError(f"{name!r} was accepted")
+
+
+@check
+def check_benchmark_work_dir(directory: Path):
+    """With benchmark.use_work_dir, queues and stores open under the work directory, not data/."""
+    import benchmark
+    from ingest_queue import IngestQueue
+
+    data_dir = config.DATA_DIR
+    benchmark.use_work_dir(directory, argparse.Namespace(store="numpy"))
+    assert IngestQueue().path == directory / "ingest_queue.db", IngestQueue().path
+    from vector_backends import create_vector_backend
+
+    store = create_vector_backend()
+    assert store.name == "numpy" and store.directory == directory / "vector_store", store.directory
+    assert not directory.resolve().is_relative_to(data_dir.resolve())
+
+
+def _random_corpus(rng, docs: int, vocabulary: int) -> List[str]:
+    """Short texts over a small vocabulary, so terms repeat, tie and get negative idf."""
+    words = [f"từ{i}" for i in range(vocabulary)]
+    return [" ".join(rng.choice(words, size=rng.integers(1, 30))) for _ in range(docs)]
+
+
+def _assert_same_ranking(found, expected_scores: Dict[str, float], k: int, context: str):
+    """found is a top-k list; expected_scores holds every matching chunk. Ties may come in any order."""
+    expected = sorted(expected_scores.items(), key=lambda item: -item[1])[:k]
+    assert len(found) == len(expected), f"{context}: {len(found)} results, expected {len(expected)}"
+    for (chunk_id, score), (_, expected_score) in zip(found, expected):
+        assert chunk_id in expected_scores, f"{context}: {chunk_id} does not match the query"
+        assert np.isclose(score, expected_scores[chunk_id], rtol=1e-9, atol=1e-12), f"{context}: {chunk_id} scored {score}, expected {expected_scores[chunk_id]}"
+        assert np.isclose(score, expected_score, rtol=1e-9, atol=1e-12), f"{context}: ranking differs at {chunk_id}"
+
+
+@check
+def check_bm25_parity(directory: Path):
+    """KeywordIndex and its mapped snapshot rank exactly like rank_bm25.BM25Okapi."""
+    # Part of requirements.txt: a missing reference fails the check rather than skipping it.
+    from rank_bm25 import BM25Okapi
+    from keyword_index import KeywordIndex, KeywordSnapshot, tokenize
+
+    rng = np.random.default_rng(0)
+    for corpus_number in range(200):
+        texts = _random_corpus(rng, int(rng.integers(1, 60)), int(rng.integers(2, 40)))
+        ids = [f"{i:032x}" for i in range(len(texts))]
+        okapi = BM25Okapi([tokenize(text) for text in texts])
+        index = KeywordIndex.build(ids, texts)
+        path = directory / f"bm25_{corpus_number}.bin"
+        index.save(path, 0)
+        snapshot = KeywordSnapshot.load(path)
+        queries = [" ".join(rng.choice([f"từ{i}" for i in range(45)], size=rng.integers(1, 6))) for _ in range(5)]
+        for query in queries:
+            tokens = set(tokenize(query))
+            scores = okapi.get_scores(tokenize(query))
+            expected = {ids[i]: float(scores[i]) for i, text in enumerate(texts) if tokens & set(tokenize(text))}
+            for k in (1, 5, len(texts)):
+                _assert_same_ranking(index.search(query, k), expected, k, f"corpus {corpus_number}, {query!r}, k={k}")
+                _assert_same_ranking(snapshot.search(query, k), expected, k, f"snapshot {corpus_number}, {query!r}, k={k}")
+        snapshot.close()
+
+
+@check
+def check_bm25_incremental(directory: Path):
+    """Adding, replacing and removing chunks gives the same results as rebuilding the index."""
+    from keyword_index import KeywordIndex
+
+    rng = np.random.default_rng(1)
+    for round_number in range(50):
+        texts = dict(zip((f"{i:032x}" for i in range(80)), _random_corpus(rng, 80, 30)))
+        index = KeywordIndex.build(list(texts)[:50], list(texts.values())[:50])
+        for step in range(60):
+            chunk_id = f"{int(rng.integers(0, 80)):032x}"
+            action = rng.integers(0, 3)
+            if action == 0:
+                index.remove(chunk_id)
+            else:
+                if action == 2:
+                    texts[chunk_id] = _random_corpus(rng, 1, 30)[0]
+                index.add(chunk_id, texts[chunk_id])
+        live = [chunk_id for chunk_id in texts if chunk_id in index]
+        rebuilt = KeywordIndex.build(live, [texts[chunk_id] for chunk_id in live])
+        assert len(index) == len(rebuilt)
+        for query_number in range(10):
+            query = " ".join(rng.choice([f"từ{i}" for i in range(35)], size=rng.integers(1, 5)))
+            expected = dict(rebuilt.search(query, len(live)))
+            for k in (1, 5, len(live)):
+                _assert_same_ranking(index.search(query, k), expected, k, f"round {round_number}, {query!r}, k={k}")
+
+
+@check
+def check_answer_cache_log(directory: Path):
+    """Stored answers append to the cache log, which compacts and survives a torn last line."""
+    from answer_cache import SemanticAnswerCache
+
+    path = directory / "answer_cache.jsonl"
+    rng = np.random.default_rng(0)
+    cache = SemanticAnswerCache(path, max_entries=10)
+    embeddings = rng.normal(size=(25, 8))
+    for i, embedding in enumerate(embeddings):
+        size = path.stat().st_size if path.exists() else 0
+        cache.put(embedding, f"context-{i}", f"answer {i}", 1.0)
+        lines = path.read_text(encoding="utf-8").count("\n")
+        assert lines <= 20, f"log not compacted: {lines} records"
+        assert lines == 10 or path.stat().st_size > size, "put did not append"
+    assert len(cache) == 10
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"embedding": "AAAA')
+    reloaded = SemanticAnswerCache(path, max_entries=10)
+    assert len(reloaded) == 10
+    for i in range(15, 25):
+        assert reloaded.lookup(embeddings[i], f"context-{i}")['answer'] == f"answer {i}"
+    assert path.read_text(encoding="utf-8").endswith("\n"), "torn record not dropped"
+
+
+@check
+def check_answer_cache_history(directory: Path):
+    """A cached answer is replayed only in a conversation with the same recent history."""
+    from langchain_core.documents import Document
+    from llm_handler import LLMHandler
+
+    settings = {name: getattr(config, name) for name in ("ANSWER_CACHE_ENABLED", "ANSWER_CACHE_PATH", "LLM_WARMUP")}
+    config.ANSWER_CACHE_ENABLED = True
+    config.ANSWER_CACHE_PATH = directory / "answer_cache.jsonl"
+    config.LLM_WARMUP = False
+    try:
+        handler = LLMHandler()
+    finally:
+        for name, value in settings.items():
+            setattr(config, name, value)
+
+    class CountingLLM:
+        calls = 0
+
+        def stream(self, prompt):
+            self.calls += 1
+            yield f"câu trả lời {self.calls}"
+
+    handler.llm = CountingLLM()
+    docs = [Document(page_content="Lúa cần bón phân đạm.", metadata={'source': "a.pdf", 'page': 0, 'chunk_id': "c1"})]
+    embedding = [1.0, 0.0, 0.0]
+    first = [{'role': 'user', 'content': "Cây lúa là gì?"}, {'role': 'assistant', 'content': "Một loại cây."}]
+    second = [{'role': 'user', 'content': "Cây ngô là gì?"}, {'role': 'assistant', 'content': "Một loại cây khác."}]
+    for history, cached in ((first, False), (first, True), (second, False), (None, False), ([], True)):
+        answer = handler.generate_answer("Bón phân gì?", docs, history, embedding)
+        assert answer['cached'] == cached, f"history {history}: cached={answer['cached']}"
+
+
+@check
+def check_backend_switch(directory: Path):
+    """Switching EMBEDDING_BACKEND re-ingests stored files with vectors from the new backend."""
+    import benchmark
+    import random
+
+    engine = _engine(directory)
+    rng = random.Random(4)
+    _write_pdfs(config.PDF_UPLOAD_DIR, {"a.pdf": [benchmark.synthetic_page(rng, 12) for _ in range(3)]})
+    with benchmark.quiet():
+        assert engine.scan_and_process_pdfs() == 1
+
+    class Negated(benchmark.HashingEmbeddings):
+        def _embed(self, text):
+            return [-value for value in super()._embed(text)]
+
+    class SwitchedEngine(type(engine)):
+        def _create_embeddings(self):
+            return Negated(config.EMBEDDING_DIMENSION)
+
+    backend = config.EMBEDDING_BACKEND
+    config.EMBEDDING_BACKEND = "onnx_int8"
+    try:
+        with benchmark.quiet():
+            switched = SwitchedEngine()
+            assert switched.scan_and_process_pdfs() == 1, "file not re-ingested after the backend switch"
+        chunks = [payload for batch in switched.vector_store.scroll(100) for _, payload in batch]
+        assert len(chunks) == switched.vector_store.count() == switched.manifest['files'][next(iter(switched.manifest['files']))]['chunks']
+        for payload in chunks:
+            (_, score), = switched.vector_store.search_ids(switched.embeddings.embed_query(payload['page_content']), 1)
+            assert score > 0.99, f"stored vector is from the old backend (cosine {score:.2f})"
+    finally:
+        config.EMBEDDING_BACKEND = backend
+
+
+@check
+def check_abandoned_leg(directory: Path):
+    """A keyword leg abandoned at its timeout keeps the index from being changed until it finishes."""
+    import threading
+    import time
+
+    import benchmark
+    import random
+
+    engine = _engine(directory)
+    rng = random.Random(8)
+    paths = _write_pdfs(config.PDF_UPLOAD_DIR, {"a.pdf": [benchmark.synthetic_page(rng, 12) for _ in range(2)]})
+    with benchmark.quiet():
+        engine.process_pdf(paths["a.pdf"])
+    search = engine.bm25_index.search
+    events = []
+
+    def slow_search(query, k):
+        time.sleep(0.5)
+        results = search(query, k)
+        events.append("leg finished")
+        return results
+
+    engine.bm25_index.search = slow_search
+    timeout = config.KEYWORD_SEARCH_TIMEOUT
+    config.KEYWORD_SEARCH_TIMEOUT = 0.05
+    try:
+        engine.search("bón phân cho lúa", "hybrid", 3)
+    finally:
+        config.KEYWORD_SEARCH_TIMEOUT = timeout
+    assert not events, "the search waited for the slow leg"
+
+    def change_index():
+        with engine._index_lock.write_locked():
+            events.append("index changed")
+
+    writer = threading.Thread(target=change_index)
+    writer.start()
+    writer.join(10)
+    assert events == ["leg finished", "index changed"], events
+
+
+@check
+def check_hybrid_retrieve_failure(directory: Path):
+    """A vector store that fails to return payloads degrades hybrid search instead of raising."""
+    import benchmark
+    import random
+
+    for store in ("numpy", "qdrant_local"):
+        engine = _engine(directory / store, store)
+        rng = random.Random(2)
+        paths = _write_pdfs(config.PDF_UPLOAD_DIR, {"a.pdf": [benchmark.synthetic_page(rng, 12) for _ in range(3)]})
+        with benchmark.quiet():
+            engine.process_pdf(paths["a.pdf"])
+
+        def fail(ids):
+            raise ConnectionError("vector store unavailable")
+
+        engine.vector_store.retrieve = fail
+        query = "phòng trừ sâu bệnh trên cây lúa"
+        status = {'complete': True}
+        results = engine._hybrid_search(query, 3, status)
+        assert not status['complete'], f"{store}: failed retrieve not reported"
+        if engine.vector_store.payloads_with_hits:
+            assert results, f"{store}: semantic results with payloads were dropped"
+        engine.search(query, "hybrid", 3)
+        engine.search_many([query, "bón phân"], "hybrid", 3)
+        if store == "qdrant_local":
+            engine.vector_store.client.close()
+
+
+@check
+def check_ingest_search_cache(directory: Path):
+    """A search that runs while a file is being indexed is not cached under the generation that includes it."""
+    import benchmark
+    import random
+
+    rng = random.Random(7)
+    query = "chanh dây đột biến " + " ".join(benchmark.synthetic_page(rng, 12).split()[:6])
+
+    engine = _engine(directory, caches=True)
+    add_to_bm25_index = engine._add_to_bm25_index
+
+    def searching_add(ids, chunks):
+        # Vectors are stored, the keyword index is not updated yet.
+        for search_type in ("keyword", "hybrid"):
+            engine.search(query, search_type, 3)
+        add_to_bm25_index(ids, chunks)
+
+    engine._add_to_bm25_index = searching_add
+    paths = _write_pdfs(config.PDF_UPLOAD_DIR, {
+        "a.pdf": [benchmark.synthetic_page(rng, 12) for _ in range(2)],
+        "b.pdf": ["chanh dây đột biến " * 20],
+    })
+    with benchmark.quiet():
+        engine.process_pdf(paths["a.pdf"])
+        engine.process_pdf(paths["b.pdf"])
+    for search_type in ("keyword", "hybrid"):
+        sources = [doc.metadata['source'] for doc, _ in engine.search(query, search_type, 3)]
+        assert sources and sources[0] == "b.pdf", f"{search_type}: stale cached results {sources}"
+
+
+@check
+def check_worker_snapshot_cache(directory: Path):
+    """Searches between an ingest worker's manifest and its keyword snapshot are not cached as current."""
+    import benchmark
+    import random
+
+    refresh_interval = config.INDEX_REFRESH_INTERVAL
+    config.INDEX_REFRESH_INTERVAL = 0
+    try:
+        rng = random.Random(6)
+        app = _engine(directory, caches=True)
+        worker = benchmark.create_engine(argparse.Namespace(embeddings="hashing"))
+        paths = _write_pdfs(config.PDF_UPLOAD_DIR, {
+            "a.pdf": [benchmark.synthetic_page(rng, 12) for _ in range(2)],
+            "b.pdf": ["chanh dây đột biến " * 20],
+        })
+        with benchmark.quiet():
+            worker.ingest_pdfs([paths["a.pdf"]])
+            worker.persist_keyword_index()
+        query = "chanh dây đột biến " + " ".join(benchmark.synthetic_page(rng, 12).split()[:6])
+        for search_type in ("keyword", "hybrid"):
+            assert app.search(query, search_type, 3), f"{search_type}: a.pdf not found"
+
+        # IngestWorker.run_once: the manifest of the new generation lands before the snapshot.
+        with benchmark.quiet():
+            worker.ingest_pdfs([paths["b.pdf"]])
+        for search_type in ("keyword", "hybrid"):
+            app.search(query, search_type, 3)
+        worker.persist_keyword_index()
+        for search_type in ("keyword", "hybrid"):
+            sources = [doc.metadata['source'] for doc, _ in app.search(query, search_type, 3)]
+            assert sources and sources[0] == "b.pdf", f"{search_type}: stale cached results {sources}"
+    finally:
+        config.INDEX_REFRESH_INTERVAL = refresh_interval
+
+
+def _assert_same_results(found, expected, context: str):
+    """Same chunks with the same scores. Tied chunks (batched and single matrix products differ
+    in the last bits) may come in either order, and a tie at the cut-off may pick either one."""
+    assert len(found) == len(expected), f"{context}: {len(found)} results, expected {len(expected)}"
+    scores = [score for _, score in expected]
+    assert np.allclose([score for _, score in found], scores, rtol=1e-5, atol=1e-6), context
+    start = 0
+    for end in range(1, len(expected) + 1):
+        if end < len(expected) and np.isclose(scores[end], scores[end - 1], rtol=1e-5, atol=1e-6):
+            continue
+        if end < len(expected):
+            group = lambda results: {doc.metadata['chunk_id'] for doc, _ in results[start:end]}
+            assert group(found) == group(expected), f"{context}: results {start}-{end} differ"
+        start = end
+
+
+@check
+def check_search_many(directory: Path):
+    """search_many(queries) returns what [search(q) for q in queries] does, for every search type."""
+    import benchmark
+    import random
+
+    for store in ("numpy", "qdrant_local"):
+        engine = _engine(directory / store, store)
+        rng = random.Random(5)
+        paths = _write_pdfs(config.PDF_UPLOAD_DIR, {
+            f"tai_lieu_{i}.pdf": [benchmark.synthetic_page(rng, 10) for _ in range(3)] for i in range(3)
+        })
+        with benchmark.quiet():
+            for path in paths.values():
+                engine.process_pdf(path)
+        queries, _ = benchmark.sample_queries(engine, 12, seed=5)
+        queries = [item['query'] for item in queries]
+        # Repeats, a paraphrase of one query by case, and a query without keyword hits.
+        queries += [queries[0], queries[1].upper(), "xyz không có trong tài liệu"]
+        for search_type in ("semantic", "keyword", "hybrid"):
+            batched = engine.search_many(queries, search_type, 4)
+            for query, found in zip(queries, batched):
+                single = engine.search(query, search_type, 4)
+                _assert_same_results(found, single, f"{store} {search_type} {query!r}")
+        # Without k both fall back to TOP_K_RESULTS, and without a type to hybrid.
+        for query, found in zip(queries, engine.search_many(queries)):
+            _assert_same_results(found, engine.search(query), f"{store} default k {query!r}")
+        if store == "qdrant_local":
+            engine.vector_store.client.close()
+
+
+@check
+def check_qdrant_collection_errors(directory: Path):
+    """Only a missing collection is created; other Qdrant errors surface instead of recreating it."""
+    try:
+        from qdrant_client.http.exceptions import UnexpectedResponse
+    except ImportError:
+        raise SkipCheck("qdrant-client is not installed")
+    from types import SimpleNamespace
+    from vector_backends import QdrantBackend
+
+    class Client:
+        def __init__(self, error):
+            self.error = error
+            self.created = False
+
+        def get_collection(self, name):
+            if self.error is not None and not self.created:
+                raise self.error
+            return SimpleNamespace(payload_schema={QdrantBackend.SOURCE_FIELD: "keyword"})
+
+        def create_collection(self, **settings):
+            self.created = True
+
+    def response(status):
+        return UnexpectedResponse(status, "", b"", {})
+
+    client = Client(response(404))
+    QdrantBackend(client, "docs", 8)
+    assert client.created, "missing collection was not created"
+
+    client = Client(response(500))
+    try:
+        QdrantBackend(client, "docs", 8)
+    except UnexpectedResponse:
+        pass
+    else:
+        raise AssertionError("a server error was taken for a missing collection")
+    assert not client.created, "collection recreated after a server error"
+
+    # pending_migration() cannot read this collection's config; that must not recreate it.
+    client = Client(None)
+    QdrantBackend(client, "docs", 8)
+    assert not client.created, "existing collection recreated"
+
+
+@check
+def check_shared_chunks(directory: Path):
+    """Deleting one of two PDFs that share a page keeps the other's copy of it everywhere."""
+    import benchmark
+    import random
+
+    rng = random.Random(1)
+    shared = benchmark.synthetic_page(rng, 12)
+    engine = _engine(directory)
+    paths = _write_pdfs(config.PDF_UPLOAD_DIR, {
+        "a.pdf": [shared, benchmark.synthetic_page(rng, 12)],
+        "b.pdf": [benchmark.synthetic_page(rng, 12), shared],
+    })
+    with benchmark.quiet():
+        a_chunks = engine.process_pdf(paths["a.pdf"])
+        b_chunks = engine.process_pdf(paths["b.pdf"])
+    a_ids = set(engine.vector_store.ids_for_source("a.pdf"))
+    b_ids = set(engine.vector_store.ids_for_source("b.pdf"))
+    assert (len(a_ids), len(b_ids)) == (a_chunks, b_chunks), "shared chunks must be stored once per file"
+
+    # b.pdf was ingested last, so it is the one that used to take over the shared chunks.
+    with benchmark.quiet():
+        engine.delete_document("b.pdf")
+    assert not engine.vector_store.ids_for_source("b.pdf"), "b.pdf chunks left behind"
+    assert set(engine.vector_store.ids_for_source("a.pdf")) == a_ids, "deleting b.pdf removed a.pdf chunks"
+    assert engine.vector_store.count() == len(a_ids)
+    assert all(chunk_id in engine.bm25_index for chunk_id in a_ids), "a.pdf chunks missing from BM25"
+    assert len(engine.bm25_index) == len(a_ids)
+    found = engine.search(" ".join(shared.split()[:12]), "hybrid", 3)
+    assert found and found[0][0].metadata['source'] == "a.pdf", found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline consistency checks.")
+    parser.add_argument("checks", nargs="*", help=f"default: all of {', '.join(sorted(CHECKS))}")
+    parser.add_argument("--verbose", action="store_true", help="show the engine's own log output")
+    args = parser.parse_args()
+    # Some checks provoke errors on purpose; the engine logs those.
+    metrics.setup_logging("INFO" if args.verbose else "CRITICAL")
+    unknown = set(args.checks) - set(CHECKS)
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(sorted(unknown))}")
+    failures = 0
+    for name in args.checks or sorted(CHECKS):
+        with tempfile.TemporaryDirectory(prefix=f"rag_check_{name}_") as directory:
+            try:
+                CHECKS[name](Path(directory))
+            except SkipCheck as e:
+                print(f"skip {name}: {e}")
+            except Exception:
+                failures += 1
+                print(f"FAIL {name}")
+                traceback.print_exc()
+            else:
+                print(f"ok   {name}")
+    sys.exit(failures)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Columnar store for chunk payloads ({'page_content', 'metadata'}), addressed by row.
+
+Text lives in one UTF-8 buffer with per-row start/length columns; source, page
+and chunk_index are typed columns, with sources interned in a small table. Any
+other metadata is kept as interned JSON, which PDF loaders share across all
+chunks of a document. A Document is only built when a row is read.
+
+save() writes a snapshot that load() memory-maps (copy-on-write), so a
+reopened store costs page cache instead of Python objects; rows appended or
+changed afterwards go to in-memory tails.
+
+    python benchmark.py --chunk-store 100000    # memory against per-chunk payload dicts
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from snapshot_io import read_section, write_section
+
+SNAPSHOT_MAGIC = b"RAGCHNK\0"
+SNAPSHOT_VERSION = 1
+# magic, version, rows, live rows, text bytes, payload log offset, tables JSON bytes
+SNAPSHOT_HEADER = struct.Struct("<8sIQQQQQ")
+
+LIVE = 1
+HAS_SOURCE = 2
+HAS_PAGE = 4
+HAS_CHUNK_INDEX = 8
+HAS_CHUNK_ID = 16
+
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+class _Column:
+    """A typed column: an optional mapped base followed by an in-memory tail."""
+
+    __slots__ = ("base", "base_len", "tail")
+
+    def __init__(self, typecode: str, base: Optional[memoryview] = None):
+        self.base = base
+        self.base_len = len(base) if base is not None else 0
+        self.tail = array(typecode)
+
+    def __len__(self) -> int:
+        return self.base_len + len(self.tail)
+
+    def __getitem__(self, row: int):
+        return self.base[row] if row < self.base_len else self.tail[row - self.base_len]
+
+    def __setitem__(self, row: int, value):
+        if row < self.base_len:
+            self.base[row] = value
+        else:
+            self.tail[row - self.base_len] = value
+
+    def append(self, value):
+        self.tail.append(value)
+
+    def numpy(self, dtype) -> np.ndarray:
+        parts = [np.frombuffer(part, dtype=dtype) for part in (self.base, self.tail) if part is not None and len(part)]
+        if not parts:
+            return np.empty(0, dtype=dtype)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def nbytes(self) -> int:
+        return self.tail.itemsize * len(self.tail)
+
+
+class ChunkStore:
+    def __init__(self):
+        self._mmap = None
+        self._views: List[memoryview] = []
+        self._base_text: memoryview = memoryview(b"")
+        self._tail_text = bytearray()
+        self._starts = _Column("Q")
+        self._lengths = _Column("I")
+        self._source = _Column("i")
+        self._page = _Column("i")
+        self._chunk_index = _Column("i")
+        self._extra = _Column("i")
+        self._flags = _Column("B")
+        self.sources: List[str] = []
+        self._source_ids: Dict[str, int] = {}
+        self._extras: List[str] = []
+        self._extra_ids: Dict[str, int] = {}
+        self._parsed_extras: Dict[int, Dict] = {}
+        self.live_count = 0
+        self.log_offset = 0
+
+    def __len__(self) -> int:
+        return len(self._flags)
+
+    @staticmethod
+    def _intern(value: str, table: List[str], ids: Dict[str, int]) -> int:
+        index = ids.get(value)
+        if index is None:
+            index = ids[value] = len(table)
+            table.append(value)
+        return index
+
+    def ensure_rows(self, rows: int):
+        """Grow to `rows` rows; new rows are empty (not live) until set()."""
+        for _ in range(rows - len(self)):
+            for column in (self._starts, self._lengths, self._source, self._page, self._chunk_index, self._flags):
+                column.append(0)
+            self._extra.append(-1)
+
+    def set(self, row: int, chunk_id: str, payload: Optional[Dict]):
+        """Store the payload of a row; None empties it (a deleted chunk)."""
+        was_live = self._flags[row] & LIVE
+        if payload is None:
+            self._flags[row] = 0
+            self.live_count -= 1 if was_live else 0
+            return
+        metadata = dict(payload.get('metadata') or {})
+        flags = LIVE
+        source = metadata.pop('source', None)
+        if isinstance(source, str):
+            self._source[row] = self._intern(source, self.sources, self._source_ids)
+            flags |= HAS_SOURCE
+        elif source is not None:
+            metadata['source'] = source
+        for key, column, flag in (('page', self._page, HAS_PAGE), ('chunk_index', self._chunk_index, HAS_CHUNK_INDEX)):
+            value = metadata.get(key)
+            if type(value) is int and INT32_MIN <= value <= INT32_MAX:
+                column[row] = metadata.pop(key)
+                flags |= flag
+        if metadata.get('chunk_id') == chunk_id:
+            del metadata['chunk_id']
+            flags |= HAS_CHUNK_ID
+        self._extra[row] = (
+            self._intern(json.dumps(metadata, ensure_ascii=False, sort_keys=True), self._extras, self._extra_ids)
+            if metadata else -1
+        )
+        text = (payload.get('page_content') or "").encode("utf-8")
+        self._starts[row] = len(self._base_text) + len(self._tail_text)
+        self._lengths[row] = len(text)
+        self._tail_text += text
+        self._flags[row] = flags
+        self.live_count += 0 if was_live else 1
+
+    def is_live(self, row: int) -> bool:
+        return row < len(self) and bool(self._flags[row] & LIVE)
+
+    def source(self, row: int) -> Optional[str]:
+        flags = self._flags[row]
+        return self.sources[self._source[row]] if flags & LIVE and flags & HAS_SOURCE else None
+
+    def _raw_text(self, row: int) -> bytes:
+        start, length = self._starts[row], self._lengths[row]
+        base_size = len(self._base_text)
+        if start < base_size:
+            return bytes(self._base_text[start:start + length])
+        return bytes(self._tail_text[start - base_size:start - base_size + length])
+
+    def text(self, row: int) -> str:
+        return self._raw_text(row).decode("utf-8")
+
+    def metadata(self, row: int, chunk_id: str) -> Dict:
+        flags = self._flags[row]
+        metadata = {}
+        if flags & HAS_SOURCE:
+            metadata['source'] = self.sources[self._source[row]]
+        if flags & HAS_PAGE:
+            metadata['page'] = self._page[row]
+        extra = self._extra[row]
+        if extra >= 0:
+            parsed = self._parsed_extras.get(extra)
+            if parsed is None:
+                parsed = self._parsed_extras[extra] = json.loads(self._extras[extra])
+            metadata.update(parsed)
+        if flags & HAS_CHUNK_INDEX:
+            metadata['chunk_index'] = self._chunk_index[row]
+        if flags & HAS_CHUNK_ID:
+            metadata['chunk_id'] = chunk_id
+        return metadata
+
+    def payload(self, row: int, chunk_id: str) -> Optional[Dict]:
+        if not self.is_live(row):
+            return None
+        return {'page_content': self.text(row), 'metadata': self.metadata(row, chunk_id)}
+
+    def document(self, row: int, chunk_id: str) -> Optional[Document]:
+        if not self.is_live(row):
+            return None
+        return Document(page_content=self.text(row), metadata=self.metadata(row, chunk_id))
+
+    def dead_mask(self) -> np.ndarray:
+        """Boolean mask of rows without a live payload."""
+        return (self._flags.numpy(np.uint8) & LIVE) == 0
+
+    def rows_for_source(self, source: str) -> np.ndarray:
+        index = self._source_ids.get(source)
+        if index is None:
+            return np.empty(0, dtype=np.int64)
+        flags = self._flags.numpy(np.uint8)
+        match = (self._source.numpy(np.int32) == index) & ((flags & (LIVE | HAS_SOURCE)) == (LIVE | HAS_SOURCE))
+        return np.flatnonzero(match)
+
+    def nbytes(self) -> Dict[str, int]:
+        """Bytes held in process memory and in the mapped snapshot."""
+        columns = (self._starts, self._lengths, self._source, self._page, self._chunk_index, self._extra, self._flags)
+        return {
+            'heap': len(self._tail_text) + sum(column.nbytes() for column in columns),
+            'mapped': len(self._mmap) if self._mmap is not None else 0,
+        }
+
+    def save(self, path: Path, log_offset: int = 0, last_id: str = ""):
+        """
+        Write a compacted snapshot: deleted rows keep their slot but lose their text.
+        Sections after the header, each padded to 8 bytes: the sources/extras tables
+        (JSON), starts (u64), lengths (u32), source, page, chunk_index, extra (i32),
+        flags (u8) and the UTF-8 text.
+        """
+        rows = len(self)
+        starts = array("Q")
+        lengths = array("I")
+        parts = []
+        size = 0
+        for row in range(rows):
+            text = self._raw_text(row) if self._flags[row] & LIVE else b""
+            starts.append(size)
+            lengths.append(len(text))
+            parts.append(text)
+            size += len(text)
+        tables = json.dumps(
+            {'sources': self.sources, 'extras': self._extras, 'last_id': last_id}, ensure_ascii=False
+        ).encode("utf-8")
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, rows, self.live_count, size, log_offset, len(tables))
+        tmp_path = Path(f"{path}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            write_section(f, tables)
+            write_section(f, starts)
+            write_section(f, lengths)
+            for column, typecode in ((self._source, "i"), (self._page, "i"), (self._chunk_index, "i"),
+                                     (self._extra, "i"), (self._flags, "B")):
+                write_section(f, array(typecode, (column[row] for row in range(rows))))
+            write_section(f, b"".join(parts))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Tuple["ChunkStore", str]:
+        """Map a snapshot; returns the store and the id of its last row (to check it against the vectors)."""
+        if sys.byteorder != "little":
+            raise ValueError("Chunk store snapshots are little-endian only")
+        store = cls()
+        with open(path, "rb") as f:
+            store._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        view = memoryview(store._mmap)
+        store._views.append(view)
+        try:
+            magic, version, rows, live, text_size, log_offset, tables_size = SNAPSHOT_HEADER.unpack_from(view)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError(f"Unsupported chunk store snapshot: {path}")
+            pos = SNAPSHOT_HEADER.size
+            tables, pos = read_section(view, pos, "B", tables_size)
+            store._views.append(tables)
+            columns = {}
+            for name, typecode in (("starts", "Q"), ("lengths", "I"), ("source", "i"), ("page", "i"),
+                                   ("chunk_index", "i"), ("extra", "i"), ("flags", "B")):
+                columns[name], pos = read_section(view, pos, typecode, rows)
+                store._views.append(columns[name])
+                setattr(store, f"_{name}", _Column(typecode, columns[name]))
+            store._base_text, pos = read_section(view, pos, "B", text_size)
+            store._views.append(store._base_text)
+        except Exception:
+            store.close()
+            raise
+        decoded = json.loads(bytes(tables).decode("utf-8"))
+        store.sources = decoded['sources']
+        store._source_ids = {source: i for i, source in enumerate(store.sources)}
+        store._extras = decoded['extras']
+        store._extra_ids = {extra: i for i, extra in enumerate(store._extras)}
+        store.live_count = live
+        store.log_offset = log_offset
+        return store, decoded['last_id']
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Views handed out to readers are still alive; the mapping is freed with them.
+                pass
+
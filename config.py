@@ -8,31 +8,116 @@ BASE_DIR = Path(__file__).parent
 DATA_DIR = BASE_DIR / "data"
 VECTOR_STORE_DIR = DATA_DIR / "vector_store"
 PDF_UPLOAD_DIR = DATA_DIR / "uploaded_pdfs"
+KEYWORD_INDEX_DIR = DATA_DIR / "keyword_index"
 
 DATA_DIR.mkdir(exist_ok=True)
 VECTOR_STORE_DIR.mkdir(exist_ok=True)
 PDF_UPLOAD_DIR.mkdir(exist_ok=True)
+KEYWORD_INDEX_DIR.mkdir(exist_ok=True)
 
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+CHUNKER_VERSION = "recursive-v1"
+# Chunk ids are md5(embedding model, source, content): a chunk two PDFs share is stored
+# once per PDF, and a new model or backend re-embeds every chunk.
+CHUNK_ID_VERSION = "model-source-content-v3"
+
+INGEST_MANIFEST_PATH = DATA_DIR / "ingest_manifest.json"
 
 EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 EMBEDDING_DEVICE = "cpu" 
+EMBEDDING_DIMENSION = 384
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_DIR = DATA_DIR / "embedding_cache"
+EMBEDDING_CACHE_DTYPE = "float16"
+EMBEDDING_WARMUP = True  # embed one query right after the model loads, in the background
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # "torch", "torch_int8", "onnx" or "onnx_int8"
+EMBEDDING_ONNX_DIR = DATA_DIR / "onnx_model"  # written by `python embedding_backends.py export`
+EMBEDDING_MAX_LENGTH = 256  # tokens; the sentence-transformers limit for MiniLM
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # intra-op threads; 0 = library default
+EMBEDDING_MICROBATCH = True  # merge concurrent query embeddings into one forward pass
+EMBEDDING_MICROBATCH_SIZE = 32
+EMBEDDING_MICROBATCH_WAIT_MS = 0.0  # extra wait for more queries; 0 = only merge queries that are already waiting
+EMBEDDING_PARITY_MIN_COSINE = 0.99  # minimum cosine similarity to the torch model accepted by `compare`
+
+INGEST_WORKERS = min(4, os.cpu_count() or 1)
+INGEST_QUEUE_PATH = DATA_DIR / "ingest_queue.db"
+INGEST_WORKER_MODE = os.getenv("INGEST_WORKER_MODE", "thread")  # "thread" (inside the app) or "process" (python ingest_worker.py)
+INGEST_WORKER_BATCH = 8  # files claimed per pipeline run
+INGEST_MAX_ATTEMPTS = 3
+INGEST_JOB_TIMEOUT = 600  # seconds without a heartbeat before a running job is requeued
+INGEST_POLL_INTERVAL = 2.0  # seconds
+INGEST_NICE = 10  # priority drop for ingestion so queries keep their latency
+INDEX_REFRESH_INTERVAL = 1.0  # seconds between checks for ingestion by another process
+UPSERT_BATCH_SIZE = 256
+UPSERT_CONCURRENCY = 4
 
-VECTOR_STORE_TYPE = "qdrant" 
+VECTOR_STORE_TYPE = os.getenv("VECTOR_STORE_TYPE", "qdrant")  # "qdrant", "qdrant_local" or "numpy"
+VECTOR_STORE_DTYPE = "float32"  # "float32" or "int8" (numpy store only)
+# NumPy store: rewrite the columnar chunk snapshot (chunks.bin) once this many payload
+# records sit in payloads.jsonl past it, so startup maps the snapshot and replays only the tail
+VECTOR_STORE_SNAPSHOT_RECORDS = 5000
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", "")
 QDRANT_COLLECTION_NAME = "rag_documents"
 QDRANT_PATH =  DATA_DIR / "qdrant_db" 
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none")  # "none", "scalar" (int8) or "binary"
+QDRANT_QUANTIZATION_ALWAYS_RAM = True
+QDRANT_RESCORE = True  # re-rank quantized candidates with the original vectors
+QDRANT_OVERSAMPLING = 2.0
+QDRANT_ON_DISK = os.getenv("QDRANT_ON_DISK", "false").lower() == "true"  # original vectors on disk
+QDRANT_HNSW_M = 16
+QDRANT_HNSW_EF_CONSTRUCT = 100
+QDRANT_HNSW_EF = 128  # search-time ef
+QDRANT_CONNECT_RETRIES = 5
+QDRANT_CONNECT_BACKOFF = 0.5  # seconds before the first retry, doubled after each failure
+QDRANT_CONNECT_BACKOFF_MAX = 8.0
 
 TOP_K_RESULTS = 5
 SEARCH_TYPE = "hybrid"  
 HYBRID_WEIGHT_SEMANTIC = 0.6  
 HYBRID_WEIGHT_KEYWORD = 0.4  
+BM25_SCROLL_BATCH_SIZE = 1000
+SEARCH_WORKERS = 8
+SEMANTIC_SEARCH_TIMEOUT = 5.0  # seconds
+KEYWORD_SEARCH_TIMEOUT = 2.0  # seconds
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+SEARCH_CACHE_SIZE = 512
+SEARCH_CACHE_TTL = 3600  # seconds
 
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 OLLAMA_MODEL = "Tuanpham/t-visstar-7b:latest"
 LLM_TEMPERATURE = 0.3 
 LLM_MAX_TOKENS = 1000
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # how long Ollama keeps the model loaded after a request
+LLM_WARMUP = os.getenv("LLM_WARMUP", "true").lower() == "true"  # load the model into Ollama at startup
+LLM_WARMUP_TIMEOUT = 300  # seconds
+
+CONTEXT_TOKEN_BUDGET = 1500
+HISTORY_TOKEN_BUDGET = 300
+CHARS_PER_TOKEN = 3.0  # rough estimate for Vietnamese text
+MIN_TRIMMED_CHUNK_TOKENS = 60
+
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_PATH = DATA_DIR / "answer_cache.jsonl"
+ANSWER_CACHE_SIMILARITY = 0.95
+ANSWER_CACHE_SIZE = 1000
+
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_WORKERS = 8  # threads for search and embedding work
+API_SEARCH_CONCURRENCY = 8
+API_SEARCH_QUEUE_SIZE = 32
+API_LLM_CONCURRENCY = 1  # generations running against Ollama at once
+API_LLM_QUEUE_SIZE = 8
+API_INGEST_QUEUE_SIZE = 64  # files queued or being ingested
+API_QUEUE_TIMEOUT = 120.0  # seconds a request may wait for a slot
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"  # stage timings, counters and traces
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # standalone /metrics exporter for the app and worker; 0 = off
+METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)  # seconds
 
 PAGE_TITLE = "RAG System - PDF Q&A"
 PAGE_ICON = "📚"
\ No newline at end of file
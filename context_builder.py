@@ -0,0 +1,165 @@
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+import config
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?;:])\s+|\n+")
+_WORD = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the model's token count for a piece of text."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / config.CHARS_PER_TOKEN)
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_SPLIT.split(text) if sentence.strip()]
+
+
+def _terms(text: str) -> set:
+    return set(_WORD.findall(text.lower()))
+
+
+def informative_terms(query: str, texts: List[str]) -> set:
+    """
+    Query terms that discriminate between sentences. Terms found in more than half
+    of the candidate sentences (function words such as "là", "của") are ignored.
+    """
+    query_terms = _terms(query)
+    sentence_terms = [_terms(sentence) for text in texts for sentence in split_sentences(text)]
+    if len(sentence_terms) < 4:
+        return query_terms
+    limit = len(sentence_terms) / 2
+    return {term for term in query_terms if sum(term in terms for terms in sentence_terms) <= limit}
+
+
+def _strip_overlap(text: str, previous: str, max_overlap: int) -> str:
+    """Remove the prefix of text that repeats the tail of previous (chunk overlap)."""
+    probe = text[:min(40, len(text))]
+    if not probe:
+        return text
+    tail = previous[-(max_overlap + len(probe)):]
+    start = tail.find(probe)
+    while start >= 0:
+        overlap = tail[start:]
+        if text.startswith(overlap):
+            return text[len(overlap):].lstrip()
+        start = tail.find(probe, start + 1)
+    return text
+
+
+def deduplicate_overlap(docs: List[Document], max_overlap: Optional[int] = None) -> List[Tuple[Document, str]]:
+    """
+    Pair each document with its text minus any overlap already present in a
+    higher-ranked chunk of the same source. Exact duplicates are dropped.
+    """
+    max_overlap = max_overlap if max_overlap is not None else config.CHUNK_OVERLAP * 2
+    kept = []
+    seen_texts = set()
+    for doc in docs:
+        text = doc.page_content.strip()
+        if not text or text in seen_texts:
+            continue
+        seen_texts.add(text)
+        source = doc.metadata.get('source')
+        for other, other_text in kept:
+            if other.metadata.get('source') != source:
+                continue
+            # Either chunk may come first in the document, so check both directions.
+            text = _strip_overlap(text, other_text, max_overlap)
+            reversed_text = _strip_overlap(text[::-1], other_text[::-1], max_overlap)[::-1]
+            if len(reversed_text) < len(text):
+                text = reversed_text.rstrip()
+        if text:
+            kept.append((doc, text))
+    return kept
+
+
+def select_relevant_sentences(text: str, query_terms: set) -> str:
+    """Keep the sentences that share a term with the query, in their original order."""
+    sentences = list(dict.fromkeys(split_sentences(text)))
+    relevant = [sentence for sentence in sentences if query_terms & _terms(sentence)]
+    if not relevant or len(relevant) == len(sentences):
+        # Semantic-only match: nothing to anchor on, keep the chunk as is.
+        return text
+    return " … ".join(relevant)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, preferring a sentence boundary."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = int(max_tokens * config.CHARS_PER_TOKEN)
+    sentences = split_sentences(text)
+    parts = []
+    length = 0
+    for sentence in sentences:
+        if length + len(sentence) + 1 > limit:
+            break
+        parts.append(sentence)
+        length += len(sentence) + 1
+    if parts:
+        return " ".join(parts)
+    return text[:limit].rsplit(" ", 1)[0] + " …"
+
+
+def build_context(
+    query: str,
+    docs: List[Document],
+    token_budget: Optional[int] = None
+) -> Dict[str, any]:
+    """
+    Fit ranked chunks into a token budget.
+
+    Overlapping text between chunks of the same source is removed, each chunk is
+    reduced to its query-relevant sentences, and chunks are admitted in rank order
+    until the budget runs out; the last one may be trimmed, lower-ranked ones are
+    dropped. Returns the kept (document, text) pairs and token counts.
+    """
+    token_budget = token_budget if token_budget is not None else config.CONTEXT_TOKEN_BUDGET
+    tokens_before = sum(estimate_tokens(doc.page_content) for doc in docs)
+    chunks = deduplicate_overlap(docs)
+    query_terms = informative_terms(query, [text for _, text in chunks])
+
+    selected = []
+    used = 0
+    for doc, text in chunks:
+        text = select_relevant_sentences(text, query_terms)
+        tokens = estimate_tokens(text)
+        remaining = token_budget - used
+        if tokens > remaining:
+            if remaining < config.MIN_TRIMMED_CHUNK_TOKENS:
+                continue
+            text = truncate_to_tokens(text, remaining)
+            tokens = estimate_tokens(text)
+        selected.append((doc, text))
+        used += tokens
+
+    return {
+        'chunks': selected,
+        'tokens_before': tokens_before,
+        'tokens_after': used,
+        'dropped': len(docs) - len(selected),
+    }
+
+
+def trim_history(chat_history: List[Dict[str, str]], token_budget: Optional[int] = None) -> List[Dict[str, str]]:
+    """Keep the most recent turns that fit the history budget, newest last."""
+    token_budget = token_budget if token_budget is not None else config.HISTORY_TOKEN_BUDGET
+    kept = []
+    used = 0
+    for msg in reversed(chat_history):
+        tokens = estimate_tokens(msg['content'])
+        if used + tokens > token_budget:
+            remaining = token_budget - used
+            if remaining >= config.MIN_TRIMMED_CHUNK_TOKENS:
+                kept.append({**msg, 'content': truncate_to_tokens(msg['content'], remaining)})
+            break
+        kept.append(msg)
+        used += tokens
+    return list(reversed(kept))
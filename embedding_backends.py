@@ -0,0 +1,312 @@
+"""
+CPU embedding backends for all-MiniLM-L6-v2, selected by EMBEDDING_BACKEND.
+
+    torch       sentence-transformers on PyTorch (HuggingFaceEmbeddings)
+    torch_int8  the same model with its Linear layers dynamically quantized to int8
+    onnx        the model exported to ONNX and run by ONNX Runtime
+    onnx_int8   the ONNX export with dynamically int8-quantized weights
+
+The ONNX backends need `python embedding_backends.py export` once (writes
+EMBEDDING_ONNX_DIR) and the onnxruntime and tokenizers packages.
+`python embedding_backends.py compare` checks cosine parity of every backend
+against the torch model and reports throughput.
+
+Every backend pools and normalizes like the sentence-transformers model, so
+vectors stay comparable with an existing collection.
+"""
+import argparse
+import inspect
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "torch_int8", "onnx", "onnx_int8")
+ONNX_FILES = {'onnx': "model.onnx", 'onnx_int8': "model-int8.onnx"}
+
+
+def model_id(backend: Optional[str] = None) -> str:
+    """Name the vectors a backend produces, e.g. for the embedding cache; quantized vectors differ slightly."""
+    backend = backend or config.EMBEDDING_BACKEND
+    return config.EMBEDDING_MODEL_NAME if backend == "torch" else f"{config.EMBEDDING_MODEL_NAME}@{backend}"
+
+
+def create_embeddings(backend: Optional[str] = None, threads: Optional[int] = None) -> Embeddings:
+    """The embedding model for EMBEDDING_BACKEND, using EMBEDDING_THREADS intra-op threads."""
+    backend = backend or config.EMBEDDING_BACKEND
+    threads = config.EMBEDDING_THREADS if threads is None else threads
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+    if backend in ONNX_FILES:
+        return OnnxEmbeddings(config.EMBEDDING_ONNX_DIR / ONNX_FILES[backend], threads=threads)
+
+    import torch
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    if threads:
+        torch.set_num_threads(threads)
+    embeddings = HuggingFaceEmbeddings(
+        model_name=config.EMBEDDING_MODEL_NAME,
+        model_kwargs={'device': config.EMBEDDING_DEVICE},
+        encode_kwargs={'normalize_embeddings': True, 'batch_size': config.EMBEDDING_BATCH_SIZE}
+    )
+    if backend == "torch_int8":
+        embeddings.client = torch.ao.quantization.quantize_dynamic(embeddings.client, {torch.nn.Linear}, dtype=torch.qint8)
+    return embeddings
+
+
+class OnnxEmbeddings(Embeddings):
+    """Mean-pooled, normalized sentence embeddings from an ONNX export of the transformer."""
+
+    def __init__(self, model_path: Path, threads: int = 0, batch_size: Optional[int] = None,
+                 max_length: Optional[int] = None):
+        batch_size = batch_size or config.EMBEDDING_BATCH_SIZE
+        max_length = max_length or config.EMBEDDING_MAX_LENGTH
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = Path(model_path)
+        if not model_path.exists():
+            raise FileNotFoundError(f"{model_path} not found; run `python embedding_backends.py export` first.")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(str(model_path.parent / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id("[PAD]") or 0, pad_token="[PAD]")
+        self.batch_size = batch_size
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {
+            'input_ids': np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            'attention_mask': mask,
+        }
+        if 'token_type_ids' in self.input_names:
+            feeds['token_type_ids'] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+        hidden = self.session.run(None, feeds)[0]
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Batch texts of similar length together so little of each batch is padding.
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            encoded = self._encode([texts[i] for i in batch])
+            if not vectors.shape[1]:
+                vectors = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+            vectors[batch] = encoded
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class MicroBatcher(Embeddings):
+    """
+    Merge concurrent embed_query calls into one forward pass.
+
+    Queries arriving while a batch is being encoded wait for the next batch, so
+    a lone query is encoded at once and bursts share the model's batch cost.
+    embed_documents calls pass straight through.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch: Optional[int] = None, max_wait: Optional[float] = None):
+        self.embeddings = embeddings
+        self.max_batch = max_batch or config.EMBEDDING_MICROBATCH_SIZE
+        self.max_wait = config.EMBEDDING_MICROBATCH_WAIT_MS / 1000 if max_wait is None else max_wait
+        self._queue: "queue.Queue" = queue.Queue()
+        threading.Thread(target=self._run, name="embedding-batcher", daemon=True).start()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _next_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.perf_counter()
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            metrics.EMBEDDING_MICROBATCH.observe(len(batch))
+            try:
+                vectors = self.embeddings.embed_documents([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+def export_onnx(output_dir: Optional[Path] = None, quantize: bool = True, opset: int = 14) -> List[Path]:
+    """Export the transformer of EMBEDDING_MODEL_NAME to ONNX, plus an int8 copy; returns the written models."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    output_dir = Path(output_dir or config.EMBEDDING_ONNX_DIR)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(config.EMBEDDING_MODEL_NAME)
+    model = AutoModel.from_pretrained(config.EMBEDDING_MODEL_NAME).eval()
+    sample = tokenizer(["xin chào"], return_tensors="pt")
+    names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class Encoder(torch.nn.Module):
+        # Keyword arguments, since the positional order of forward() differs across transformers versions.
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(names, inputs))).last_hidden_state
+
+    axes = {name: {0: "batch", 1: "sequence"} for name in names}
+    axes['last_hidden_state'] = {0: "batch", 1: "sequence"}
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs['dynamo'] = False  # the TorchScript exporter handles the dynamic axes below
+    fp32_path = output_dir / ONNX_FILES['onnx']
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(), tuple(sample[name] for name in names), str(fp32_path),
+            input_names=names, output_names=["last_hidden_state"], dynamic_axes=axes, opset_version=opset, **kwargs
+        )
+    tokenizer.backend_tokenizer.save(str(output_dir / "tokenizer.json"))
+    written = [fp32_path]
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = output_dir / ONNX_FILES['onnx_int8']
+        quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+        written.append(int8_path)
+    return written
+
+
+def measure_throughput(embeddings: Embeddings, texts: List[str], rounds: int = 3) -> float:
+    """Best texts/second over a few rounds of embed_documents."""
+    embeddings.embed_documents(texts[:8])
+    best = 0.0
+    for _ in range(rounds):
+        started = time.perf_counter()
+        embeddings.embed_documents(texts)
+        best = max(best, len(texts) / (time.perf_counter() - started))
+    return best
+
+
+def measure_concurrent_queries(embeddings: Embeddings, texts: List[str], clients: int) -> float:
+    """Queries/second with `clients` threads calling embed_query at once."""
+    remaining = list(texts)
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                if not remaining:
+                    return
+                text = remaining.pop()
+            embeddings.embed_query(text)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(texts) / (time.perf_counter() - started)
+
+
+def compare(backends: List[str], count: int, threads: int, clients: int, min_cosine: float) -> bool:
+    """Print parity against torch and throughput per backend; returns whether every backend met min_cosine."""
+    from synthetic_corpus import sample_texts
+
+    texts = sample_texts(count)
+    queries = [text for text in texts if len(text) < 80] or texts
+    reference = None
+    passed = True
+    print(f"{len(texts)} texts, {threads or 'default'} threads, {clients} concurrent query clients\n")
+    print(f"{'backend':<11} {'load s':>7} {'docs/s':>8} {'query/s':>8} {'batched q/s':>11} {'mean cos':>9} {'min cos':>8}")
+    for backend in ["torch"] + [backend for backend in backends if backend != "torch"]:
+        started = time.perf_counter()
+        try:
+            embeddings = create_embeddings(backend, threads)
+        except Exception as e:
+            print(f"{backend:<11} unavailable: {e}")
+            if backend == "torch":
+                return False
+            continue
+        load_seconds = time.perf_counter() - started
+        vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+        docs_per_second = measure_throughput(embeddings, texts)
+        queries_per_second = measure_concurrent_queries(embeddings, queries, clients)
+        batched_per_second = measure_concurrent_queries(MicroBatcher(embeddings), queries, clients)
+        if reference is None:
+            reference = vectors
+        cosines = np.sum(vectors * reference, axis=1)
+        if cosines.min() < min_cosine:
+            passed = False
+        print(
+            f"{backend:<11} {load_seconds:7.2f} {docs_per_second:8.1f} {queries_per_second:8.1f} "
+            f"{batched_per_second:11.1f} {cosines.mean():9.4f} {cosines.min():8.4f}"
+        )
+    print(f"\nParity {'OK' if passed else 'FAILED'} (min cosine >= {min_cosine})")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the ONNX embedding model or compare embedding backends.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="write the ONNX model and its int8 copy")
+    export_parser.add_argument("--output", default=None, help=f"directory (default {config.EMBEDDING_ONNX_DIR})")
+    export_parser.add_argument("--no-quantize", action="store_true", help="skip the int8 model")
+    compare_parser = subparsers.add_parser("compare", help="cosine parity against torch and throughput")
+    compare_parser.add_argument("--backends", default=",".join(BACKENDS[1:]))
+    compare_parser.add_argument("--texts", type=int, default=512)
+    compare_parser.add_argument("--threads", type=int, default=config.EMBEDDING_THREADS)
+    compare_parser.add_argument("--clients", type=int, default=8, help="threads calling embed_query concurrently")
+    compare_parser.add_argument("--min-cosine", type=float, default=config.EMBEDDING_PARITY_MIN_COSINE)
+    args = parser.parse_args()
+    metrics.setup_logging("WARNING")
+
+    if args.command == "export":
+        for path in export_onnx(args.output, quantize=not args.no_quantize):
+            print(f"Wrote {path} ({path.stat().st_size / 1024 ** 2:.1f} MB)")
+        return
+    if not compare(args.backends.split(","), args.texts, args.threads, args.clients, args.min_cosine):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
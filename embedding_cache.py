@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Persistent chunk-embedding cache keyed by content hash, one directory per model.
+
+    Vectors are appended to a flat float16/float32 array file and their 16-byte
+    content digests to a parallel key file, so a row number is the only index.
+    The vector file is memory-mapped for reads; nothing but the key map is held
+    in memory.
+    """
+
+    def __init__(self, directory: Path, model_name: str, dtype: str = "float16"):
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+        self.directory = Path(directory) / slug
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.vectors_path = self.directory / "vectors.bin"
+        self.keys_path = self.directory / "keys.bin"
+        self.meta_path = self.directory / "meta.json"
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+        self.rows: Dict[bytes, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @staticmethod
+    def _digest(key: str) -> bytes:
+        try:
+            digest = bytes.fromhex(key)
+            if len(digest) == 16:
+                return digest
+        except ValueError:
+            pass
+        return hashlib.md5(key.encode()).digest()
+
+    def _load(self):
+        if self.meta_path.exists():
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get('model') != self.model_name:
+                raise ValueError(f"Embedding cache at {self.directory} belongs to {meta.get('model')}")
+            self.dim = meta['dim']
+            self.dtype = np.dtype(meta['dtype'])
+        if self.dim is None or not self.keys_path.exists():
+            return
+
+        row_bytes = self.dim * self.dtype.itemsize
+        vector_rows = self.vectors_path.stat().st_size // row_bytes if self.vectors_path.exists() else 0
+        with open(self.keys_path, "rb") as f:
+            keys = f.read()
+        rows = min(len(keys) // 16, vector_rows)
+        # Drop any tail left by an interrupted append so both files agree on the row count.
+        if len(keys) != rows * 16:
+            os.truncate(self.keys_path, rows * 16)
+        if self.vectors_path.exists() and self.vectors_path.stat().st_size != rows * row_bytes:
+            os.truncate(self.vectors_path, rows * row_bytes)
+        self.rows = {keys[i * 16:(i + 1) * 16]: i for i in range(rows)}
+        self._map()
+
+    def _map(self):
+        if self.rows:
+            self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(len(self.rows), self.dim))
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[List[float]]]:
+        """Return the cached vector for each key, or None where it is missing."""
+        with self._lock:
+            results = []
+            for key in keys:
+                row = self.rows.get(self._digest(key))
+                if row is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(np.asarray(self._vectors[row], dtype=np.float32).tolist())
+            return results
+
+    def put_many(self, keys: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """Append vectors for keys that are not cached yet."""
+        with self._lock:
+            new_keys = []
+            new_vectors = []
+            seen = set()
+            for key, vector in zip(keys, vectors):
+                digest = self._digest(key)
+                if digest not in self.rows and digest not in seen:
+                    seen.add(digest)
+                    new_keys.append(digest)
+                    new_vectors.append(vector)
+            if not new_keys:
+                return
+            matrix = np.asarray(new_vectors, dtype=self.dtype)
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({'model': self.model_name, 'dim': self.dim, 'dtype': self.dtype.name}, f)
+            with open(self.vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(new_keys))
+            for digest in new_keys:
+                self.rows[digest] = len(self.rows)
+            self._map()
+
+    def stats(self) -> Dict[str, any]:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self.rows),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,194 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    source TEXT NOT NULL,
+    action TEXT NOT NULL DEFAULT 'ingest',
+    force INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ingest_jobs_status ON ingest_jobs (status, id);
+"""
+
+ACTIVE_STATUSES = ('queued', 'running')
+ACTIONS = ('ingest', 'delete')
+
+
+class IngestQueue:
+    """
+    Durable per-file ingestion job queue in SQLite.
+
+    A job either ingests a file ('ingest') or removes a document ('delete'),
+    and workers run them in queue order. Jobs move queued -> running -> done / skipped / failed. A failed attempt is
+    queued again until INGEST_MAX_ATTEMPTS, and running jobs whose worker stopped
+    updating them are handed out again, so a crash never loses an upload.
+    Re-running a job is safe: files are keyed by content hash and chunks by
+    source and content id, so a repeated attempt only skips or overwrites identical data.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or config.INGEST_QUEUE_PATH)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(ingest_jobs)")}
+            if 'action' not in columns:
+                conn.execute("ALTER TABLE ingest_jobs ADD COLUMN action TEXT NOT NULL DEFAULT 'ingest'")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, pdf_paths: List[str], force: bool = False, action: str = 'ingest') -> List[int]:
+        """
+        Queue one job per file and return the job ids. A file whose latest queued or
+        running job has the same action keeps that job instead of getting a second one.
+        """
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown ingest job action: {action}")
+        now = time.time()
+        job_ids = []
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for pdf_path in pdf_paths:
+                pdf_path = str(pdf_path)
+                # Reuse only the latest active job, so an upload queued after a delete still runs.
+                row = conn.execute(
+                    "SELECT id, action FROM ingest_jobs WHERE path = ? AND status IN (?, ?) ORDER BY id DESC LIMIT 1",
+                    (pdf_path, *ACTIVE_STATUSES)
+                ).fetchone()
+                if row is not None and row['action'] == action:
+                    job_ids.append(row['id'])
+                    continue
+                cursor = conn.execute(
+                    "INSERT INTO ingest_jobs (path, source, action, force, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (pdf_path, os.path.basename(pdf_path), action, int(force), now, now)
+                )
+                job_ids.append(cursor.lastrowid)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return job_ids
+
+    def claim(self, worker: str, limit: int = 1) -> List[Dict]:
+        """Atomically move up to limit queued jobs to running for this worker."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT * FROM ingest_jobs WHERE status = 'queued' ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+            for row in rows:
+                conn.execute(
+                    "UPDATE ingest_jobs SET status = 'running', attempts = attempts + 1, worker = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (worker, now, row['id'])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [dict(row, status='running', attempts=row['attempts'] + 1, worker=worker) for row in rows]
+
+    def heartbeat(self, job_ids: List[int]):
+        """Mark running jobs as still being worked on."""
+        if not job_ids:
+            return
+        placeholders = ",".join("?" * len(job_ids))
+        self._connect().execute(
+            f"UPDATE ingest_jobs SET updated_at = ? WHERE status = 'running' AND id IN ({placeholders})",
+            (time.time(), *job_ids)
+        )
+
+    def finish(self, job_id: int, status: str, chunks: int = 0, error: Optional[str] = None):
+        """Record the outcome of a running job; a failure is retried while attempts remain."""
+        conn = self._connect()
+        if status == 'failed':
+            conn.execute(
+                "UPDATE ingest_jobs SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, "
+                "error = ?, updated_at = ? WHERE id = ?",
+                (config.INGEST_MAX_ATTEMPTS, error, time.time(), job_id)
+            )
+        else:
+            conn.execute(
+                "UPDATE ingest_jobs SET status = ?, chunks = ?, error = NULL, updated_at = ? WHERE id = ?",
+                (status, chunks, time.time(), job_id)
+            )
+
+    def requeue_stale(self, timeout: Optional[float] = None) -> int:
+        """
+        Hand running jobs whose worker went silent back to the queue. A job that has used
+        up its attempts fails instead: a file that kills the worker (OOM, a crash in the
+        parser) would otherwise be retried forever.
+        """
+        timeout = config.INGEST_JOB_TIMEOUT if timeout is None else timeout
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE ingest_jobs SET status = 'failed', worker = NULL, updated_at = ?, "
+                "error = 'worker stopped responding on every attempt' "
+                "WHERE status = 'running' AND updated_at < ? AND attempts >= ?",
+                (now, now - timeout, config.INGEST_MAX_ATTEMPTS)
+            )
+            cursor = conn.execute(
+                "UPDATE ingest_jobs SET status = 'queued', worker = NULL, updated_at = ?, "
+                "error = 'worker stopped responding' "
+                "WHERE status = 'running' AND updated_at < ? AND attempts < ?",
+                (now, now - timeout, config.INGEST_MAX_ATTEMPTS)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        row = self._connect().execute("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def jobs(self, job_ids: Optional[List[int]] = None, limit: int = 50) -> List[Dict]:
+        """The given jobs, or the most recent ones."""
+        conn = self._connect()
+        if job_ids is not None:
+            if not job_ids:
+                return []
+            placeholders = ",".join("?" * len(job_ids))
+            rows = conn.execute(f"SELECT * FROM ingest_jobs WHERE id IN ({placeholders}) ORDER BY id", tuple(job_ids))
+        else:
+            rows = conn.execute("SELECT * FROM ingest_jobs ORDER BY id DESC LIMIT ?", (limit,))
+        return [dict(row) for row in rows.fetchall()]
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM ingest_jobs GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    def pending(self) -> int:
+        counts = self.counts()
+        return sum(counts.get(status, 0) for status in ACTIVE_STATUSES)
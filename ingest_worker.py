@@ -0,0 +1,143 @@
+"""
+Background ingestion worker.
+
+Runs inside the app as a low-priority thread (INGEST_WORKER_MODE = "thread") or
+as its own process:
+
+    INGEST_WORKER_MODE=process python ingest_worker.py
+
+In process mode the app only queues uploads; the worker ingests them into the
+shared vector store and the app picks up the new generation on its next search.
+Running as a separate process needs a store both can open (a Qdrant server or
+the NumPy store); embedded Qdrant allows a single process only.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from itertools import groupby
+from typing import Dict, List, Optional
+
+import config
+import metrics
+from ingest_queue import IngestQueue
+from rag_engine import RAGEngine, get_shared_engine, lower_ingest_priority
+
+logger = logging.getLogger(__name__)
+
+_background_worker = None
+_background_worker_lock = threading.Lock()
+
+
+class IngestWorker:
+    """Claims queued ingest and delete jobs in batches and runs them through the engine."""
+
+    def __init__(self, engine: RAGEngine, queue: Optional[IngestQueue] = None, batch_size: Optional[int] = None):
+        self.engine = engine
+        self.queue = queue or IngestQueue()
+        self.batch_size = batch_size or config.INGEST_WORKER_BATCH
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        self._stop = threading.Event()
+
+    def run_once(self) -> int:
+        """Process one batch of queued jobs; returns the number of jobs handled."""
+        jobs = self.queue.claim(self.worker_id, self.batch_size)
+        if not jobs:
+            return 0
+        logger.info("Ingest worker claimed %s jobs.", len(jobs))
+        job_ids = [job['id'] for job in jobs]
+        beating = threading.Event()
+
+        def heartbeat():
+            queue = IngestQueue(self.queue.path)
+            while not beating.wait(config.INGEST_JOB_TIMEOUT / 4):
+                queue.heartbeat(job_ids)
+
+        beat_thread = threading.Thread(target=heartbeat, daemon=True)
+        beat_thread.start()
+        reported = set()
+        try:
+            # Consecutive jobs with the same action and force flag run together; order is kept
+            # so a delete queued after an upload of the same file wins, and the other way round.
+            for (action, force), group in groupby(jobs, key=lambda job: (job['action'], bool(job['force']))):
+                batch = list(group)
+                if action == 'delete':
+                    for job in batch:
+                        removed = self.engine.delete_document(job['source'])
+                        self.queue.finish(job['id'], 'done', removed)
+                        reported.add(job['id'])
+                    continue
+                by_path: Dict[str, List[int]] = {}
+                for job in batch:
+                    by_path.setdefault(job['path'], []).append(job['id'])
+
+                def on_file(pdf_path: str, result: Dict[str, any]):
+                    for job_id in by_path.get(pdf_path, []):
+                        self.queue.finish(job_id, result['status'], result['chunks'], result['error'])
+                        reported.add(job_id)
+
+                self.engine.ingest_pdfs(list(by_path), force=force, file_callback=on_file)
+            self.engine.persist_keyword_index()
+        except Exception as e:
+            logger.error("Ingest worker error: %s", e)
+            for job_id in job_ids:
+                if job_id not in reported:
+                    self.queue.finish(job_id, 'failed', error=str(e))
+                    reported.add(job_id)
+        finally:
+            beating.set()
+        for job_id in job_ids:
+            if job_id not in reported:
+                self.queue.finish(job_id, 'failed', error="No result reported")
+        return len(jobs)
+
+    def run_forever(self, poll_interval: Optional[float] = None):
+        poll_interval = config.INGEST_POLL_INTERVAL if poll_interval is None else poll_interval
+        last_stale_check = 0.0
+        while not self._stop.is_set():
+            if time.time() - last_stale_check > config.INGEST_JOB_TIMEOUT / 4:
+                requeued = self.queue.requeue_stale()
+                if requeued:
+                    logger.info("Requeued %s jobs from stopped workers.", requeued)
+                last_stale_check = time.time()
+            if not self.run_once():
+                self._stop.wait(poll_interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+def start_background_worker(engine: Optional[RAGEngine] = None) -> Optional[IngestWorker]:
+    """Start the in-process worker thread once, unless a separate worker process is configured."""
+    global _background_worker
+    if config.INGEST_WORKER_MODE != "thread":
+        return None
+    with _background_worker_lock:
+        if _background_worker is None:
+            worker = IngestWorker(engine or get_shared_engine())
+
+            def run():
+                lower_ingest_priority(thread=True)
+                worker.run_forever()
+
+            threading.Thread(target=run, name="ingest-worker", daemon=True).start()
+            _background_worker = worker
+    return _background_worker
+
+
+def main():
+    metrics.setup_logging()
+    metrics.start_http_server(config.METRICS_PORT)
+    lower_ingest_priority()
+    engine = RAGEngine()
+    worker = IngestWorker(engine)
+    logger.info("Ingest worker %s polling %s", worker.worker_id, worker.queue.path)
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        logger.info("Ingest worker stopped.")
+
+
+if __name__ == "__main__":
+    main()
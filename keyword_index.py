@@ -0,0 +1,469 @@
+import heapq
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from snapshot_io import read_section, write_section
+
+
+SNAPSHOT_MAGIC = b"KWIX"
+SNAPSHOT_VERSION = 1
+# magic, version, generation, docs, terms, postings, total length, k1, b, epsilon, average idf
+SNAPSHOT_HEADER = struct.Struct("<4sIQQQQQdddd")
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokenize text the same way for indexing and querying."""
+    return text.lower().split()
+
+
+class _BM25Scorer:
+    """
+    Shared BM25 (Okapi) query path for the in-memory index and the on-disk snapshot.
+
+    Scores match rank_bm25.BM25Okapi, but a query only walks the postings of its own
+    terms and stops admitting new candidates once the remaining terms can no longer
+    lift an unseen document into the top k (MaxScore-style early termination).
+    """
+
+    k1: float
+    b: float
+    epsilon: float
+    total_len: int
+    doc_len: Sequence[int]
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def _postings(self, term: str):
+        """Mapping-like doc -> tf for a term (supports items/get/len), or None."""
+        raise NotImplementedError
+
+    def _term_bounds(self, term: str) -> Tuple[int, int]:
+        """(max tf, shortest document length) over a term's postings."""
+        raise NotImplementedError
+
+    def _average_idf(self) -> float:
+        raise NotImplementedError
+
+    def _chunk_id(self, doc: int) -> str:
+        raise NotImplementedError
+
+    def _raw_idf(self, df: int) -> float:
+        return math.log(len(self) - df + 0.5) - math.log(df + 0.5)
+
+    def _idf_from_df(self, df: int) -> float:
+        """BM25Okapi idf, with negative values floored to epsilon * average idf."""
+        if not df:
+            return 0.0
+        idf = self._raw_idf(df)
+        if idf < 0:
+            return self.epsilon * self._average_idf()
+        return idf
+
+    def idf(self, term: str) -> float:
+        postings = self._postings(term)
+        return self._idf_from_df(len(postings) if postings else 0)
+
+    def _term_score(self, tf: int, length: int, avgdl: float) -> float:
+        k1 = self.k1
+        b = self.b
+        return tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avgdl))
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Return up to k (chunk_id, score) pairs for documents containing a query term."""
+        return self.search_many([query], k)[0]
+
+    def search_many(self, queries: Sequence[str], k: int) -> List[List[Tuple[str, float]]]:
+        """
+        Search several queries, each exactly as search() would. Postings, idf and
+        score bounds of terms shared between queries are looked up once.
+        """
+        if k <= 0 or not len(self):
+            return [[] for _ in queries]
+        avgdl = self.total_len / len(self)
+        term_postings = {}
+        term_stats = {}
+        results = []
+        for query in queries:
+            tokens = tokenize(query)
+            for term in tokens:
+                if term not in term_postings:
+                    term_postings[term] = self._postings(term)
+            results.append(self._search_tokens(tokens, k, avgdl, term_postings, term_stats))
+        return results
+
+    def _search_tokens(
+        self,
+        tokens: List[str],
+        k: int,
+        avgdl: float,
+        term_postings: Dict[str, any],
+        term_stats: Dict[str, Tuple[float, float]]
+    ) -> List[Tuple[str, float]]:
+        query_terms = [term for term in tokens if term_postings[term]]
+        if not query_terms:
+            return []
+
+        doc_len = self.doc_len
+        counts = Counter(query_terms)
+        for term in counts:
+            if term not in term_stats:
+                term_stats[term] = (
+                    self._idf_from_df(len(term_postings[term])),
+                    self._term_score(*self._term_bounds(term), avgdl)
+                )
+        idfs = {term: term_stats[term][0] for term in counts}
+        weights = {term: count * idfs[term] for term, count in counts.items()}
+        prune = all(weight >= 0 for weight in weights.values())
+        bounds = {term: weights[term] * term_stats[term][1] for term in counts}
+        remaining = sum(bounds.values())
+
+        accumulators: Dict[int, float] = {}
+        admitting = True
+        for term in sorted(counts, key=lambda t: bounds[t], reverse=True):
+            remaining -= bounds[term]
+            weight = weights[term]
+            postings = term_postings[term]
+            if admitting:
+                for doc, tf in postings.items():
+                    accumulators[doc] = accumulators.get(doc, 0.0) + weight * self._term_score(tf, doc_len[doc], avgdl)
+            else:
+                for doc in accumulators:
+                    tf = postings.get(doc)
+                    if tf:
+                        accumulators[doc] += weight * self._term_score(tf, doc_len[doc], avgdl)
+
+            if prune and len(accumulators) >= k:
+                threshold = heapq.nlargest(k, accumulators.values())[-1]
+                slack = 1e-9 * (abs(threshold) + 1)
+                if remaining + slack < threshold:
+                    admitting = False
+                    accumulators = {
+                        doc: score for doc, score in accumulators.items()
+                        if score + remaining + slack >= threshold
+                    }
+
+        scores = {}
+        for doc in accumulators:
+            # Rescore in query order, as BM25Okapi sums, so scores agree to the last bit.
+            score = 0.0
+            for term in query_terms:
+                tf = term_postings[term].get(doc)
+                if tf:
+                    score += idfs[term] * self._term_score(tf, doc_len[doc], avgdl)
+            scores[doc] = score
+        top = heapq.nsmallest(k, scores, key=lambda doc: (-scores[doc], doc))
+        return [(self._chunk_id(doc), scores[doc]) for doc in top]
+
+
+class KeywordIndex(_BM25Scorer):
+    """
+    Mutable inverted BM25 index.
+
+    Documents are added and removed by chunk id; document frequencies, the average
+    document length and the idf floor are kept current without a rebuild.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.max_tf: Dict[str, int] = {}
+        self.min_len: Dict[str, int] = {}
+        self.doc_len: List[int] = []
+        self.chunk_ids: List[Optional[str]] = []
+        self.doc_terms: List[Optional[Tuple[str, ...]]] = []
+        self.doc_index: Dict[str, int] = {}
+        self.free_slots: List[int] = []
+        self.total_len = 0
+        self.df_histogram: Counter = Counter()
+        self._cached_average_idf = None
+
+    @classmethod
+    def build(cls, chunk_ids: Iterable[str], texts: Iterable[str], **kwargs) -> "KeywordIndex":
+        index = cls(**kwargs)
+        for chunk_id, text in zip(chunk_ids, texts):
+            index.add(chunk_id, text)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.doc_index)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self.doc_index
+
+    def editable(self) -> "KeywordIndex":
+        return self
+
+    def _postings(self, term: str):
+        return self.postings.get(term)
+
+    def _term_bounds(self, term: str) -> Tuple[int, int]:
+        return self.max_tf[term], self.min_len[term]
+
+    def _chunk_id(self, doc: int) -> str:
+        return self.chunk_ids[doc]
+
+    def _average_idf(self) -> float:
+        """Mean raw idf over the vocabulary, summed per distinct document frequency."""
+        if self._cached_average_idf is None:
+            total = sum(count * self._raw_idf(df) for df, count in self.df_histogram.items())
+            self._cached_average_idf = total / len(self.postings)
+        return self._cached_average_idf
+
+    def _shift_df(self, old_df: int, new_df: int):
+        if old_df:
+            self.df_histogram[old_df] -= 1
+            if not self.df_histogram[old_df]:
+                del self.df_histogram[old_df]
+        if new_df:
+            self.df_histogram[new_df] += 1
+
+    def add(self, chunk_id: str, text: str):
+        """Index a chunk, replacing any previous version with the same id."""
+        self._add_tokens(chunk_id, Counter(tokenize(text)))
+
+    def _add_tokens(self, chunk_id: str, frequencies: Dict[str, int]):
+        if chunk_id in self.doc_index:
+            self.remove(chunk_id)
+        length = sum(frequencies.values())
+        if self.free_slots:
+            doc = self.free_slots.pop()
+            self.doc_len[doc] = length
+            self.chunk_ids[doc] = chunk_id
+            self.doc_terms[doc] = tuple(frequencies)
+        else:
+            doc = len(self.doc_len)
+            self.doc_len.append(length)
+            self.chunk_ids.append(chunk_id)
+            self.doc_terms.append(tuple(frequencies))
+        self.doc_index[chunk_id] = doc
+        self.total_len += length
+        for term, tf in frequencies.items():
+            postings = self.postings.setdefault(term, {})
+            postings[doc] = tf
+            self._shift_df(len(postings) - 1, len(postings))
+            if tf > self.max_tf.get(term, 0):
+                self.max_tf[term] = tf
+            if length < self.min_len.get(term, length + 1):
+                self.min_len[term] = length
+        self._cached_average_idf = None
+
+    def add_many(self, items: Iterable[Tuple[str, str]]):
+        """Index (chunk_id, text) pairs."""
+        for chunk_id, text in items:
+            self.add(chunk_id, text)
+
+    def remove(self, chunk_id: str) -> bool:
+        """Drop a chunk from the index. Returns False if it was not indexed."""
+        doc = self.doc_index.pop(chunk_id, None)
+        if doc is None:
+            return False
+        for term in self.doc_terms[doc]:
+            postings = self.postings[term]
+            del postings[doc]
+            self._shift_df(len(postings) + 1, len(postings))
+            if not postings:
+                del self.postings[term]
+                del self.max_tf[term]
+                del self.min_len[term]
+        # max_tf/min_len are left as they were: still valid, if looser, score bounds.
+        self.total_len -= self.doc_len[doc]
+        self.doc_len[doc] = 0
+        self.chunk_ids[doc] = None
+        self.doc_terms[doc] = None
+        self.free_slots.append(doc)
+        self._cached_average_idf = None
+        return True
+
+    def save(self, path: Path, generation: int):
+        """
+        Write a compacted snapshot that KeywordSnapshot can memory-map.
+
+        Layout after the header, each section padded to 8 bytes: doc lengths (u32),
+        chunk-id offsets (u64) and UTF-8 blob, sorted term offsets (u64) and blob,
+        postings offsets (u64), per-term max tf and min length (u32), then postings
+        doc ordinals and term frequencies (u32).
+        """
+        live = sorted(self.doc_index.values())
+        renumber = {doc: new_doc for new_doc, doc in enumerate(live)}
+        terms = sorted(self.postings, key=lambda t: t.encode("utf-8"))
+
+        doc_len = array("I", (self.doc_len[doc] for doc in live))
+        chunk_blob, chunk_offsets = _pack_strings(self.chunk_ids[doc] for doc in live)
+        term_blob, term_offsets = _pack_strings(terms)
+        postings_offsets = array("Q", [0])
+        max_tf = array("I")
+        min_len = array("I")
+        postings_docs = array("I")
+        postings_tfs = array("I")
+        for term in terms:
+            postings = sorted((renumber[doc], tf) for doc, tf in self.postings[term].items())
+            postings_docs.extend(doc for doc, _ in postings)
+            postings_tfs.extend(tf for _, tf in postings)
+            postings_offsets.append(len(postings_docs))
+            max_tf.append(self.max_tf[term])
+            min_len.append(self.min_len[term])
+
+        header = SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, generation, len(live), len(terms),
+            len(postings_docs), self.total_len, self.k1, self.b, self.epsilon,
+            self._average_idf() if terms else 0.0,
+        )
+        tmp_path = Path(f"{path}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            for section in (doc_len, chunk_offsets, chunk_blob, term_offsets, term_blob,
+                            postings_offsets, max_tf, min_len, postings_docs, postings_tfs):
+                write_section(f, section)
+        os.replace(tmp_path, path)
+
+
+class _SnapshotPostings:
+    """Postings of one term as views into the mapped file; docs are sorted for bisect lookups."""
+
+    __slots__ = ("docs", "tfs")
+
+    def __init__(self, docs: memoryview, tfs: memoryview):
+        self.docs = docs
+        self.tfs = tfs
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def items(self) -> Iterator[Tuple[int, int]]:
+        return zip(self.docs, self.tfs)
+
+    def get(self, doc: int) -> Optional[int]:
+        pos = bisect_left(self.docs, doc)
+        if pos < len(self.docs) and self.docs[pos] == doc:
+            return self.tfs[pos]
+        return None
+
+
+class KeywordSnapshot(_BM25Scorer):
+    """
+    Read-only keyword index served straight from a memory-mapped snapshot file.
+
+    Nothing is copied at load time, and processes that map the same file share its
+    pages. Call editable() to get a mutable KeywordIndex before adding or removing.
+    """
+
+    def __init__(self, path: Path):
+        if sys.byteorder != "little":
+            raise ValueError("Keyword index snapshots are little-endian only")
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        self._views = [view]
+        (magic, version, self.generation, num_docs, num_terms, num_postings, self.total_len,
+         self.k1, self.b, self.epsilon, self._stored_average_idf) = SNAPSHOT_HEADER.unpack_from(view)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported keyword index snapshot: {path}")
+
+        pos = SNAPSHOT_HEADER.size
+        self.doc_len, pos = read_section(view, pos, "I", num_docs)
+        self._chunk_offsets, pos = read_section(view, pos, "Q", num_docs + 1)
+        self._chunk_blob, pos = read_section(view, pos, "B", self._chunk_offsets[num_docs])
+        self._term_offsets, pos = read_section(view, pos, "Q", num_terms + 1)
+        self._term_blob, pos = read_section(view, pos, "B", self._term_offsets[num_terms])
+        self._postings_offsets, pos = read_section(view, pos, "Q", num_terms + 1)
+        self._max_tf, pos = read_section(view, pos, "I", num_terms)
+        self._min_len, pos = read_section(view, pos, "I", num_terms)
+        self._postings_docs, pos = read_section(view, pos, "I", num_postings)
+        self._postings_tfs, pos = read_section(view, pos, "I", num_postings)
+        self._views.extend([
+            self.doc_len, self._chunk_offsets, self._chunk_blob, self._term_offsets, self._term_blob,
+            self._postings_offsets, self._max_tf, self._min_len, self._postings_docs, self._postings_tfs,
+        ])
+        self._num_docs = num_docs
+        self._num_terms = num_terms
+
+    @classmethod
+    def load(cls, path: Path) -> "KeywordSnapshot":
+        return cls(path)
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Views handed out by searches are still alive; the mapping is freed with them.
+            pass
+
+    def __len__(self) -> int:
+        return self._num_docs
+
+    def _term(self, ordinal: int) -> bytes:
+        return bytes(self._term_blob[self._term_offsets[ordinal]:self._term_offsets[ordinal + 1]])
+
+    def _term_ordinal(self, term: str) -> Optional[int]:
+        key = term.encode("utf-8")
+        lo, hi = 0, self._num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._num_terms and self._term(lo) == key:
+            return lo
+        return None
+
+    def _postings(self, term: str) -> Optional[_SnapshotPostings]:
+        ordinal = self._term_ordinal(term)
+        if ordinal is None:
+            return None
+        start = self._postings_offsets[ordinal]
+        end = self._postings_offsets[ordinal + 1]
+        return _SnapshotPostings(self._postings_docs[start:end], self._postings_tfs[start:end])
+
+    def _term_bounds(self, term: str) -> Tuple[int, int]:
+        ordinal = self._term_ordinal(term)
+        return self._max_tf[ordinal], self._min_len[ordinal]
+
+    def _average_idf(self) -> float:
+        return self._stored_average_idf
+
+    def _chunk_id(self, doc: int) -> str:
+        start = self._chunk_offsets[doc]
+        end = self._chunk_offsets[doc + 1]
+        return bytes(self._chunk_blob[start:end]).decode("utf-8")
+
+    def editable(self) -> KeywordIndex:
+        """Materialize the snapshot into a mutable KeywordIndex."""
+        index = KeywordIndex(k1=self.k1, b=self.b, epsilon=self.epsilon)
+        doc_frequencies: List[Dict[str, int]] = [{} for _ in range(self._num_docs)]
+        for ordinal in range(self._num_terms):
+            term = self._term(ordinal).decode("utf-8")
+            start = self._postings_offsets[ordinal]
+            end = self._postings_offsets[ordinal + 1]
+            for doc, tf in zip(self._postings_docs[start:end], self._postings_tfs[start:end]):
+                doc_frequencies[doc][term] = tf
+        for doc, frequencies in enumerate(doc_frequencies):
+            index._add_tokens(self._chunk_id(doc), frequencies)
+        return index
+
+
+def _pack_strings(values: Iterable[str]) -> Tuple[bytes, array]:
+    offsets = array("Q", [0])
+    parts = []
+    size = 0
+    for value in values:
+        encoded = value.encode("utf-8")
+        parts.append(encoded)
+        size += len(encoded)
+        offsets.append(size)
+    return b"".join(parts), offsets
+
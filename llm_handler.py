@@ -1,59 +1,294 @@
-from typing import List, Dict, Optional
+import json
+import logging
+import threading
+import time
+import urllib.request
+from typing import List, Dict, Optional, Iterator, Tuple
 from langchain_core.documents import Document
 from langchain_core.prompts import PromptTemplate
 from langchain_community.llms import Ollama
 
 import config
+import metrics
+import startup
+from answer_cache import SemanticAnswerCache
+from context_builder import build_context, estimate_tokens, trim_history
+from utils import get_chunk_id
+
+logger = logging.getLogger(__name__)
+
+_shared_handler = None
+_shared_handler_lock = threading.Lock()
+
+
+def get_shared_llm_handler() -> "LLMHandler":
+    """Return the process-wide LLMHandler, creating it on first use."""
+    global _shared_handler
+    if _shared_handler is None:
+        with _shared_handler_lock:
+            if _shared_handler is None:
+                _shared_handler = LLMHandler()
+    return _shared_handler
 
 
 class LLMHandler:
     def __init__(self):
         self.llm = None
+        self.answer_cache = None
         self._initialize_llm()
+        if config.LLM_WARMUP:
+            startup.STATUS.expect("llm.warmup", required=False)
+            threading.Thread(target=self._warm_up, name="llm-warmup", daemon=True).start()
+        if config.ANSWER_CACHE_ENABLED:
+            self.answer_cache = SemanticAnswerCache(
+                config.ANSWER_CACHE_PATH,
+                threshold=config.ANSWER_CACHE_SIMILARITY,
+                max_entries=config.ANSWER_CACHE_SIZE
+            )
     
     def _initialize_llm(self):
         try:
             self.llm = Ollama(
                 model=config.OLLAMA_MODEL,
+                base_url=config.OLLAMA_BASE_URL,
                 temperature=config.LLM_TEMPERATURE,
+                keep_alive=config.OLLAMA_KEEP_ALIVE,
             )
-            print(f"Initialized Ollama with model: {config.OLLAMA_MODEL}")
+            logger.info("Initialized Ollama with model: %s", config.OLLAMA_MODEL)
         except Exception as e:
-            print(f"Error initializing LLM: {e}")
+            logger.error("Error initializing LLM: %s", e)
             raise
     
+    def _warm_up(self):
+        """Have Ollama load the model now, so the first question does not pay for it."""
+        # A generate request with an empty prompt only loads the model.
+        request = urllib.request.Request(
+            f"{config.OLLAMA_BASE_URL.rstrip('/')}/api/generate",
+            data=json.dumps({
+                'model': config.OLLAMA_MODEL, 'prompt': "", 'stream': False, 'keep_alive': config.OLLAMA_KEEP_ALIVE
+            }).encode("utf-8"),
+            headers={'Content-Type': "application/json"}
+        )
+        try:
+            with startup.STATUS.stage("llm.warmup", required=False):
+                with urllib.request.urlopen(request, timeout=config.LLM_WARMUP_TIMEOUT) as response:
+                    response.read()
+            logger.info("Ollama model %s loaded.", config.OLLAMA_MODEL)
+        except Exception as e:
+            logger.warning("LLM warm-up failed: %s", e)
+
+    def cache_stats(self) -> Dict[str, any]:
+        """Answer cache hit rate and total generation time saved."""
+        return self.answer_cache.stats() if self.answer_cache is not None else {}
+
     def generate_answer(
         self, 
         query: str, 
         context_docs: List[Document],
-        chat_history: Optional[List[Dict[str, str]]] = None
+        chat_history: Optional[List[Dict[str, str]]] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> Dict[str, any]:
+        """
+        Answer a question from the retrieved chunks. When the query embedding is given,
+        a cached answer for a near-identical question over the same chunks is reused.
+        """
+        final = {}
+        for event in self.stream_answer(query, context_docs, chat_history, query_embedding):
+            if event['type'] == 'final':
+                final = event
+        return {key: value for key, value in final.items() if key != 'type'}
+
+    def stream_answer(
+        self,
+        query: str,
+        context_docs: List[Document],
+        chat_history: Optional[List[Dict[str, str]]] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> Iterator[Dict[str, any]]:
+        """
+        Stream an answer: yields {'type': 'token', 'text': ...} events as the model produces
+        them, then one {'type': 'final', ...} record with the full answer, sources, timings
+        (time to first token and total generation time, in seconds), the request's trace id
+        and its per-stage timings. The active trace (e.g. one that also covered the search)
+        is continued, otherwise a new one is started.
+        """
+        trace = metrics.current_trace() or metrics.Trace()
+        return metrics.traced_iterator(trace, self._stream_answer(trace, query, context_docs, chat_history, query_embedding))
+
+    def _stream_answer(
+        self,
+        trace: metrics.Trace,
+        query: str,
+        context_docs: List[Document],
+        chat_history: Optional[List[Dict[str, str]]],
+        query_embedding: Optional[List[float]]
+    ) -> Iterator[Dict[str, any]]:
+        started = time.time()
         if not context_docs:
-            return {
+            metrics.ANSWERS.inc(outcome="no_context")
+            yield {
+                'type': 'final',
                 'answer': "Tôi không tìm thấy thông tin liên quan trong tài liệu để trả lời câu hỏi này.",
-                'sources': []
+                'sources': [],
+                'cached': False,
+                'timings': {'time_to_first_token': 0.0, 'total': 0.0},
+                'trace_id': trace.trace_id,
+                'stages': trace.stages()
+            }
+            return
+
+        with metrics.span("answer.prompt"):
+            formatted_prompt, sources, prompt_tokens = self._build_prompt(query, context_docs, chat_history)
+
+        context_key = None
+        if self.answer_cache is not None and query_embedding is not None:
+            # The same chunks answer differently in another conversation.
+            context_key = SemanticAnswerCache.context_key(
+                config.OLLAMA_MODEL, [get_chunk_id(doc) for doc in context_docs], self._prompt_history(chat_history)
+            )
+            with metrics.span("answer.cache_lookup"):
+                cached = self.answer_cache.lookup(query_embedding, context_key)
+            if cached is not None:
+                logger.info(
+                    "Answer cache hit (similarity %.3f, %.1fs of generation saved so far)",
+                    cached['similarity'], self.answer_cache.latency_saved
+                )
+                metrics.ANSWERS.inc(outcome="cached")
+                elapsed = time.time() - started
+                yield {'type': 'token', 'text': cached['answer']}
+                yield {
+                    'type': 'final',
+                    'answer': cached['answer'],
+                    'sources': sources,
+                    'cached': True,
+                    'prompt_tokens': prompt_tokens,
+                    'timings': {'time_to_first_token': elapsed, 'total': elapsed},
+                    'trace_id': trace.trace_id,
+                    'stages': trace.stages()
+                }
+                return
+
+        parts = []
+        first_token_at = None
+        generation_started = time.time()
+        try:
+            for chunk in self.llm.stream(formatted_prompt):
+                text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                if not text:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.time()
+                    metrics.observe_stage("answer.first_token", first_token_at - generation_started)
+                    metrics.TIME_TO_FIRST_TOKEN.observe(first_token_at - started)
+                metrics.LLM_TOKENS.inc()
+                parts.append(text)
+                yield {'type': 'token', 'text': text}
+        except Exception as e:
+            logger.error("Error generating answer: %s", e)
+            metrics.ANSWERS.inc(outcome="error")
+            metrics.observe_stage("answer.generate", time.time() - generation_started)
+            yield {
+                'type': 'final',
+                'answer': f"Xin lỗi, đã xảy ra lỗi khi tạo câu trả lời: {str(e)}",
+                'sources': sources,
+                'cached': False,
+                'prompt_tokens': prompt_tokens,
+                'timings': self._timings(started, first_token_at),
+                'trace_id': trace.trace_id,
+                'stages': trace.stages()
             }
+            return
+
+        metrics.observe_stage("answer.generate", time.time() - generation_started)
+        metrics.ANSWERS.inc(outcome="generated")
+        answer_text = "".join(parts).strip()
+        timings = self._timings(started, first_token_at)
+        logger.info(
+            "Answer generated: first token %.2fs, total %.2fs",
+            timings['time_to_first_token'], timings['total']
+        )
+        if context_key is not None:
+            self.answer_cache.put(query_embedding, context_key, answer_text, timings['total'])
+        yield {
+            'type': 'final',
+            'answer': answer_text,
+            'sources': sources,
+            'cached': False,
+            'prompt_tokens': prompt_tokens,
+            'timings': timings,
+            'trace_id': trace.trace_id,
+            'stages': trace.stages()
+        }
+
+    @staticmethod
+    def _timings(started: float, first_token_at: Optional[float]) -> Dict[str, float]:
+        finished = time.time()
+        return {
+            'time_to_first_token': (first_token_at or finished) - started,
+            'total': finished - started
+        }
+
+    def _build_prompt(
+        self,
+        query: str,
+        context_docs: List[Document],
+        chat_history: Optional[List[Dict[str, str]]]
+    ) -> Tuple[str, List[Dict[str, any]], Dict[str, int]]:
+        """
+        Format the answer prompt within the context and history token budgets.
+        Returns the prompt, the sources it cites and the estimated prompt tokens
+        before and after budgeting.
+        """
+        full_prompt = self._format_prompt(
+            query, [(doc, doc.page_content) for doc in context_docs], self._recent_history(chat_history)
+        )
+        context = build_context(query, context_docs)
+        formatted_prompt = self._format_prompt(query, context['chunks'], self._prompt_history(chat_history))
+
+        sources = [
+            {
+                'source': doc.metadata.get('source', 'Unknown'),
+                'page': doc.metadata.get('page', 0) + 1,
+                'content': doc.page_content
+            }
+            for doc, _ in context['chunks']
+        ]
+        prompt_tokens = {
+            'before': estimate_tokens(full_prompt),
+            'after': estimate_tokens(formatted_prompt)
+        }
+        logger.debug(
+            "Prompt tokens: %s -> %s (%s of %s chunks dropped)",
+            prompt_tokens['before'], prompt_tokens['after'], context['dropped'], len(context_docs)
+        )
+        return formatted_prompt, sources, prompt_tokens
+
+    @staticmethod
+    def _recent_history(chat_history: Optional[List[Dict[str, str]]]) -> List[Dict[str, str]]:
+        return (chat_history or [])[-3:]
 
+    @classmethod
+    def _prompt_history(cls, chat_history: Optional[List[Dict[str, str]]]) -> List[Dict[str, str]]:
+        """The chat turns the prompt carries: the last three, trimmed to the history budget."""
+        return trim_history(cls._recent_history(chat_history))
+
+    @staticmethod
+    def _format_prompt(
+        query: str,
+        chunks: List[Tuple[Document, str]],
+        chat_history: List[Dict[str, str]]
+    ) -> str:
         context_parts = []
-        sources = []
-        
-        for i, doc in enumerate(context_docs, 1):
+        for i, (doc, content) in enumerate(chunks, 1):
             source_name = doc.metadata.get('source', 'Unknown')
             page_num = doc.metadata.get('page', 0) + 1
-            content = doc.page_content
-            
             context_parts.append(f"[Tài liệu {i}] {source_name} (trang {page_num}):\n{content}")
-            sources.append({
-                'source': source_name,
-                'page': page_num,
-                'content': content
-            })
         
         context = "\n\n".join(context_parts)
         history_text = ""
-        if chat_history and len(chat_history) > 0:
+        if chat_history:
             history_parts = []
-            for msg in chat_history[-3:]: 
+            for msg in chat_history:
                 role = "Người dùng" if msg['role'] == 'user' else "Trợ lý"
                 history_parts.append(f"{role}: {msg['content']}")
             history_text = "\n".join(history_parts)
@@ -83,29 +318,8 @@ Câu trả lời:"""
             template=template,
             input_variables=["context", "question", "history_section"]
         )
-
-        try:
-            formatted_prompt = prompt.format(
-                context=context,
-                question=query,
-                history_section=history_section
-            )
-            
-            answer = self.llm.invoke(formatted_prompt)
-
-            if hasattr(answer, 'content'):
-                answer_text = answer.content
-            else:
-                answer_text = str(answer)
-            
-            return {
-                'answer': answer_text.strip(),
-                'sources': sources
-            }
-        
-        except Exception as e:
-            print(f"Error generating answer: {e}")
-            return {
-                'answer': f"Xin lỗi, đã xảy ra lỗi khi tạo câu trả lời: {str(e)}",
-                'sources': sources
-            }
\ No newline at end of file
+        return prompt.format(
+            context=context,
+            question=query,
+            history_section=history_section
+        )
@@ -0,0 +1,303 @@
+"""
+In-process metrics and per-request traces.
+
+    with metrics.span("search.semantic"):
+        ...
+
+Every span feeds the rag_stage_seconds histogram and, when a trace is active,
+is recorded on it, so an answer can report where its time went next to its
+trace id. Counters and histograms render in the Prometheus text format
+(render_prometheus, served by api.py at /metrics or by start_http_server).
+With METRICS_ENABLED off, span() returns a shared no-op context manager and
+counters return immediately; traces still carry an id.
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("rag_trace", default=None)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not config.METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(label, "")) for label in self.labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = config.METRICS_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        if not config.METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(tuple(str(labels.get(label, "")) for label in self.labels))
+        return sum(entry[0]) if entry else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labels + ("le",), key + (le,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent in each pipeline stage.", ["stage"])
+STAGE_ERRORS = Counter("rag_stage_errors_total", "Pipeline stages that raised an exception.", ["stage"])
+SEARCHES = Counter("rag_searches_total", "Searches by type and whether the result cache answered them.", ["search_type", "cache"])
+SEARCH_LEG_DEGRADED = Counter("rag_search_leg_degraded_total", "Hybrid legs that timed out or failed.", ["leg"])
+INGESTED_FILES = Counter("rag_ingested_files_total", "Ingested PDFs by outcome.", ["status"])
+INGESTED_CHUNKS = Counter("rag_ingested_chunks_total", "Chunks stored by ingestion, by diff outcome.", ["kind"])
+ANSWERS = Counter("rag_answers_total", "Answers by outcome.", ["outcome"])
+LLM_TOKENS = Counter("rag_llm_stream_chunks_total", "Streamed LLM output chunks.")
+TIME_TO_FIRST_TOKEN = Histogram("rag_time_to_first_token_seconds", "Time from answer start to the first LLM token.")
+EMBEDDING_MICROBATCH = Histogram(
+    "rag_embedding_microbatch_size", "Queries merged into one embedding forward pass.", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+
+REGISTRY = [
+    STAGE_SECONDS, STAGE_ERRORS, SEARCHES, SEARCH_LEG_DEGRADED,
+    INGESTED_FILES, INGESTED_CHUNKS, ANSWERS, LLM_TOKENS, TIME_TO_FIRST_TOKEN, EMBEDDING_MICROBATCH,
+]
+
+
+def render_prometheus() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """Stage timings of one request; spans from worker threads join through contextvars."""
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float, float]] = []
+
+    def record(self, stage: str, start: float, duration: float):
+        self.spans.append((stage, start - self.started, duration))
+
+    def stages(self) -> List[Dict[str, any]]:
+        """Recorded spans in start order, offsets and durations in milliseconds."""
+        return [
+            {'stage': stage, 'start_ms': round(offset * 1000, 3), 'duration_ms': round(duration * 1000, 3)}
+            for stage, offset, duration in sorted(self.spans, key=lambda span: span[1])
+        ]
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+@contextmanager
+def use_trace(trace: Optional[Trace]):
+    """Make trace the active trace for the duration of the block."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def traced_iterator(trace: Trace, iterator: Iterator) -> Iterator:
+    """Resume a generator with trace active, whichever thread pulls the next item."""
+    while True:
+        with use_trace(trace):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def in_context(func: Callable) -> Callable:
+    """Bind func to the caller's context so spans it opens on a pool thread join the caller's trace."""
+    if not config.METRICS_ENABLED:
+        return func
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+
+class _Span:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(duration, stage=self.stage)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(stage=self.stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.record(self.stage, self.started, duration)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(stage: str):
+    """Time a pipeline stage: `with span("search.keyword"): ...`."""
+    if not config.METRICS_ENABLED:
+        return _NOOP_SPAN
+    return _Span(stage)
+
+
+def observe_stage(stage: str, seconds: float):
+    """Record a stage that was timed by hand, e.g. time to first token inside a generator."""
+    if not config.METRICS_ENABLED:
+        return
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(stage, time.perf_counter() - seconds, seconds)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def start_http_server(port: Optional[int] = None, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics on its own port once per process (for the Streamlit app and the ingest worker)."""
+    global _exporter
+    port = config.METRICS_PORT if port is None else port
+    if not port:
+        return None
+    with _exporter_lock:
+        if _exporter is None:
+            try:
+                _exporter = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                logger.warning("Metrics exporter not started on port %s: %s", port, e)
+                return None
+            threading.Thread(target=_exporter.serve_forever, name="metrics-exporter", daemon=True).start()
+            logger.info("Metrics exporter listening on :%s/metrics", port)
+    return _exporter
+
+
+class _TraceIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id() or "-"
+        return True
+
+
+def setup_logging(level: Optional[str] = None):
+    """Log to stderr with the active trace id on every line; safe to call more than once."""
+    root = logging.getLogger()
+    if not any(getattr(handler, "_rag_handler", False) for handler in root.handlers):
+        handler = logging.StreamHandler()
+        handler._rag_handler = True
+        handler.addFilter(_TraceIdFilter())
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s"))
+        root.addHandler(handler)
+    root.setLevel((level or config.LOG_LEVEL).upper())
@@ -1,176 +1,635 @@
-﻿import os
+import os
 import hashlib
+import logging
+import threading
 import time
-from typing import List, Dict, Tuple, Optional
+from concurrent.futures import (
+    Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+)
+from typing import List, Dict, Tuple, Optional, Callable
 from pathlib import Path
 import json
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_core.documents import Document
-from rank_bm25 import BM25Okapi
 
 import config
-from utils import clean_text, reciprocal_rank_fusion
+import embedding_backends
+import metrics
+import startup
+from embedding_cache import EmbeddingCache
+from ingest_queue import IngestQueue
+from keyword_index import KeywordIndex, KeywordSnapshot
+from vector_backends import create_vector_backend
+from utils import (
+    clean_text, reciprocal_rank_fusion, calculate_file_hash, peak_memory_mb,
+    ReadWriteLock, LRUCache, normalize_query
+)
+
+logger = logging.getLogger(__name__)
+
+_shared_engine = None
+_shared_engine_lock = threading.Lock()
+
+
+def _make_text_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", " ", ""]
+    )
+
+
+def lower_ingest_priority(thread: bool = False):
+    """
+    Drop the scheduling priority of ingestion work by INGEST_NICE so searches keep
+    their latency while parsing and embedding saturate the other cores. With thread
+    set, only the calling thread is affected (Linux); elsewhere this is a no-op.
+    """
+    try:
+        if thread:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), config.INGEST_NICE)
+        else:
+            os.nice(config.INGEST_NICE)
+    except (AttributeError, OSError):
+        pass
+
+
+def _load_pdf_chunks(pdf_path: str, chunk_size: int, chunk_overlap: int) -> Tuple[int, List[Tuple[str, Dict]], float]:
+    """Parse, clean and split one PDF. Runs in an ingest worker process; also returns the seconds it took."""
+    started = time.perf_counter()
+    pages = PyPDFLoader(pdf_path).load()
+    for page in pages:
+        page.page_content = clean_text(page.page_content)
+    chunks = _make_text_splitter(chunk_size, chunk_overlap).split_documents(pages)
+    return len(pages), [(chunk.page_content, chunk.metadata) for chunk in chunks], time.perf_counter() - started
+
+
+def get_shared_engine() -> "RAGEngine":
+    """Return the process-wide RAGEngine, creating it on first use."""
+    global _shared_engine
+    if _shared_engine is None:
+        with _shared_engine_lock:
+            if _shared_engine is None:
+                _shared_engine = RAGEngine()
+    return _shared_engine
+
 
 class RAGEngine:
+    """
+    Retrieval engine shared by every session in the process.
+
+    Searches hold a read lock on the indexes and run concurrently; ingestion is
+    serialized by a separate lock and only takes the write lock for the short
+    index updates, so searches keep running while PDFs are parsed and embedded.
+
+    The embedding model loads in the background: the constructor returns once
+    the vector store and keyword index are open, keyword search works at once,
+    hybrid search uses only its keyword leg until the model is there, and anything
+    else that embeds waits for it. startup.STATUS reports progress.
+    """
+
     def __init__(self):
-        print("Initializing RAGEngine...")
-        self.embeddings = None
+        logger.info("Initializing RAGEngine...")
+        for stage in ("embeddings.load", "vector_store.connect", "keyword_index.load", "pdf_scan"):
+            startup.STATUS.expect(stage)
+        if config.EMBEDDING_WARMUP:
+            startup.STATUS.expect("embeddings.warmup", required=False)
+        self._embeddings = None
+        self._embeddings_future = None
+        self.embedding_cache = None
         self.vector_store = None
-        self.client = None
         self.bm25_index = None
-        self.bm25_documents = [] 
-        print(f"Initializing Text Splitter (Size: {config.CHUNK_SIZE}, Overlap: {config.CHUNK_OVERLAP})")
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=config.CHUNK_SIZE,
-            chunk_overlap=config.CHUNK_OVERLAP,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
+        self._bm25_dirty = False
+        self._index_lock = ReadWriteLock()
+        self._ingest_lock = threading.Lock()
+        self._search_pool = ThreadPoolExecutor(max_workers=config.SEARCH_WORKERS, thread_name_prefix="search")
+        # Startup work gets its own threads, so a slow model load never holds up search legs.
+        self._startup_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="startup")
+        self._query_embedding_cache = LRUCache(config.QUERY_EMBEDDING_CACHE_SIZE)
+        self._result_cache = LRUCache(config.SEARCH_CACHE_SIZE, ttl=config.SEARCH_CACHE_TTL)
+        # The model load and the vector store connection dominate startup; run them side by side.
         self._initialize_embeddings()
-        self._initialize_qdrant()
-        if self.client:
+        store_future = self._startup_pool.submit(self._initialize_vector_store)
+        self.manifest = self._load_manifest()
+        self._manifest_mtime = self._stat_manifest()
+        self._last_refresh = time.time()
+        self._snapshot_pending = False
+        self._manifest_sources = {}
+        self._index_manifest_sources()
+        logger.info("Initializing Text Splitter (Size: %s, Overlap: %s)", config.CHUNK_SIZE, config.CHUNK_OVERLAP)
+        self.text_splitter = _make_text_splitter(config.CHUNK_SIZE, config.CHUNK_OVERLAP)
+        store_future.result()
+        if self.vector_store:
             try:
-                info = self.client.get_collection(config.QDRANT_COLLECTION_NAME)
-                print(f"Connected to Qdrant collection '{config.QDRANT_COLLECTION_NAME}'. Points: {info.points_count}")
+                points_count = self.vector_store.count()
+                logger.info("Vector store '%s' ready. Points: %s", self.vector_store.name, points_count)
+                if not points_count and self.manifest['files']:
+                    logger.info("Collection is empty, resetting ingestion manifest.")
+                    self._reset_manifest()
             except Exception as e:
-                print(f"Warning: Could not get collection info: {e}")
-        self.scan_and_process_pdfs()
-        self._build_bm25_index() 
+                logger.warning("Could not get collection info: %s", e)
+        with startup.STATUS.stage("keyword_index.load"):
+            if not self._load_bm25_snapshot():
+                self._build_bm25_index()
+        # New PDFs go to the ingest worker instead of holding up startup.
+        with startup.STATUS.stage("pdf_scan"):
+            self.scan_and_process_pdfs(background=True)
+        self.persist_keyword_index()
+        # Threads exit once the model load finishes.
+        self._startup_pool.shutdown(wait=False)
+
+    @property
+    def embeddings(self):
+        """The embedding model; waits for the background load on first use."""
+        if self._embeddings is None and self._embeddings_future is not None:
+            self._embeddings = self._embeddings_future.result()
+        return self._embeddings
+
+    @embeddings.setter
+    def embeddings(self, embeddings):
+        self._embeddings = embeddings
+
+    @property
+    def embeddings_ready(self) -> bool:
+        """Whether using the embedding model would return without waiting for it to load."""
+        return self._embeddings is not None or self._embeddings_future is None or self._embeddings_future.done()
+
     def _initialize_embeddings(self):
-        """Initialize the embedding model."""
+        """Start loading the embedding model in the background and open the embedding cache."""
+        self._embeddings_future = self._startup_pool.submit(self._load_embeddings)
+        if config.EMBEDDING_CACHE_ENABLED:
+            try:
+                self.embedding_cache = EmbeddingCache(
+                    config.EMBEDDING_CACHE_DIR, embedding_backends.model_id(), dtype=config.EMBEDDING_CACHE_DTYPE
+                )
+                logger.info("Embedding cache ready with %s vectors.", len(self.embedding_cache))
+            except Exception as e:
+                logger.warning("Embedding cache disabled: %s", e)
+
+    def _load_embeddings(self):
         try:
-            print(f"Loading embedding model: {config.EMBEDDING_MODEL_NAME}")
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name=config.EMBEDDING_MODEL_NAME,
-                model_kwargs={'device': config.EMBEDDING_DEVICE},
-                encode_kwargs={'normalize_embeddings': True}
-            )
-            print("Embedding model loaded successfully!")
+            with startup.STATUS.stage("embeddings.load"):
+                logger.info("Loading embedding model: %s (%s)", config.EMBEDDING_MODEL_NAME, config.EMBEDDING_BACKEND)
+                embeddings = self._create_embeddings()
+            logger.info("Embedding model loaded successfully!")
         except Exception as e:
-            print(f"CRITICAL ERROR loading embeddings: {e}")
+            logger.critical("Error loading embeddings: %s", e)
+            if config.EMBEDDING_WARMUP:
+                startup.STATUS.fail("embeddings.warmup", "embedding model not loaded", required=False)
             raise
-
-    def _initialize_qdrant(self):
-        """Initialize Qdrant connection with retry logic."""
-        max_retries = 3
-        for attempt in range(max_retries):
+        if config.EMBEDDING_WARMUP:
+            # The first encode pays for lazy initialization inside the model; do it before a user query does.
             try:
-                print(f"Connecting to Qdrant at {config.QDRANT_URL} (Attempt {attempt+1}/{max_retries})...")
-                self.client = QdrantClient(
-                    url=config.QDRANT_URL, 
-                    api_key=config.QDRANT_API_KEY if config.QDRANT_API_KEY else None
-                )
-                try:
-                    self.client.get_collection(config.QDRANT_COLLECTION_NAME)
-                    print(f"Collection '{config.QDRANT_COLLECTION_NAME}' exists.")
-                except Exception:
-                    print(f"Collection '{config.QDRANT_COLLECTION_NAME}' not found. Creating...")
-                    self.client.create_collection(
-                        collection_name=config.QDRANT_COLLECTION_NAME,
-                        vectors_config=models.VectorParams(
-                            size=384,
-                            distance=models.Distance.COSINE
-                        )
-                    )
-                    print("Collection created.")
-                self.vector_store = QdrantVectorStore(
-                    client=self.client,
-                    embedding=self.embeddings,
-                    collection_name=config.QDRANT_COLLECTION_NAME
-                )
-                print("Qdrant Vector Store initialized successfully!")
-                return
-                
+                with startup.STATUS.stage("embeddings.warmup", required=False):
+                    embeddings.embed_query("khởi động")
             except Exception as e:
-                print(f"Error connecting to Qdrant: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(2)
-        
-        print("FAILED to initialize Qdrant after retries.")
-        self.vector_store = None
+                logger.warning("Embedding warm-up failed: %s", e)
+        if config.EMBEDDING_MICROBATCH:
+            embeddings = embedding_backends.MicroBatcher(embeddings)
+        return embeddings
 
-    def scan_and_process_pdfs(self) -> int:
-        """Scan upload directory and process new PDFs."""
+    def _create_embeddings(self):
+        return embedding_backends.create_embeddings()
+
+    def _initialize_vector_store(self):
+        """Open the vector backend selected by VECTOR_STORE_TYPE."""
+        try:
+            with startup.STATUS.stage("vector_store.connect"):
+                self.vector_store = create_vector_backend(config.VECTOR_STORE_TYPE)
+            logger.info("Vector store initialized successfully!")
+        except Exception as e:
+            logger.error("Failed to initialize vector store: %s", e)
+            self.vector_store = None
+
+    def _ingest_fingerprint(self) -> str:
+        """Identify the settings that determine which chunks and vectors a PDF produces."""
+        return "|".join([
+            config.CHUNKER_VERSION,
+            config.CHUNK_ID_VERSION,
+            str(config.CHUNK_SIZE),
+            str(config.CHUNK_OVERLAP),
+            embedding_backends.model_id(),
+            config.QDRANT_URL,
+            config.QDRANT_COLLECTION_NAME,
+        ])
+
+    def _load_manifest(self, verbose: bool = True) -> Dict[str, any]:
+        """Load the ingestion manifest, discarding it if the ingest settings changed."""
+        fingerprint = self._ingest_fingerprint()
+        generation = 0
+        try:
+            with open(config.INGEST_MANIFEST_PATH, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            manifest.setdefault('files', {})
+            manifest.setdefault('generation', 0)
+            if manifest.get('fingerprint') == fingerprint:
+                if verbose:
+                    logger.info("Loaded ingestion manifest with %s files.", len(manifest['files']))
+                return manifest
+            logger.warning("Ingestion settings changed, previous manifest ignored.")
+            generation = manifest['generation'] + 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error("Error reading ingestion manifest: %s", e)
+        return {'fingerprint': fingerprint, 'generation': generation, 'files': {}}
+
+    def _save_manifest(self):
+        """Atomically write the ingestion manifest to disk."""
+        try:
+            tmp_path = config.INGEST_MANIFEST_PATH.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, config.INGEST_MANIFEST_PATH)
+            self._manifest_mtime = self._stat_manifest()
+        except Exception as e:
+            logger.error("Error saving ingestion manifest: %s", e)
+
+    @staticmethod
+    def _stat_manifest() -> Optional[int]:
+        try:
+            return os.stat(config.INGEST_MANIFEST_PATH).st_mtime_ns
+        except OSError:
+            return None
+
+    def refresh(self):
+        """
+        Pick up ingestion done by another process (the ingest worker): reload the
+        manifest, let the vector store see appended data, and map the keyword index
+        snapshot of the new generation once the worker has written it. Checked at
+        most every INDEX_REFRESH_INTERVAL seconds; costs one stat() otherwise.
+        """
+        now = time.time()
+        if now - self._last_refresh < config.INDEX_REFRESH_INTERVAL:
+            return
+        self._last_refresh = now
+        mtime = self._stat_manifest()
+        if mtime == self._manifest_mtime and not self._snapshot_pending:
+            return
+        if not self._ingest_lock.acquire(blocking=False):
+            # Ingesting in this process: the manifest on disk is our own.
+            return
+        try:
+            if mtime != self._manifest_mtime:
+                manifest = self._load_manifest(verbose=False)
+                with self._index_lock.write_locked():
+                    self.manifest = manifest
+                    self._manifest_mtime = mtime
+                    self._index_manifest_sources()
+                    # Searches see the new generation but the old keyword index until the
+                    # worker's snapshot is mapped; their results must not be cached under it.
+                    self._snapshot_pending = True
+                if self.vector_store:
+                    self.vector_store.refresh()
+                logger.info("Collection changed by another process, now at generation %s.", self.generation)
+            if self._snapshot_pending and self._bm25_snapshot_path(self.generation).exists():
+                previous = self.bm25_index
+                if self._load_bm25_snapshot():
+                    self._snapshot_pending = False
+                    # Entries of older generations can no longer be hit.
+                    self._result_cache.clear()
+                    if isinstance(previous, KeywordSnapshot) and previous is not self.bm25_index:
+                        previous.close()
+        finally:
+            self._ingest_lock.release()
+
+    def _reset_manifest(self):
+        """Forget every ingested file."""
+        self.manifest = {
+            'fingerprint': self._ingest_fingerprint(),
+            'generation': self.manifest.get('generation', 0) + 1,
+            'files': {},
+        }
+        self._manifest_sources = {}
+        self._save_manifest()
+
+    def _index_manifest_sources(self):
+        """Map source file names to their manifest hash for stat-based lookups."""
+        self._manifest_sources = {
+            entry['source']: file_hash for file_hash, entry in self.manifest['files'].items()
+        }
+
+    def _file_hash(self, pdf_path: str) -> str:
+        """Return the content hash of a PDF, skipping the read when size and mtime match the manifest."""
+        stat = os.stat(pdf_path)
+        file_hash = self._manifest_sources.get(os.path.basename(pdf_path))
+        entry = self.manifest['files'].get(file_hash) if file_hash else None
+        if entry and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+            return file_hash
+        return calculate_file_hash(pdf_path)
+
+    def _record_ingested(self, pdf_path: str, file_hash: str, chunk_count: int):
+        """Add a successfully ingested PDF to the manifest, replacing older versions of the same file."""
+        stat = os.stat(pdf_path)
+        pdf_name = os.path.basename(pdf_path)
+        self._forget_source(pdf_name)
+        self.manifest['files'][file_hash] = {
+            'source': pdf_name,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'chunks': chunk_count,
+            'ingested_at': time.time(),
+        }
+        self._manifest_sources[pdf_name] = file_hash
+        self.manifest['generation'] += 1
+        self._save_manifest()
+
+    def _forget_source(self, pdf_name: str) -> bool:
+        """Drop every manifest entry for this file name; the caller saves the manifest."""
+        stale = [file_hash for file_hash, entry in self.manifest['files'].items() if entry['source'] == pdf_name]
+        for file_hash in stale:
+            del self.manifest['files'][file_hash]
+        self._manifest_sources.pop(pdf_name, None)
+        return bool(stale)
+
+    @property
+    def generation(self) -> int:
+        """Counter that moves whenever the collection contents change."""
+        return self.manifest['generation']
+
+    def is_ingested(self, pdf_path: str) -> bool:
+        """Check whether this exact file content was already ingested with the current settings."""
+        try:
+            return self._file_hash(pdf_path) in self.manifest['files']
+        except OSError:
+            return False
+
+    def scan_and_process_pdfs(self, background: bool = False) -> int:
+        """
+        Scan upload directory and process new PDFs. With background set, or when a
+        separate ingest worker process is configured, new files are queued for the
+        ingest worker instead.
+        """
         if not config.PDF_UPLOAD_DIR.exists():
             config.PDF_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
             return 0
             
-        print(f"Scanning {config.PDF_UPLOAD_DIR} for new PDFs...")
-        pdf_files = list(config.PDF_UPLOAD_DIR.glob("*.pdf"))
-        processed_count = 0
-        
-        for pdf_path in pdf_files:
-            try:
-                chunks = self.process_pdf(str(pdf_path))
-                if chunks > 0:
-                    processed_count += 1
-            except Exception as e:
-                print(f"Error auto-processing {pdf_path.name}: {e}")
-                
-        return processed_count
+        logger.info("Scanning %s for new PDFs...", config.PDF_UPLOAD_DIR)
+        pdf_files = [str(pdf_path) for pdf_path in config.PDF_UPLOAD_DIR.glob("*.pdf")]
+        if background or config.INGEST_WORKER_MODE == "process":
+            new_files = [pdf_path for pdf_path in pdf_files if not self.is_ingested(pdf_path)]
+            if new_files:
+                IngestQueue().enqueue(new_files)
+                logger.info("Scan complete: %s new files queued for the ingest worker.", len(new_files))
+            return 0
+        stats = self.ingest_pdfs(pdf_files)
+        logger.info("Scan complete: %s processed, %s unchanged files skipped.", stats['files'], stats['skipped'])
+        return stats['files']
     
-    def process_pdf(self, pdf_path: str) -> int:
+    def process_pdf(self, pdf_path: str, force: bool = False) -> int:
+        """
+        Process a PDF file and add it to the knowledge base.
+        Files already listed in the ingestion manifest are skipped unless force is set.
+        """
+        stats = self.ingest_pdfs([pdf_path], force=force)
+        return stats['per_file'].get(os.path.basename(pdf_path), 0)
+
+    def ingest_pdfs(
+        self,
+        pdf_paths: List[str],
+        force: bool = False,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        file_callback: Optional[Callable[[str, Dict[str, any]], None]] = None
+    ) -> Dict[str, any]:
         """
-        Process a PDF file and add it to the Qdrant knowledge base.
+        Ingest many PDFs through a pipeline: parsing and cleaning run in a process pool,
+        embeddings are computed in batches as files finish, and vector store upserts go out in
+        bounded concurrent batches. Returns counts and pages/sec, chunks/sec throughput.
+        file_callback(pdf_path, {'status', 'chunks', 'error'}) reports each file's outcome
+        (done, skipped or failed) as soon as it is known.
         """
-        print(f"Processing PDF: {os.path.basename(pdf_path)}")
+        callback = file_callback or (lambda *_: None)
+
+        def report(pdf_path: str, result: Dict[str, any]):
+            metrics.INGESTED_FILES.inc(status=result['status'])
+            callback(pdf_path, result)
+
+        with self._ingest_lock:
+            return self._ingest_pdfs(pdf_paths, force, progress_callback, report)
+
+    def _ingest_pdfs(
+        self,
+        pdf_paths: List[str],
+        force: bool,
+        progress_callback: Optional[Callable[[int, int], None]],
+        file_callback: Callable[[str, Dict[str, any]], None]
+    ) -> Dict[str, any]:
+        stats = {'files': 0, 'skipped': 0, 'failed': 0, 'pages': 0, 'chunks': 0, 'per_file': {}}
+        pending = []
+        for pdf_path in pdf_paths:
+            try:
+                file_hash = self._file_hash(pdf_path)
+            except OSError as e:
+                logger.error("Error reading PDF %s: %s", pdf_path, e)
+                stats['failed'] += 1
+                file_callback(pdf_path, {'status': 'failed', 'chunks': 0, 'error': str(e)})
+                continue
+            if not force and file_hash in self.manifest['files']:
+                logger.info("Skipping %s: already ingested.", os.path.basename(pdf_path))
+                stats['skipped'] += 1
+                file_callback(pdf_path, {'status': 'skipped', 'chunks': 0, 'error': None})
+                continue
+            pending.append((pdf_path, file_hash))
+
+        if not pending:
+            return self._ingest_throughput(stats, 0.0)
+        if not self.vector_store:
+            logger.warning("Vector store is not available for ingestion.")
+            stats['failed'] += len(pending)
+            for pdf_path, _ in pending:
+                file_callback(pdf_path, {'status': 'failed', 'chunks': 0, 'error': "Vector store not available"})
+            return self._ingest_throughput(stats, 0.0)
+
+        started = time.time()
+        workers = min(config.INGEST_WORKERS, len(pending))
+        parse_pool = ProcessPoolExecutor(max_workers=workers, initializer=lower_ingest_priority) if workers > 1 else None
+        upsert_pool = ThreadPoolExecutor(max_workers=config.UPSERT_CONCURRENCY, thread_name_prefix="upsert")
+        in_flight = threading.BoundedSemaphore(config.UPSERT_CONCURRENCY * 2)
         try:
-            loader = PyPDFLoader(pdf_path)
-            pages = loader.load()
-            print(f"Loaded {len(pages)} pages.")
-        except Exception as e:
-            print(f"Error loading PDF: {e}")
-            return 0
-        for page in pages:
-            page.page_content = clean_text(page.page_content)
-        chunks = self.text_splitter.split_documents(pages)
-        print(f"Split into {len(chunks)} chunks.")
-        
-        if not chunks:
-            print("No chunks created.")
+            if parse_pool:
+                futures = {
+                    parse_pool.submit(_load_pdf_chunks, pdf_path, config.CHUNK_SIZE, config.CHUNK_OVERLAP): (pdf_path, file_hash)
+                    for pdf_path, file_hash in pending
+                }
+                parsed = ((futures[future], future) for future in as_completed(futures))
+            else:
+                parsed = (((pdf_path, file_hash), None) for pdf_path, file_hash in pending)
+
+            for done, ((pdf_path, file_hash), future) in enumerate(parsed, 1):
+                pdf_name = os.path.basename(pdf_path)
+                try:
+                    if future is not None:
+                        page_count, raw_chunks, parse_seconds = future.result()
+                    else:
+                        page_count, raw_chunks, parse_seconds = _load_pdf_chunks(pdf_path, config.CHUNK_SIZE, config.CHUNK_OVERLAP)
+                    metrics.observe_stage("ingest.parse", parse_seconds)
+                    logger.info("Processing PDF: %s (%s pages, %s chunks)", pdf_name, page_count, len(raw_chunks))
+                    with metrics.span("ingest.store"):
+                        chunk_count = self._embed_and_upsert(pdf_path, file_hash, raw_chunks, upsert_pool, in_flight)
+                    stats['pages'] += page_count
+                    if chunk_count:
+                        stats['files'] += 1
+                        stats['chunks'] += chunk_count
+                        stats['per_file'][pdf_name] = chunk_count
+                        file_callback(pdf_path, {'status': 'done', 'chunks': chunk_count, 'error': None})
+                    elif raw_chunks:
+                        stats['failed'] += 1
+                        file_callback(pdf_path, {'status': 'failed', 'chunks': 0, 'error': "Saving chunks failed"})
+                    else:
+                        file_callback(pdf_path, {'status': 'done', 'chunks': 0, 'error': None})
+                except Exception as e:
+                    logger.error("Error processing %s: %s", pdf_name, e)
+                    stats['failed'] += 1
+                    file_callback(pdf_path, {'status': 'failed', 'chunks': 0, 'error': str(e)})
+                if progress_callback:
+                    progress_callback(done, len(pending))
+        finally:
+            upsert_pool.shutdown(wait=True)
+            if parse_pool:
+                parse_pool.shutdown(wait=True)
+
+        stats = self._ingest_throughput(stats, time.time() - started)
+        logger.info(
+            "Ingested %s PDFs, %s pages, %s chunks in %.1fs (%.1f pages/s, %.1f chunks/s)",
+            stats['files'], stats['pages'], stats['chunks'], stats['seconds'], stats['pages_per_sec'], stats['chunks_per_sec']
+        )
+        return stats
+
+    @staticmethod
+    def _ingest_throughput(stats: Dict[str, any], seconds: float) -> Dict[str, any]:
+        stats['seconds'] = seconds
+        stats['pages_per_sec'] = stats['pages'] / seconds if seconds else 0.0
+        stats['chunks_per_sec'] = stats['chunks'] / seconds if seconds else 0.0
+        return stats
+
+    def _embed_and_upsert(
+        self,
+        pdf_path: str,
+        file_hash: str,
+        raw_chunks: List[Tuple[str, Dict]],
+        upsert_pool: ThreadPoolExecutor,
+        in_flight: threading.BoundedSemaphore
+    ) -> int:
+        """
+        Store one file's chunks, diffed by chunk id (file name and content) against the chunks
+        already stored for the same file name: only new chunks are embedded and upserted, unchanged ones just get
+        their payload (page, position) updated, and chunks the file no longer has are deleted
+        once everything else landed. Indexes the file when every batch succeeded.
+        """
+        if not raw_chunks:
+            logger.info("No chunks created.")
             return 0
+        pdf_name = os.path.basename(pdf_path)
+        model = embedding_backends.model_id()
         ids = []
+        content_hashes = []
         new_chunks = []
-        pdf_name = os.path.basename(pdf_path)
-        
-        for i, chunk in enumerate(chunks):
-            content_hash = hashlib.md5(f"{chunk.page_content}".encode()).hexdigest()
-            ids.append(content_hash)
-            
-            chunk.metadata['source'] = pdf_name
-            chunk.metadata['chunk_index'] = i
-            new_chunks.append(chunk)
+        for i, (content, metadata) in enumerate(raw_chunks):
+            # Ids are scoped to the file, so replacing or deleting one file never touches a
+            # chunk another file shares, and to the model, so switching models re-embeds
+            # instead of keeping the old vectors. The embedding cache is keyed by content.
+            content_hash = hashlib.md5(content.encode()).hexdigest()
+            chunk_id = hashlib.md5(f"{model}\0{pdf_name}\0{content}".encode()).hexdigest()
+            ids.append(chunk_id)
+            content_hashes.append(content_hash)
+            metadata['source'] = pdf_name
+            metadata['chunk_index'] = i
+            metadata['chunk_id'] = chunk_id
+            new_chunks.append(Document(page_content=content, metadata=metadata))
 
-        if self.vector_store:
-            try:
-                print(f"Upserting {len(new_chunks)} chunks to Qdrant...")
-                self.vector_store.add_documents(new_chunks, ids=ids)
-                print(f"Successfully saved to Qdrant collection '{config.QDRANT_COLLECTION_NAME}'.")
-            except Exception as e:
-                print(f"ERROR saving to Qdrant: {e}")
-                return 0
-        else:
-            print("Vector Store is not available inside process_pdf!")
+        old_ids = set(self.vector_store.ids_for_source(pdf_name))
+        added = [i for i, chunk_id in enumerate(ids) if chunk_id not in old_ids]
+        kept = [i for i, chunk_id in enumerate(ids) if chunk_id in old_ids]
+        removed = list(old_ids - set(ids))
+
+        def payload(i: int) -> Dict[str, any]:
+            return {'page_content': new_chunks[i].page_content, 'metadata': new_chunks[i].metadata}
+
+        def timed(func):
+            def run(*args):
+                with metrics.span("ingest.upsert"):
+                    return func(*args)
+            return metrics.in_context(run)
+
+        def submit(func, *args):
+            in_flight.acquire()
+            future = upsert_pool.submit(timed(func), *args)
+            future.add_done_callback(lambda _: in_flight.release())
+            upserts.append(future)
+
+        upserts = []
+        batch_size = config.UPSERT_BATCH_SIZE
+        for start in range(0, len(added), batch_size):
+            batch = added[start:start + batch_size]
+            batch_ids = [ids[i] for i in batch]
+            with metrics.span("ingest.embed"):
+                vectors = self._embed_texts([new_chunks[i].page_content for i in batch], keys=[content_hashes[i] for i in batch])
+            submit(self.vector_store.upsert, batch_ids, vectors, [payload(i) for i in batch])
+        for start in range(0, len(kept), batch_size):
+            batch = kept[start:start + batch_size]
+            submit(self.vector_store.set_payloads, [ids[i] for i in batch], [payload(i) for i in batch])
+
+        try:
+            with metrics.span("ingest.upsert_wait"):
+                for future in upserts:
+                    future.result()
+            # Deleted last, so a failed update leaves the previous version searchable.
+            with metrics.span("ingest.delete"):
+                self.vector_store.delete(removed)
+            logger.info(
+                "Saved %s chunks of %s to the %s vector store (%s new, %s unchanged, %s removed).",
+                len(new_chunks), pdf_name, self.vector_store.name, len(added), len(kept), len(removed)
+            )
+        except Exception as e:
+            logger.error("Error saving to vector store: %s", e)
             return 0
 
+        metrics.INGESTED_CHUNKS.inc(len(added), kind="embedded")
+        metrics.INGESTED_CHUNKS.inc(len(kept), kind="unchanged")
+        metrics.INGESTED_CHUNKS.inc(len(removed), kind="removed")
+        with metrics.span("ingest.keyword_index"):
+            self._remove_from_bm25_index(removed)
+            self._add_to_bm25_index([ids[i] for i in added], [new_chunks[i] for i in added])
+        # The generation moves only once both indexes show the file, so a search that
+        # runs before then caches its results under the old generation.
+        self._record_ingested(pdf_path, file_hash, len(new_chunks))
         self._export_chunks_debug(pdf_name, new_chunks)
-
-        self._build_bm25_index()
-        
         return len(new_chunks)
 
+    def _embed_texts(self, texts: List[str], keys: Optional[List[str]] = None) -> List[List[float]]:
+        """
+        Embed chunk texts in batches of EMBEDDING_BATCH_SIZE.
+        With content-hash keys, vectors already in the embedding cache are reused.
+        """
+        if keys is None or self.embedding_cache is None:
+            vectors = []
+            for start in range(0, len(texts), config.EMBEDDING_BATCH_SIZE):
+                vectors.extend(self.embeddings.embed_documents(texts[start:start + config.EMBEDDING_BATCH_SIZE]))
+            return vectors
+
+        vectors = self.embedding_cache.get_many(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self._embed_texts([texts[i] for i in missing])
+            self.embedding_cache.put_many([keys[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        if len(missing) < len(texts):
+            logger.debug("Embedding cache: %s/%s vectors reused.", len(texts) - len(missing), len(texts))
+        return vectors
+
+    @staticmethod
+    def _debug_export_path(filename: str) -> Path:
+        return config.DATA_DIR / "vector_database_debug" / f"{filename}_chunks.json"
+
     def _export_chunks_debug(self, filename: str, chunks: List[Document]):
         """Export chunks to a readable format for inspection."""
         try:
-            debug_dir = config.DATA_DIR / "vector_database_debug"
-            debug_dir.mkdir(parents=True, exist_ok=True)
-            output_file = debug_dir / f"{filename}_chunks.json"
+            output_file = self._debug_export_path(filename)
+            output_file.parent.mkdir(parents=True, exist_ok=True)
             
             export_data = []
             for i, chunk in enumerate(chunks, 1):
@@ -182,117 +641,512 @@ class RAGEngine:
             
             with open(output_file, "w", encoding="utf-8") as f:
                 json.dump(export_data, f, ensure_ascii=False, indent=2)
-            print(f"Debug exported to {output_file}")
+            logger.debug("Debug exported to %s", output_file)
         except Exception as e:
-            print(f"Error exporting debug: {e}")
+            logger.error("Error exporting debug: %s", e)
     
-    def _build_bm25_index(self):
-        """Build BM25 index from existing documents in Qdrant."""
-        if not self.client or not self.vector_store:
-            print("Cannot build BM25 index: Qdrant not initialized")
+    def _add_to_bm25_index(self, ids: List[str], chunks: List[Document]):
+        """Index newly upserted chunks without rebuilding the whole BM25 index."""
+        if not ids:
+            return
+        with self._index_lock.write_locked():
+            self.bm25_index = self.bm25_index.editable() if self.bm25_index is not None else KeywordIndex()
+            for chunk_id, chunk in zip(ids, chunks):
+                self.bm25_index.add(chunk_id, chunk.page_content)
+            self._bm25_dirty = True
+        logger.debug("BM25 index updated: %s documents", len(self.bm25_index))
+
+    def _remove_from_bm25_index(self, ids: List[str]):
+        """Drop chunks from the BM25 index by chunk id."""
+        if self.bm25_index is None or not ids:
+            return
+        with self._index_lock.write_locked():
+            self.bm25_index = self.bm25_index.editable()
+            for chunk_id in ids:
+                self.bm25_index.remove(chunk_id)
+            self._bm25_dirty = True
+
+    def _bm25_snapshot_path(self, generation: int) -> Path:
+        return config.KEYWORD_INDEX_DIR / f"keyword_index-{generation}.bin"
+
+    def _load_bm25_snapshot(self) -> bool:
+        """Map the keyword index snapshot for the current generation, if one is valid."""
+        path = self._bm25_snapshot_path(self.generation)
+        if not path.exists() or not self.vector_store:
+            return False
+        try:
+            snapshot = KeywordSnapshot.load(path)
+            points_count = self.vector_store.count()
+            if snapshot.generation != self.generation or len(snapshot) != points_count:
+                logger.warning("Keyword index snapshot is stale (%s chunks, collection has %s).", len(snapshot), points_count)
+                snapshot.close()
+                return False
+            with self._index_lock.write_locked():
+                self.bm25_index = snapshot
+            logger.info("Keyword index snapshot mapped from %s: %s chunks", path.name, len(snapshot))
+            return True
+        except Exception as e:
+            logger.error("Error loading keyword index snapshot: %s", e)
+            return False
+
+    def persist_keyword_index(self):
+        """Write a keyword index snapshot for the current generation if the index changed."""
+        with self._ingest_lock:
+            self._persist_keyword_index()
+
+    def _persist_keyword_index(self):
+        # Only ingestion mutates the index, so holding the ingest lock is enough to save it.
+        if not self._bm25_dirty:
+            return
+        try:
+            path = self._bm25_snapshot_path(self.generation)
+            if self.bm25_index is not None and len(self.bm25_index):
+                self.bm25_index.editable().save(path, self.generation)
+                logger.info("Keyword index snapshot saved to %s", path.name)
+            self._bm25_dirty = False
+            self._remove_stale_bm25_snapshots(keep=path)
+        except Exception as e:
+            logger.error("Error saving keyword index snapshot: %s", e)
+
+    def _remove_stale_bm25_snapshots(self, keep: Optional[Path] = None):
+        for old_path in config.KEYWORD_INDEX_DIR.glob("keyword_index-*.bin"):
+            if old_path != keep:
+                try:
+                    old_path.unlink()
+                except OSError:
+                    # Still mapped by another process (Windows); removed on a later save.
+                    pass
+
+    def _build_bm25_index(
+        self,
+        batch_size: int = config.BM25_SCROLL_BATCH_SIZE,
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ):
+        """Build the BM25 index by paging through every stored chunk."""
+        if not self.vector_store:
+            logger.warning("Cannot build BM25 index: vector store not initialized")
             return
         
         try:
-            print("Building BM25 index from Qdrant documents...")
-            collection_info = self.client.get_collection(config.QDRANT_COLLECTION_NAME)
+            logger.info("Building BM25 index from stored documents...")
+            total = self.vector_store.count()
             
-            if collection_info.points_count == 0:
-                print("No documents in Qdrant, BM25 index empty")
+            if total == 0:
+                logger.info("No documents in the vector store, BM25 index empty")
                 self.bm25_index = None
-                self.bm25_documents = []
                 return
             
-            scroll_result = self.client.scroll(
-                collection_name=config.QDRANT_COLLECTION_NAME,
-                limit=1000,
-                with_payload=True,
-                with_vectors=False
-            )
-            
-            points = scroll_result[0]
-            self.bm25_documents = []
-            
-            for point in points:
-                content = point.payload.get('page_content', '')
-                metadata = point.payload.get('metadata', {})
-                doc = Document(page_content=content, metadata=metadata)
-                self.bm25_documents.append(doc)
-            tokenized_docs = [doc.page_content.lower().split() for doc in self.bm25_documents]
-            self.bm25_index = BM25Okapi(tokenized_docs)
-            
-            print(f"BM25 index built with {len(self.bm25_documents)} documents")
+            index = KeywordIndex()
+            start_time = time.time()
+            for batch in self.vector_store.scroll(batch_size):
+                for chunk_id, payload in batch:
+                    index.add(chunk_id, payload.get('page_content', ''))
+
+                elapsed = time.time() - start_time
+                peak = peak_memory_mb()
+                logger.info(
+                    "BM25 bootstrap: %s/%s chunks (%.0f chunks/s, peak memory %s)",
+                    len(index), total, len(index) / max(elapsed, 1e-6), f"{peak:.0f} MB" if peak is not None else "n/a"
+                )
+                if progress_callback:
+                    progress_callback(len(index), total)
+
+            with self._index_lock.write_locked():
+                self.bm25_index = index
+                self._bm25_dirty = True
+            logger.info("BM25 index built with %s documents in %.1fs", len(index), time.time() - start_time)
         except Exception as e:
-            print(f"Error building BM25 index: {e}")
+            logger.error("Error building BM25 index: %s", e)
             self.bm25_index = None
-            self.bm25_documents = []
     
     
-    def search(self, query: str, search_type: str = "hybrid", k: int = config.TOP_K_RESULTS) -> List[Tuple[Document, float]]:
-        """Search for relevant documents using hybrid approach."""
+    def search(self, query: str, search_type: str = "hybrid", k: Optional[int] = None) -> List[Tuple[Document, float]]:
+        """
+        Search for relevant documents using hybrid approach.
+        Results are cached per normalized query, search type and k for the current collection generation.
+        """
+        k = k or config.TOP_K_RESULTS
         if self.vector_store is None:
-            print("Search failed: Vector Store is None")
+            logger.error("Search failed: Vector Store is None")
             return []
+        with metrics.span("search.refresh"):
+            self.refresh()
         
-        print(f"Searching for: '{query}' (type: {search_type}, limit {k})")
+        cache_key = (self.generation, normalize_query(query), search_type, k)
+        cached = self._result_cache.get(cache_key)
+        if cached is not None:
+            metrics.SEARCHES.inc(search_type=search_type, cache="hit")
+            logger.debug("Search cache hit for: '%s' (type: %s, limit %s)", query, search_type, k)
+            return list(cached)
         
-        if search_type == "hybrid":
-            return self._hybrid_search(query, k)
-        elif search_type == "semantic":
-            return self._semantic_search(query, k)
-        elif search_type == "keyword":
-            return self._keyword_search(query, k)
-        else:
-            return self._hybrid_search(query, k)
+        metrics.SEARCHES.inc(search_type=search_type, cache="miss")
+        logger.debug("Searching for: '%s' (type: %s, limit %s)", query, search_type, k)
+        
+        status = {'complete': True}
+        with metrics.span("search.total"), self._index_lock.read_locked():
+            cacheable = not self._snapshot_pending
+            if search_type == "semantic":
+                results = self._semantic_search(query, k, status)
+            elif search_type == "keyword":
+                results = self._keyword_search(query, k, status=status)
+            else:
+                results = self._hybrid_search(query, k, status)
+        # A leg that failed or timed out would pin degraded results in the cache.
+        if results and status['complete'] and cacheable:
+            self._result_cache.put(cache_key, results)
+        return list(results)
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query, reusing the vector for repeated normalized queries."""
+        key = normalize_query(query)
+        embedding = self._query_embedding_cache.get(key)
+        if embedding is None:
+            with metrics.span("search.embed_query"):
+                embedding = self.embeddings.embed_query(key)
+            self._query_embedding_cache.put(key, embedding)
+        return embedding
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed many queries, computing the uncached ones in batches of EMBEDDING_BATCH_SIZE."""
+        keys = [normalize_query(query) for query in queries]
+        embeddings = {}
+        missing = []
+        for key in keys:
+            if key in embeddings:
+                continue
+            embedding = self._query_embedding_cache.get(key)
+            if embedding is None:
+                missing.append(key)
+                embeddings[key] = None
+            else:
+                embeddings[key] = embedding
+        for start in range(0, len(missing), config.EMBEDDING_BATCH_SIZE):
+            batch = missing[start:start + config.EMBEDDING_BATCH_SIZE]
+            with metrics.span("search_many.embed_queries"):
+                vectors = self.embeddings.embed_documents(batch)
+            for key, embedding in zip(batch, vectors):
+                self._query_embedding_cache.put(key, embedding)
+                embeddings[key] = embedding
+        return [embeddings[key] for key in keys]
+
+    def search_many(
+        self, queries: List[str], search_type: str = "hybrid", k: Optional[int] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        Search many queries at once, with the same per-query results as search().
+        Queries are embedded in batches, the vector store is queried with one batch
+        request and BM25 shares term lookups across the queries.
+        """
+        k = k or config.TOP_K_RESULTS
+        if self.vector_store is None:
+            logger.error("Search failed: Vector Store is None")
+            return [[] for _ in queries]
+        with metrics.span("search.refresh"):
+            self.refresh()
+
+        generation = self.generation
+        results = [None] * len(queries)
+        pending = {}
+        for i, query in enumerate(queries):
+            cache_key = (generation, normalize_query(query), search_type, k)
+            cached = self._result_cache.get(cache_key)
+            if cached is not None:
+                metrics.SEARCHES.inc(search_type=search_type, cache="hit")
+                results[i] = list(cached)
+            else:
+                metrics.SEARCHES.inc(search_type=search_type, cache="miss")
+                pending.setdefault(cache_key, []).append(i)
+        if not pending:
+            return results
+
+        cache_keys = list(pending)
+        batch = [queries[pending[cache_key][0]] for cache_key in cache_keys]
+        logger.debug("Batch searching %s distinct uncached queries of %s (type: %s, limit %s)", len(batch), len(queries), search_type, k)
+        started = time.time()
+        status = {'complete': True}
+        with metrics.span("search_many.total"), self._index_lock.read_locked():
+            cacheable = not self._snapshot_pending
+            if search_type == "semantic":
+                batch_results = self._semantic_search_many(batch, k, status)
+            elif search_type == "keyword":
+                batch_results = self._keyword_search_many(batch, k, status=status)
+            else:
+                batch_results = self._hybrid_search_many(batch, k, status)
+        logger.debug("Batch search finished in %.2fs", time.time() - started)
+
+        for cache_key, query_results in zip(cache_keys, batch_results):
+            if query_results and status['complete'] and cacheable:
+                self._result_cache.put(cache_key, query_results)
+            for i in pending[cache_key]:
+                results[i] = list(query_results)
+        return results
+
+    def cache_stats(self) -> Dict[str, Dict[str, any]]:
+        """Hit rates of the query-embedding, search-result and chunk-embedding caches."""
+        stats = {
+            'query_embeddings': self._query_embedding_cache.stats(),
+            'search_results': self._result_cache.stats(),
+        }
+        if self.embedding_cache is not None:
+            stats['chunk_embeddings'] = self.embedding_cache.stats()
+        return stats
     
-    def _semantic_search(self, query: str, k: int) -> List[Tuple[Document, float]]:
+    def _semantic_search(self, query: str, k: int, status: Optional[Dict] = None) -> List[Tuple[Document, float]]:
         """Perform semantic vector search."""
         try:
-            results = self.vector_store.similarity_search_with_score(query, k=k)
-            print(f"Semantic search found {len(results)} results.")
+            embedding = self.embed_query(query)
+            with metrics.span("search.vector_store"):
+                results = self.vector_store.search(embedding, k)
+            logger.debug("Semantic search found %s results.", len(results))
             return results
         except Exception as e:
-            print(f"Semantic search error: {e}")
+            logger.error("Semantic search error: %s", e)
+            if status is not None:
+                status['complete'] = False
+            return []
+
+    def _semantic_search_ids(self, query: str, k: int, status: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        """Semantic leg of a hybrid search: chunk ids only."""
+        try:
+            embedding = self.embed_query(query)
+            with metrics.span("search.vector_store"):
+                return self.vector_store.search_ids(embedding, k)
+        except Exception as e:
+            logger.error("Semantic search error: %s", e)
+            if status is not None:
+                status['complete'] = False
             return []
     
-    def _keyword_search(self, query: str, k: int) -> List[Tuple[Document, float]]:
+    def _semantic_search_many(
+        self, queries: List[str], k: int, status: Optional[Dict] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        try:
+            embeddings = self.embed_queries(queries)
+            with metrics.span("search_many.vector_store"):
+                return self.vector_store.search_many(embeddings, k)
+        except Exception as e:
+            logger.error("Batch semantic search error: %s", e)
+            if status is not None:
+                status['complete'] = False
+            return [[] for _ in queries]
+
+    def _semantic_search_many_ids(self, queries: List[str], k: int, status: Dict) -> List[List[Tuple[str, float]]]:
+        try:
+            embeddings = self.embed_queries(queries)
+            with metrics.span("search_many.vector_store"):
+                return self.vector_store.search_many_ids(embeddings, k)
+        except Exception as e:
+            logger.error("Batch semantic search error: %s", e)
+            status['complete'] = False
+            return [[] for _ in queries]
+
+    def _keyword_search_many(
+        self, queries: List[str], k: int, fallback: bool = True, status: Optional[Dict] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        if not self.bm25_index:
+            if not fallback:
+                return [[] for _ in queries]
+            logger.warning("BM25 index not available, falling back to semantic search")
+            return self._semantic_search_many(queries, k, status)
+        all_hits = self._keyword_search_many_ids(queries, k, status)
+        try:
+            return self._documents_for_many(all_hits, "search_many.retrieve")
+        except Exception as e:
+            logger.error("Batch keyword search error: %s", e)
+            if status is not None:
+                status['complete'] = False
+            return [[] for _ in queries]
+
+    def _keyword_search_many_ids(
+        self, queries: List[str], k: int, status: Optional[Dict] = None
+    ) -> List[List[Tuple[str, float]]]:
+        if not self.bm25_index:
+            return [[] for _ in queries]
+        try:
+            with metrics.span("search_many.bm25"):
+                return self.bm25_index.search_many(queries, k)
+        except Exception as e:
+            logger.error("Batch keyword search error: %s", e)
+            if status is not None:
+                status['complete'] = False
+            return [[] for _ in queries]
+
+    def _keyword_search(
+        self, query: str, k: int, fallback: bool = True, status: Optional[Dict] = None
+    ) -> List[Tuple[Document, float]]:
         """Perform BM25 keyword search."""
-        if not self.bm25_index or not self.bm25_documents:
-            print("BM25 index not available, falling back to semantic search")
-            return self._semantic_search(query, k)
-        
+        if not self.bm25_index:
+            if not fallback:
+                return []
+            logger.warning("BM25 index not available, falling back to semantic search")
+            return self._semantic_search(query, k, status)
+        hits = self._keyword_search_ids(query, k, status)
         try:
-            tokenized_query = query.lower().split()
-            scores = self.bm25_index.get_scores(tokenized_query)
-            top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k]
-            results = [(self.bm25_documents[i], float(scores[i])) for i in top_indices]
-            print(f"Keyword search found {len(results)} results.")
+            results = self._documents_for(hits)
+            logger.debug("Keyword search found %s results.", len(results))
             return results
         except Exception as e:
-            print(f"Keyword search error: {e}")
+            logger.error("Keyword search error: %s", e)
+            if status is not None:
+                status['complete'] = False
+            return []
+
+    def _keyword_search_ids(self, query: str, k: int, status: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        """BM25 leg of a hybrid search: chunk ids only."""
+        if not self.bm25_index:
+            return []
+        try:
+            with metrics.span("search.bm25"):
+                return self.bm25_index.search(query, k)
+        except Exception as e:
+            logger.error("Keyword search error: %s", e)
+            if status is not None:
+                status['complete'] = False
             return []
+
+    def _documents_for(self, hits: List[Tuple[str, float]]) -> List[Tuple[Document, float]]:
+        """Build Documents for ranked chunk ids; ids no longer stored are dropped."""
+        return self._documents_for_many([hits], "search.retrieve")[0]
+
+    def _documents_for_many(self, all_hits: List[List[Tuple[any, float]]], stage: str) -> List[List[Tuple[Document, float]]]:
+        """Replace the chunk ids among ranked hits with their Documents; hits that already are Documents are kept."""
+        chunk_ids = list(dict.fromkeys(item for hits in all_hits for item, _ in hits if isinstance(item, str)))
+        documents = {}
+        if chunk_ids:
+            with metrics.span(stage):
+                documents = self.vector_store.retrieve(chunk_ids)
+        return [
+            [
+                (documents[item] if isinstance(item, str) else item, score)
+                for item, score in hits
+                if not isinstance(item, str) or item in documents
+            ]
+            for hits in all_hits
+        ]
+
+    def _fused_documents(self, all_hits: List[List[Tuple[any, float]]], stage: str, status: Dict) -> List[List[Tuple[Document, float]]]:
+        """Documents for fused hits; if the store cannot be read, keep only the hits that carry one."""
+        try:
+            return self._documents_for_many(all_hits, stage)
+        except Exception as e:
+            logger.error("Retrieving fused results failed: %s", e)
+            status['complete'] = False
+            return [[(item, score) for item, score in hits if not isinstance(item, str)] for hits in all_hits]
+
+    def _keyword_leg(self, query: str, k: int, status: Dict) -> List[Tuple[Document, float]]:
+        return self._keyword_search(query, k, False, status)
+
+    def _keyword_leg_many(self, queries: List[str], k: int, status: Dict) -> List[List[Tuple[Document, float]]]:
+        return self._keyword_search_many(queries, k, False, status)
+
+    def _hybrid_legs(self, many: bool = False) -> Tuple[Callable, Callable]:
+        """
+        Semantic and keyword leg functions. Qdrant returns payloads with its hits, so the legs
+        carry Documents (the keyword leg retrieves its own in parallel); for the NumPy store
+        they return chunk ids and Documents are built for the fused top k only.
+        """
+        if self.vector_store is not None and self.vector_store.payloads_with_hits:
+            if many:
+                return self._semantic_search_many, self._keyword_leg_many
+            return self._semantic_search, self._keyword_leg
+        if many:
+            return self._semantic_search_many_ids, self._keyword_search_many_ids
+        return self._semantic_search_ids, self._keyword_search_ids
     
-    def _hybrid_search(self, query: str, k: int) -> List[Tuple[Document, float]]:
-        """Perform hybrid search combining semantic and keyword results."""
-        semantic_results = self._semantic_search(query, k=k*2)
-        keyword_results = self._keyword_search(query, k=k*2)
+    def _hybrid_search(self, query: str, k: int, status: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """Perform hybrid search, running the semantic and keyword legs concurrently."""
+        status = status if status is not None else {}
+        started = time.time()
+        semantic_leg, keyword_leg = self._hybrid_legs()
+        semantic_future = self._submit_semantic_leg(semantic_leg, query, k * 2, status, [])
+        keyword_future = self._submit_leg(keyword_leg, query, k * 2, status)
+        semantic_results = self._leg_results("Semantic", semantic_future, started + config.SEMANTIC_SEARCH_TIMEOUT, status)
+        keyword_results = self._leg_results("Keyword", keyword_future, started + config.KEYWORD_SEARCH_TIMEOUT, status)
+        logger.debug("Hybrid legs finished in %.3fs", time.time() - started)
         
         if not semantic_results and not keyword_results:
             return []
         
-        fused_results = reciprocal_rank_fusion(semantic_results, keyword_results, k=60)
-        final_results = fused_results[:k]
-        print(f"Hybrid search returned {len(final_results)} results after fusion.")
+        with metrics.span("search.fusion"):
+            fused_results = reciprocal_rank_fusion(
+                semantic_results,
+                keyword_results,
+                k=60,
+                weights=(config.HYBRID_WEIGHT_SEMANTIC, config.HYBRID_WEIGHT_KEYWORD)
+            )
+        final_results = self._fused_documents([fused_results[:k]], "search.retrieve", status)[0]
+        logger.debug("Hybrid search returned %s results after fusion.", len(final_results))
         return final_results
 
 
+    def _hybrid_search_many(
+        self, queries: List[str], k: int, status: Dict
+    ) -> List[List[Tuple[Document, float]]]:
+        semantic_leg, keyword_leg = self._hybrid_legs(many=True)
+        semantic_future = self._submit_semantic_leg(semantic_leg, queries, k * 2, status, [[] for _ in queries])
+        keyword_future = self._submit_leg(keyword_leg, queries, k * 2, status)
+        semantic_results = semantic_future.result()
+        keyword_results = keyword_future.result()
+        with metrics.span("search_many.fusion"):
+            fused = [
+                reciprocal_rank_fusion(
+                    semantic,
+                    keyword,
+                    k=60,
+                    weights=(config.HYBRID_WEIGHT_SEMANTIC, config.HYBRID_WEIGHT_KEYWORD)
+                )[:k]
+                for semantic, keyword in zip(semantic_results, keyword_results)
+            ]
+        return self._fused_documents(fused, "search_many.retrieve", status)
+
+    def _submit_semantic_leg(self, leg: Callable, queries, k: int, status: Dict, empty: List) -> Future:
+        """
+        Run the semantic leg on the search pool. While the embedding model is still loading it
+        contributes nothing (the search is marked degraded) instead of holding a pool thread.
+        """
+        if not self.embeddings_ready:
+            logger.info("Embedding model still loading; hybrid search uses keyword results only.")
+            status['complete'] = False
+            future = Future()
+            future.set_result(empty)
+            return future
+        return self._submit_leg(leg, queries, k, status)
+
+    def _submit_leg(self, leg: Callable, *args) -> Future:
+        """
+        Run a retrieval leg on the search pool under its own read hold on the indexes,
+        released when the leg finishes. A leg abandoned at its timeout keeps running, and
+        ingestion must not mutate the keyword index, nor refresh() close the snapshot, under it.
+        """
+        release = self._index_lock.hold_read()
+        try:
+            future = self._search_pool.submit(metrics.in_context(leg), *args)
+        except BaseException:
+            release()
+            raise
+        future.add_done_callback(lambda _: release())
+        return future
+
+    def _leg_results(self, name: str, future: Future, deadline: float, status: Dict) -> List[Tuple[Document, float]]:
+        """Wait for one retrieval leg until its deadline; a slow or failed leg contributes nothing."""
+        try:
+            return future.result(timeout=max(0.0, deadline - time.time()))
+        except FutureTimeoutError:
+            # The leg keeps running in the pool, holding the index lock; its late result is dropped.
+            logger.warning("%s search timed out, continuing without it.", name)
+        except Exception as e:
+            logger.error("%s search error: %s", name, e)
+        metrics.SEARCH_LEG_DEGRADED.inc(leg=name.lower())
+        status['complete'] = False
+        return []
+
     def get_stats(self) -> Dict[str, any]:
-        """Get statistics from Qdrant."""
-        if not self.client:
+        """Get statistics from the vector store."""
+        if not self.vector_store:
              return {'total_chunks': 0, 'total_documents': 0, 'document_names': [], 'has_data': False}
 
         try:
-            count_result = self.client.count(collection_name=config.QDRANT_COLLECTION_NAME)
-            count = count_result.count
+            count = self.vector_store.count()
             
             files = [f.name for f in config.PDF_UPLOAD_DIR.glob("*.pdf")] if config.PDF_UPLOAD_DIR.exists() else []
             
@@ -303,21 +1157,48 @@ class RAGEngine:
                 'has_data': count > 0
             }
         except Exception as e:
-            print(f"Stats error: {e}")
+            logger.error("Stats error: %s", e)
             return {'total_chunks': 0, 'total_documents': 0, 'document_names': [], 'has_data': False}
 
+    def delete_document(self, source: str) -> int:
+        """
+        Remove one document: its chunks in the vector store and BM25 index, its manifest
+        entry and debug export. Returns the number of chunks deleted. The uploaded PDF is
+        left to the caller, which removes it before queueing the delete so a re-upload
+        under the same name is never caught by it.
+        """
+        pdf_name = os.path.basename(source)
+        with self._ingest_lock:
+            ids = self.vector_store.ids_for_source(pdf_name) if self.vector_store else []
+            if self.vector_store:
+                self.vector_store.delete(ids)
+            self._remove_from_bm25_index(ids)
+            if self._forget_source(pdf_name) or ids:
+                self.manifest['generation'] += 1
+                self._save_manifest()
+            debug_file = self._debug_export_path(pdf_name)
+            if debug_file.exists():
+                debug_file.unlink()
+            self._persist_keyword_index()
+        logger.info("Deleted %s: %s chunks removed.", pdf_name, len(ids))
+        return len(ids)
+
     def clear_all(self):
-        """Clear Qdrant collection."""
-        if self.client:
-            try:
-                self.client.delete_collection(config.QDRANT_COLLECTION_NAME)
-                self._initialize_qdrant()
-
-                import shutil
-                debug_dir = config.DATA_DIR / "vector_database_debug"
-                if debug_dir.exists():
-                    shutil.rmtree(debug_dir)
-                    debug_dir.mkdir()
-                print("All data cleared.")
-            except Exception as e:
-                print(f"Error clearing data: {e}")
\ No newline at end of file
+        """Clear the vector store and every index built on it."""
+        if self.vector_store:
+            with self._ingest_lock, self._index_lock.write_locked():
+                try:
+                    self.vector_store.clear()
+                    self._reset_manifest()
+                    self.bm25_index = None
+                    self._bm25_dirty = False
+                    self._remove_stale_bm25_snapshots()
+
+                    import shutil
+                    debug_dir = config.DATA_DIR / "vector_database_debug"
+                    if debug_dir.exists():
+                        shutil.rmtree(debug_dir)
+                        debug_dir.mkdir()
+                    logger.info("All data cleared.")
+                except Exception as e:
+                    logger.error("Error clearing data: %s", e)
\ No newline at end of file
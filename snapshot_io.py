@@ -0,0 +1,25 @@
+"""
+Section helpers for the memory-mapped snapshot files (keyword index, chunk store).
+
+A snapshot is a fixed header followed by sections, each padded to 8 bytes so
+that every section starts aligned for the widest typed view cast onto it.
+"""
+import struct
+from array import array
+from typing import Tuple
+
+
+def write_section(f, section):
+    """Write an array or bytes section, padded to 8 bytes."""
+    data = section.tobytes() if isinstance(section, array) else section
+    f.write(data)
+    padding = -len(data) % 8
+    if padding:
+        f.write(b"\0" * padding)
+
+
+def read_section(view: memoryview, pos: int, fmt: str, count: int) -> Tuple[memoryview, int]:
+    """View `count` items of struct format `fmt` at `pos`; returns the view and the next section's position."""
+    size = struct.calcsize(fmt) * count
+    section = view[pos:pos + size].cast(fmt)
+    return section, pos + size + (-size % 8)
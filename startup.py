@@ -0,0 +1,168 @@
+"""
+Startup stages, readiness and the startup profile.
+
+RAGEngine and LLMHandler time each startup stage (model load, vector store
+connect, keyword index load, warm-ups) here:
+
+    with startup.STATUS.stage("vector_store.connect"):
+        ...
+
+The app and the API poll STATUS.snapshot() to show whether the system can
+serve yet. Required stages gate readiness; optional ones (warm-ups) only
+gate "warm". Run `python startup.py` for a profile of a cold start.
+"""
+import argparse
+import importlib
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+READY = "ready"
+FAILED = "failed"
+
+
+class StartupStatus:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._stages: Dict[str, Dict[str, any]] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._reported = False
+
+    def expect(self, name: str, required: bool = True):
+        """Declare a stage that has not started yet, so readiness waits for it."""
+        with self._lock:
+            self._stages.setdefault(name, {'state': PENDING, 'required': required})
+
+    @contextmanager
+    def stage(self, name: str, required: bool = True):
+        started = time.perf_counter()
+        self._update(name, required, state=RUNNING, start=started - self.started)
+        try:
+            yield
+        except Exception as e:
+            self._update(name, required, state=FAILED, seconds=time.perf_counter() - started, error=str(e))
+            raise
+        seconds = time.perf_counter() - started
+        metrics.observe_stage(f"startup.{name}", seconds)
+        self._update(name, required, state=READY, seconds=seconds)
+
+    def fail(self, name: str, error: str, required: bool = True):
+        """Mark a stage that cannot run, e.g. a warm-up whose model failed to load."""
+        self._update(name, required, state=FAILED, error=error)
+
+    def _update(self, name: str, required: bool, **fields):
+        with self._changed:
+            entry = self._stages.setdefault(name, {'state': PENDING, 'required': required})
+            entry.update(fields)
+            self._changed.notify_all()
+        if fields['state'] in (READY, FAILED):
+            self._report_when_warm()
+
+    def _settled(self, required_only: bool) -> bool:
+        return all(
+            entry['state'] in (READY, FAILED)
+            for entry in self._stages.values()
+            if entry['required'] or not required_only
+        )
+
+    def is_ready(self) -> bool:
+        """Every required stage finished without error."""
+        with self._lock:
+            return all(entry['state'] == READY for entry in self._stages.values() if entry['required'])
+
+    def wait(self, timeout: Optional[float] = None, warm: bool = False) -> bool:
+        """Block until the required (or, with warm, all) stages have finished; returns is_ready()."""
+        with self._changed:
+            self._changed.wait_for(lambda: self._settled(required_only=not warm), timeout)
+        return self.is_ready()
+
+    def snapshot(self) -> Dict[str, any]:
+        """Readiness and per-stage state, as reported by the app and GET /ready."""
+        with self._lock:
+            stages = {name: dict(entry) for name, entry in self._stages.items()}
+            failed = [name for name, entry in stages.items() if entry['state'] == FAILED and entry['required']]
+            ready = all(entry['state'] == READY for entry in stages.values() if entry['required'])
+            warm = ready and self._settled(required_only=False)
+        return {
+            'status': "failed" if failed else "ready" if ready else "starting",
+            'ready': ready,
+            'warm': warm,
+            'uptime_seconds': round(time.perf_counter() - self.started, 3),
+            'stages': stages,
+        }
+
+    def profile(self) -> List[Dict[str, any]]:
+        """Finished and running stages in start order, offsets and durations in seconds."""
+        with self._lock:
+            entries = [dict(entry, stage=name) for name, entry in self._stages.items() if 'start' in entry]
+        return sorted(entries, key=lambda entry: entry['start'])
+
+    def report(self) -> str:
+        lines = [f"{'stage':<28} {'start s':>8} {'took s':>8}  state"]
+        for entry in self.profile():
+            seconds = entry.get('seconds')
+            took = f"{seconds:8.2f}" if seconds is not None else f"{'...':>8}"
+            state = entry['state'] if entry['required'] else f"{entry['state']} (optional)"
+            lines.append(f"{entry['stage']:<28} {entry['start']:8.2f} {took}  {state}")
+        return "\n".join(lines)
+
+    def _report_when_warm(self):
+        with self._lock:
+            if self._reported or not self._settled(required_only=False):
+                return
+            self._reported = True
+        logger.info("Startup finished in %.2fs:\n%s", time.perf_counter() - self.started, self.report())
+
+
+STATUS = StartupStatus()
+
+
+def timed_import(module: str, required: bool = True):
+    """Import a module as a profiled startup stage."""
+    with STATUS.stage(f"import.{module}", required):
+        return importlib.import_module(module)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Start the engine and LLM handler once and print the startup profile.")
+    parser.add_argument("--no-llm", action="store_true", help="skip the LLM handler and its warm-up")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds to wait for warm-ups")
+    parser.add_argument("--json", action="store_true", help="print the readiness snapshot as JSON")
+    args = parser.parse_args()
+    metrics.setup_logging("WARNING")
+    # Run as a script this module is __main__; the engine reports to the imported module's STATUS.
+    import startup
+    status = startup.STATUS
+
+    rag_engine = startup.timed_import("rag_engine")
+    with status.stage("engine.init"):
+        rag_engine.get_shared_engine()
+    if not args.no_llm:
+        llm_handler = startup.timed_import("llm_handler")
+        with status.stage("llm.init"):
+            llm_handler.get_shared_llm_handler()
+    status.wait(args.timeout, warm=True)
+
+    snapshot = status.snapshot()
+    if args.json:
+        print(json.dumps(snapshot, indent=2))
+        return
+    print(status.report())
+    print(f"\nStatus: {snapshot['status']} ({'warm' if snapshot['warm'] else 'not warm'}), {snapshot['uptime_seconds']:.2f}s in total")
+    for name, entry in snapshot['stages'].items():
+        if entry.get('error'):
+            print(f"  {name}: {entry['error']}")
+
+
+if __name__ == "__main__":
+    main()
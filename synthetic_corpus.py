@@ -0,0 +1,47 @@
+"""
+Synthetic Vietnamese agricultural text: the corpus behind benchmark.py, checks.py
+and the embedding backend comparison (python embedding_backends.py compare).
+"""
+import random
+from typing import List
+
+CROPS = ["lúa", "ngô", "cà phê", "hồ tiêu", "sầu riêng", "thanh long", "xoài", "khoai lang", "đậu tương", "mía", "chè", "cao su"]
+PESTS = ["rầy nâu", "sâu cuốn lá", "bệnh đạo ôn", "bệnh khô vằn", "tuyến trùng", "rệp sáp", "nấm hồng", "bọ xít muỗi", "sâu đục thân", "bệnh thán thư"]
+INPUTS = ["phân đạm", "phân lân", "phân kali", "phân hữu cơ vi sinh", "vôi bột", "thuốc trừ sâu sinh học", "chế phẩm Trichoderma", "phân NPK 16-16-8"]
+REGIONS = ["Đồng bằng sông Cửu Long", "Tây Nguyên", "Đông Nam Bộ", "Đồng bằng sông Hồng", "Bắc Trung Bộ", "duyên hải Nam Trung Bộ"]
+STAGES = ["giai đoạn cây con", "giai đoạn đẻ nhánh", "thời kỳ ra hoa", "giai đoạn nuôi trái", "trước khi thu hoạch", "sau mùa mưa"]
+TEMPLATES = [
+    "Tại {region}, {pest} thường gây hại nặng trên cây {crop} vào {stage}.",
+    "Nông dân trồng {crop} nên bón {input} với liều lượng hợp lý vào {stage} để tăng năng suất.",
+    "Để phòng trừ {pest} trên {crop}, cần vệ sinh đồng ruộng và sử dụng {input} đúng kỹ thuật.",
+    "Kết quả khảo nghiệm ở {region} cho thấy {input} giúp cây {crop} sinh trưởng tốt hơn {percent} phần trăm.",
+    "Khi phát hiện {pest} vượt ngưỡng kinh tế, bà con cần phun thuốc vào sáng sớm hoặc chiều mát.",
+    "Giống {crop} mới chịu hạn tốt, phù hợp với điều kiện canh tác ở {region}.",
+    "Mật độ {pest} tăng nhanh khi thời tiết nóng ẩm kéo dài trong {stage}.",
+    "Lượng {input} khuyến cáo cho mỗi hecta {crop} là {amount} kg, chia làm {splits} lần bón.",
+]
+
+
+def synthetic_page(rng: random.Random, sentences: int) -> str:
+    """A page of `sentences` random template sentences."""
+    parts = []
+    for _ in range(sentences):
+        parts.append(rng.choice(TEMPLATES).format(
+            crop=rng.choice(CROPS), pest=rng.choice(PESTS), input=rng.choice(INPUTS),
+            region=rng.choice(REGIONS), stage=rng.choice(STAGES), percent=rng.randint(5, 40),
+            amount=rng.randint(50, 400), splits=rng.randint(2, 4)
+        ))
+    return " ".join(parts)
+
+
+def sample_texts(count: int, seed: int = 0) -> List[str]:
+    """Pages, single sentences and short query-like prefixes, for embedding parity and throughput runs."""
+    rng = random.Random(seed)
+    texts = []
+    while len(texts) < count:
+        page = synthetic_page(rng, 8)
+        sentences = [sentence.strip() + "." for sentence in page.split(".") if sentence.strip()]
+        texts.append(" ".join(sentences))
+        texts.extend(sentences[:3])
+        texts.append(" ".join(sentences[0].split()[:8]))
+    return texts[:count]
@@ -0,0 +1,149 @@
+"""
+Qdrant collection tuning.
+
+    python tune_qdrant.py migrate   # apply QDRANT_* settings from config.py to the existing collection
+    python tune_qdrant.py report    # recall@k vs latency for several hnsw_ef values
+
+The report samples stored vectors, perturbs them slightly to act as queries and
+compares approximate results with exact (brute force) search on the same collection.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+import config
+from vector_backends import QdrantBackend, create_vector_backend
+
+
+def open_backend(store_type: str) -> QdrantBackend:
+    backend = create_vector_backend(store_type)
+    if not isinstance(backend, QdrantBackend):
+        raise SystemExit(f"VECTOR_STORE_TYPE '{store_type}' is not a Qdrant store.")
+    return backend
+
+
+def sample_queries(backend: QdrantBackend, count: int, noise: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    points, _ = backend.client.scroll(
+        collection_name=backend.collection_name,
+        limit=count * 5,
+        with_payload=False,
+        with_vectors=True
+    )
+    if not points:
+        raise SystemExit("Collection is empty, nothing to measure.")
+    picked = rng.choice(len(points), size=min(count, len(points)), replace=False)
+    vectors = np.asarray([points[i].vector for i in picked], dtype=np.float32)
+    vectors += rng.normal(0.0, noise, vectors.shape).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def run_queries(backend: QdrantBackend, queries: np.ndarray, k: int, **params):
+    ids = []
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        points = backend.client.query_points(
+            collection_name=backend.collection_name,
+            query=query.tolist(),
+            limit=k,
+            search_params=backend.search_params(**params),
+            with_payload=False
+        ).points
+        latencies.append((time.perf_counter() - started) * 1000)
+        ids.append({str(point.id) for point in points})
+    return ids, np.asarray(latencies)
+
+
+def memory_estimate(backend: QdrantBackend, points: int) -> dict:
+    originals = points * backend.dim * 4
+    quantized = {'none': 0, 'scalar': points * backend.dim, 'binary': points * backend.dim // 8}[backend.quantization]
+    return {
+        'points': points,
+        'original_vectors_mb': originals / 2**20,
+        'original_vectors_location': 'disk' if backend.on_disk else 'ram',
+        'quantized_vectors_mb': quantized / 2**20,
+    }
+
+
+def report(args):
+    backend = open_backend(args.store)
+    queries = sample_queries(backend, args.queries, args.noise)
+    truth, exact_latency = run_queries(backend, queries, args.k, exact=True)
+
+    rescore_options = [True, False] if backend.quantization != "none" else [None]
+    rows = []
+    for ef in args.ef:
+        for rescore in rescore_options:
+            found, latency = run_queries(backend, queries, args.k, hnsw_ef=ef, rescore=rescore)
+            recall = np.mean([len(a & b) / max(len(b), 1) for a, b in zip(found, truth)])
+            rows.append({
+                'hnsw_ef': ef,
+                'rescore': rescore,
+                'recall': float(recall),
+                'p50_ms': float(np.percentile(latency, 50)),
+                'p95_ms': float(np.percentile(latency, 95)),
+            })
+
+    result = {
+        'collection': backend.collection_name,
+        'quantization': backend.quantization,
+        'hnsw_m': backend.hnsw_m,
+        'hnsw_ef_construct': backend.hnsw_ef_construct,
+        'k': args.k,
+        'queries': len(queries),
+        'exact_p50_ms': float(np.percentile(exact_latency, 50)),
+        'memory': memory_estimate(backend, backend.count()),
+        'results': rows,
+    }
+
+    print(
+        f"\nCollection '{backend.collection_name}': quantization={backend.quantization}, "
+        f"m={backend.hnsw_m}, ef_construct={backend.hnsw_ef_construct}, on_disk={backend.on_disk}"
+    )
+    memory = result['memory']
+    print(
+        f"{memory['points']} points, originals {memory['original_vectors_mb']:.1f} MB "
+        f"({memory['original_vectors_location']}), quantized {memory['quantized_vectors_mb']:.1f} MB"
+    )
+    print(f"Exact search p50: {result['exact_p50_ms']:.2f} ms\n")
+    print(f"{'hnsw_ef':>8} {'rescore':>8} {f'recall@{args.k}':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for row in rows:
+        rescore = "-" if row['rescore'] is None else str(row['rescore'])
+        print(f"{row['hnsw_ef']:>8} {rescore:>8} {row['recall']:>10.3f} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+
+def migrate(args):
+    backend = open_backend(args.store)
+    changes = backend.migrate()
+    if changes:
+        print(f"Migration started: {', '.join(changes)}. Qdrant rebuilds the segments in the background.")
+    else:
+        print("Collection already matches config.py.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the Qdrant collection.")
+    parser.add_argument("command", choices=["migrate", "report"])
+    parser.add_argument("--store", default=config.VECTOR_STORE_TYPE, help="qdrant or qdrant_local")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05, help="stddev of the noise added to sampled vectors")
+    parser.add_argument("--ef", type=lambda value: [int(v) for v in value.split(",")], default=[16, 32, 64, 128, 256])
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+    if args.command == "migrate":
+        migrate(args)
+    else:
+        report(args)
+
+
+if __name__ == "__main__":
+    main()
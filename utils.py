@@ -1,6 +1,14 @@
 import re
-from typing import List, Dict, Tuple
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, List, Dict, Tuple, Optional, Sequence
 import hashlib
+import uuid
+
+import numpy as np
 
 
 def clean_text(text: str) -> str:
@@ -19,6 +27,17 @@ def format_source_reference(doc_name: str, page: int) -> str:
     return f"{doc_name} (page {page})"
 
 
+def upload_filename(name: str) -> str:
+    """
+    The bare file name of a client-supplied upload name, so it cannot point outside the
+    upload directory ("../../app.py.pdf", "..\\x.pdf"). Raises ValueError if nothing is left.
+    """
+    name = re.split(r"[\\/]", name or "")[-1].strip()
+    if name in ("", ".", ".."):
+        raise ValueError(f"Invalid file name: {name!r}")
+    return name
+
+
 def calculate_file_hash(file_path: str) -> str:
     hash_md5 = hashlib.md5()
     with open(file_path, "rb") as f:
@@ -27,6 +46,151 @@ def calculate_file_hash(file_path: str) -> str:
     return hash_md5.hexdigest()
 
 
+def normalize_chunk_id(point_id) -> str:
+    """Qdrant returns our md5 chunk ids as hyphenated UUIDs; map both forms to plain hex."""
+    try:
+        return uuid.UUID(str(point_id)).hex
+    except ValueError:
+        return str(point_id)
+
+
+def get_chunk_id(doc) -> str:
+    """Stable chunk id: the id stored at ingest, the Qdrant point id, or the content hash both derive from."""
+    metadata = getattr(doc, 'metadata', None) or {}
+    if metadata.get('chunk_id'):
+        return str(metadata['chunk_id'])
+    if metadata.get('_id'):
+        return normalize_chunk_id(metadata['_id'])
+    return hashlib.md5(f"{doc.page_content}".encode()).hexdigest()
+
+
+def peak_memory_mb() -> Optional[float]:
+    """Peak resident memory of this process in MB, or None where the platform does not report it."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024
+    return peak / 1024
+
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer; waiting writers block new readers."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read_locked(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            self._release_read()
+
+    def hold_read(self) -> Callable[[], None]:
+        """
+        Take a read hold for work that may outlive the caller's read_locked block, such as
+        a pool task; returns the function that releases it. While other readers hold the
+        lock the hold joins them at once, so a reader never waits behind a queued writer
+        that is itself waiting for that reader.
+        """
+        with self._cond:
+            while self._writer or (self._writers_waiting and not self._readers):
+                self._cond.wait()
+            self._readers += 1
+        released = threading.Lock()
+
+        def release():
+            if released.acquire(blocking=False):
+                self._release_read()
+
+        return release
+
+    def _release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    @contextmanager
+    def write_locked(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+def normalize_query(query: str) -> str:
+    """Cache key form of a query: lowercased with collapsed whitespace, as the tokenizers see it."""
+    return " ".join(query.lower().split())
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional time-to-live and hit/miss counters."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[1] < self.ttl):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, any]:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
 def highlight_text(text: str, query: str, max_length: int = 300) -> str:
     query_terms = query.lower().split()
     if len(text) > max_length:
@@ -51,27 +215,43 @@ def highlight_text(text: str, query: str, max_length: int = 300) -> str:
 def reciprocal_rank_fusion(
     semantic_results: List[Tuple[any, float]], 
     keyword_results: List[Tuple[any, float]], 
+    k: int = 60,
+    weights: Tuple[float, float] = (1.0, 1.0)
+) -> List[Tuple[any, float]]:
+    return weighted_reciprocal_rank_fusion([semantic_results, keyword_results], weights, k=k)
+
+
+def weighted_reciprocal_rank_fusion(
+    result_lists: Sequence[List[Tuple[any, float]]],
+    weights: Sequence[float],
     k: int = 60
 ) -> List[Tuple[any, float]]:
-    doc_scores = {}
-    for rank, (doc, score) in enumerate(semantic_results, 1):
-        doc_id = id(doc)
-        if doc_id not in doc_scores:
-            doc_scores[doc_id] = {'doc': doc, 'score': 0}
-        doc_scores[doc_id]['score'] += 1 / (k + rank)
-    for rank, (doc, score) in enumerate(keyword_results, 1):
-        doc_id = id(doc)
-        if doc_id not in doc_scores:
-            doc_scores[doc_id] = {'doc': doc, 'score': 0}
-        doc_scores[doc_id]['score'] += 1 / (k + rank)
-    ranked_results = sorted(
-        [(item['doc'], item['score']) for item in doc_scores.values()],
-        key=lambda x: x[1],
-        reverse=True
-    )
-    
-    return ranked_results
-    
+    """
+    Fuse ranked lists by summing weight / (k + rank) per chunk id.
+    Items are Documents or plain chunk ids.
+
+    The same chunk returned by several legs is merged into one result; ties keep
+    the order in which chunks were first seen.
+    """
+    chunk_ids = []
+    contributions = []
+    docs = {}
+    for results, weight in zip(result_lists, weights):
+        if not results:
+            continue
+        contributions.append(weight / (k + np.arange(1, len(results) + 1, dtype=np.float64)))
+        for doc, _ in results:
+            chunk_id = doc if isinstance(doc, str) else get_chunk_id(doc)
+            chunk_ids.append(chunk_id)
+            docs.setdefault(chunk_id, doc)
+    if not chunk_ids:
+        return []
+
+    keys, first_seen, inverse = np.unique(np.array(chunk_ids), return_index=True, return_inverse=True)
+    scores = np.bincount(inverse, weights=np.concatenate(contributions), minlength=len(keys))
+    order = np.lexsort((first_seen, -scores))
+    return [(docs[keys[i]], float(scores[i])) for i in order]
+
 def format_chat_history(history: List[Dict[str, str]]) -> str:
     formatted = []
     for msg in history:
@@ -0,0 +1,829 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+import config
+from chunk_store import ChunkStore
+from utils import get_chunk_id, normalize_chunk_id
+
+logger = logging.getLogger(__name__)
+
+
+def _payload_document(payload: Dict) -> Document:
+    return Document(page_content=payload.get('page_content', ''), metadata=payload.get('metadata', {}))
+
+
+class VectorBackend:
+    """
+    Storage for chunk vectors and their payloads ({'page_content', 'metadata'}).
+    Chunk ids are 32-character hashes (md5 of model, source and content); scores are cosine similarities.
+    """
+
+    name = "base"
+    # True when search() gets payloads in the same round trip as the hits (Qdrant); hybrid
+    # search then keeps the legs' Documents. Otherwise it fuses ids and builds Documents after.
+    payloads_with_hits = True
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def upsert(self, ids: List[str], vectors: Sequence[Sequence[float]], payloads: List[Dict]):
+        raise NotImplementedError
+
+    def search(self, vector: Sequence[float], k: int) -> List[Tuple[Document, float]]:
+        raise NotImplementedError
+
+    def search_many(self, vectors: Sequence[Sequence[float]], k: int) -> List[List[Tuple[Document, float]]]:
+        """Top-k results for several query vectors, in query order."""
+        return [self.search(vector, k) for vector in vectors]
+
+    def search_ids(self, vector: Sequence[float], k: int) -> List[Tuple[str, float]]:
+        """Top-k (chunk_id, score) pairs, for callers that only build Documents for their final results."""
+        return self.search_many_ids([vector], k)[0]
+
+    def search_many_ids(self, vectors: Sequence[Sequence[float]], k: int) -> List[List[Tuple[str, float]]]:
+        return [
+            [(get_chunk_id(document), score) for document, score in results]
+            for results in self.search_many(vectors, k)
+        ]
+
+    def retrieve(self, ids: List[str]) -> Dict[str, Document]:
+        raise NotImplementedError
+
+    def set_payloads(self, ids: List[str], payloads: List[Dict]):
+        """Replace the payloads of chunks that are already stored, keeping their vectors."""
+        raise NotImplementedError
+
+    def ids_for_source(self, source: str) -> List[str]:
+        """Ids of every chunk whose metadata.source is this file name."""
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def scroll(self, batch_size: int) -> Iterator[List[Tuple[str, Dict]]]:
+        """Yield (chunk_id, payload) pairs for every stored chunk, batch_size at a time."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def refresh(self):
+        """See data written by another process; stores that are always current need nothing."""
+
+
+class QdrantBackend(VectorBackend):
+    """
+    Qdrant collection, either on a server or in local (embedded) mode.
+
+    New collections are created with the configured HNSW parameters, optional int8
+    scalar or binary quantization (quantized vectors in RAM, candidates rescored
+    with the originals) and optionally on-disk original vectors. An existing
+    collection keeps its settings until migrate() is called. Local mode always
+    searches exactly, so these settings only apply to a Qdrant server.
+    """
+
+    name = "qdrant"
+    QUANTIZATION_MODES = ("none", "scalar", "binary")
+    SOURCE_FIELD = "metadata.source"
+
+    def __init__(
+        self,
+        client,
+        collection_name: str,
+        dim: int,
+        quantization: str = config.QDRANT_QUANTIZATION,
+        on_disk: bool = config.QDRANT_ON_DISK,
+        hnsw_m: int = config.QDRANT_HNSW_M,
+        hnsw_ef_construct: int = config.QDRANT_HNSW_EF_CONSTRUCT,
+        hnsw_ef: Optional[int] = config.QDRANT_HNSW_EF,
+        rescore: bool = config.QDRANT_RESCORE,
+        oversampling: float = config.QDRANT_OVERSAMPLING,
+        local: bool = False
+    ):
+        from qdrant_client.http import models
+
+        if quantization not in self.QUANTIZATION_MODES:
+            raise ValueError(f"Unknown QDRANT_QUANTIZATION: {quantization}")
+        self._models = models
+        self.client = client
+        self.collection_name = collection_name
+        self.dim = dim
+        self.quantization = quantization
+        self.on_disk = on_disk
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construct = hnsw_ef_construct
+        self.hnsw_ef = hnsw_ef
+        self.rescore = rescore
+        self.oversampling = oversampling
+        self.local = local
+        self._ensure_collection()
+
+    @classmethod
+    def connect(cls, url: str, api_key: Optional[str], collection_name: str, dim: int, **settings) -> "QdrantBackend":
+        from qdrant_client import QdrantClient
+
+        return cls(QdrantClient(url=url, api_key=api_key or None), collection_name, dim, **settings)
+
+    @classmethod
+    def open_local(cls, path: Path, collection_name: str, dim: int, **settings) -> "QdrantBackend":
+        from qdrant_client import QdrantClient
+
+        Path(path).mkdir(parents=True, exist_ok=True)
+        return cls(QdrantClient(path=str(path)), collection_name, dim, local=True, **settings)
+
+    def _quantization_config(self):
+        models = self._models
+        if self.quantization == "scalar":
+            return models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(
+                    type=models.ScalarType.INT8, quantile=0.99, always_ram=config.QDRANT_QUANTIZATION_ALWAYS_RAM
+                )
+            )
+        if self.quantization == "binary":
+            return models.BinaryQuantization(
+                binary=models.BinaryQuantizationConfig(always_ram=config.QDRANT_QUANTIZATION_ALWAYS_RAM)
+            )
+        return None
+
+    def _hnsw_config(self):
+        return self._models.HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+    def _collection_exists(self) -> bool:
+        from qdrant_client.http.exceptions import UnexpectedResponse
+
+        try:
+            self.client.get_collection(self.collection_name)
+        except UnexpectedResponse as e:
+            if e.status_code == 404:
+                return False
+            raise
+        except ValueError:
+            # Embedded Qdrant raises ValueError("Collection ... not found").
+            if self.local:
+                return False
+            raise
+        return True
+
+    def _ensure_collection(self):
+        if self._collection_exists():
+            logger.info("Collection '%s' exists.", self.collection_name)
+            try:
+                changes = self.pending_migration()
+            except Exception:
+                logger.exception("Could not compare collection '%s' with config.", self.collection_name)
+                changes = []
+            if changes:
+                logger.warning(
+                    "Collection settings differ from config (%s); run 'python tune_qdrant.py migrate' to apply them.",
+                    ", ".join(changes)
+                )
+        else:
+            logger.info("Collection '%s' not found. Creating...", self.collection_name)
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=self._models.VectorParams(
+                    size=self.dim, distance=self._models.Distance.COSINE, on_disk=self.on_disk
+                ),
+                hnsw_config=self._hnsw_config(),
+                quantization_config=self._quantization_config()
+            )
+            logger.info(
+                "Collection created (quantization: %s, on_disk: %s, m: %s, ef_construct: %s).",
+                self.quantization, self.on_disk, self.hnsw_m, self.hnsw_ef_construct
+            )
+        self._ensure_source_index()
+
+    def _ensure_source_index(self):
+        """Keyword index on metadata.source so per-document lookups and deletes avoid a full scan."""
+        if self.local:
+            # Embedded Qdrant ignores payload indexes and filters by scanning.
+            return
+        info = self.client.get_collection(self.collection_name)
+        if self.SOURCE_FIELD in (info.payload_schema or {}):
+            return
+        logger.info("Creating payload index on '%s'...", self.SOURCE_FIELD)
+        self.client.create_payload_index(
+            collection_name=self.collection_name,
+            field_name=self.SOURCE_FIELD,
+            field_schema=self._models.PayloadSchemaType.KEYWORD,
+            wait=True
+        )
+
+    def _current_quantization(self, info) -> str:
+        current = info.config.quantization_config
+        if isinstance(current, self._models.ScalarQuantization):
+            return "scalar"
+        if isinstance(current, self._models.BinaryQuantization):
+            return "binary"
+        return "none"
+
+    def pending_migration(self) -> List[str]:
+        """Describe how the existing collection differs from the configured settings."""
+        if self.local:
+            return []
+        info = self.client.get_collection(self.collection_name)
+        changes = []
+        quantization = self._current_quantization(info)
+        if quantization != self.quantization:
+            changes.append(f"quantization {quantization} -> {self.quantization}")
+        on_disk = bool(info.config.params.vectors.on_disk)
+        if on_disk != self.on_disk:
+            changes.append(f"on_disk {on_disk} -> {self.on_disk}")
+        hnsw = info.config.hnsw_config
+        if hnsw.m != self.hnsw_m:
+            changes.append(f"m {hnsw.m} -> {self.hnsw_m}")
+        if hnsw.ef_construct != self.hnsw_ef_construct:
+            changes.append(f"ef_construct {hnsw.ef_construct} -> {self.hnsw_ef_construct}")
+        return changes
+
+    def migrate(self) -> List[str]:
+        """
+        Apply the configured quantization, on-disk and HNSW settings to the existing
+        collection in place. Qdrant rebuilds the affected segments in the background
+        and keeps serving searches meanwhile. Returns the applied changes.
+        """
+        changes = self.pending_migration()
+        if not changes:
+            return []
+        quantization = self._quantization_config()
+        self.client.update_collection(
+            collection_name=self.collection_name,
+            vectors_config={"": self._models.VectorParamsDiff(on_disk=self.on_disk)},
+            hnsw_config=self._hnsw_config(),
+            quantization_config=quantization if quantization is not None else self._models.Disabled.DISABLED
+        )
+        return changes
+
+    def search_params(self, hnsw_ef: Optional[int] = None, rescore: Optional[bool] = None, exact: bool = False):
+        if self.local:
+            return None
+        models = self._models
+        quantization = None
+        if self.quantization != "none":
+            quantization = models.QuantizationSearchParams(
+                rescore=self.rescore if rescore is None else rescore,
+                oversampling=self.oversampling
+            )
+        return models.SearchParams(
+            hnsw_ef=hnsw_ef if hnsw_ef is not None else self.hnsw_ef,
+            exact=exact,
+            quantization=quantization
+        )
+
+    def count(self) -> int:
+        return self.client.count(collection_name=self.collection_name).count
+
+    def upsert(self, ids: List[str], vectors: Sequence[Sequence[float]], payloads: List[Dict]):
+        points = [
+            self._models.PointStruct(id=chunk_id, vector=list(vector), payload=payload)
+            for chunk_id, vector, payload in zip(ids, vectors, payloads)
+        ]
+        self.client.upsert(collection_name=self.collection_name, points=points, wait=True)
+
+    def search(self, vector: Sequence[float], k: int) -> List[Tuple[Document, float]]:
+        points = self.client.query_points(
+            collection_name=self.collection_name,
+            query=list(vector),
+            limit=k,
+            search_params=self.search_params(),
+            with_payload=True
+        ).points
+        return [(_payload_document(point.payload), point.score) for point in points]
+
+    def search_many(self, vectors: Sequence[Sequence[float]], k: int) -> List[List[Tuple[Document, float]]]:
+        if not len(vectors):
+            return []
+        requests = [
+            self._models.QueryRequest(
+                query=list(vector),
+                limit=k,
+                params=self.search_params(),
+                with_payload=True
+            )
+            for vector in vectors
+        ]
+        responses = self.client.query_batch_points(collection_name=self.collection_name, requests=requests)
+        return [
+            [(_payload_document(point.payload), point.score) for point in response.points]
+            for response in responses
+        ]
+
+    def search_many_ids(self, vectors: Sequence[Sequence[float]], k: int) -> List[List[Tuple[str, float]]]:
+        if not len(vectors):
+            return []
+        requests = [
+            self._models.QueryRequest(query=list(vector), limit=k, params=self.search_params(), with_payload=False)
+            for vector in vectors
+        ]
+        responses = self.client.query_batch_points(collection_name=self.collection_name, requests=requests)
+        return [[(normalize_chunk_id(point.id), point.score) for point in response.points] for response in responses]
+
+    def retrieve(self, ids: List[str]) -> Dict[str, Document]:
+        if not ids:
+            return {}
+        points = self.client.retrieve(
+            collection_name=self.collection_name,
+            ids=ids,
+            with_payload=True,
+            with_vectors=False
+        )
+        return {normalize_chunk_id(point.id): _payload_document(point.payload) for point in points}
+
+    def set_payloads(self, ids: List[str], payloads: List[Dict]):
+        if not ids:
+            return
+        operations = [
+            self._models.OverwritePayloadOperation(
+                overwrite_payload=self._models.SetPayload(payload=payload, points=[chunk_id])
+            )
+            for chunk_id, payload in zip(ids, payloads)
+        ]
+        self.client.batch_update_points(collection_name=self.collection_name, update_operations=operations, wait=True)
+
+    def ids_for_source(self, source: str) -> List[str]:
+        models = self._models
+        source_filter = models.Filter(
+            must=[models.FieldCondition(key=self.SOURCE_FIELD, match=models.MatchValue(value=source))]
+        )
+        ids = []
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=source_filter,
+                limit=1000,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False
+            )
+            ids.extend(normalize_chunk_id(point.id) for point in points)
+            if offset is None or not points:
+                return ids
+
+    def delete(self, ids: List[str]):
+        if not ids:
+            return
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=self._models.PointIdsList(points=list(ids)),
+            wait=True
+        )
+
+    def scroll(self, batch_size: int) -> Iterator[List[Tuple[str, Dict]]]:
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False
+            )
+            if points:
+                yield [(normalize_chunk_id(point.id), point.payload) for point in points]
+            if offset is None or not points:
+                return
+
+    def clear(self):
+        # Recreated with the configured settings, so clearing also migrates the collection.
+        self.client.delete_collection(self.collection_name)
+        self._ensure_collection()
+
+
+class NumpyBackend(VectorBackend):
+    """
+    In-process vector store: normalized embeddings in a memory-mapped matrix.
+
+    A query is one matrix-vector product over the mapped rows plus argpartition
+    for the top k, so there is no network hop and no server to run. Vectors are
+    stored as float32 or, with dtype "int8", symmetrically quantized per row
+    (about 4x smaller, cosine scores within ~1e-2). Rows are only appended;
+    payloads live in an append-only JSON-lines log where the last record per id wins.
+    A deleted chunk gets a null payload record and its row is masked out of
+    searches until the same content is stored again; clear() reclaims the space.
+    One process writes; others pick up appended rows with refresh().
+
+    In memory, payloads are held per row in a columnar ChunkStore. Once the log
+    has grown by VECTOR_STORE_SNAPSHOT_RECORDS records, the store is saved to
+    chunks.bin and mapped from there; opening the store maps that snapshot and
+    replays only the log written after it.
+    """
+
+    name = "numpy"
+    payloads_with_hits = False
+    SEARCH_BLOCK_ROWS = 65536
+    # Rows past k rescored exactly, so near-ties at the cut-off land the same way in every batch.
+    RESCORE_MARGIN = 16
+
+    def __init__(self, directory: Path, dim: int, dtype: str = "float32"):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.directory / "vectors.bin"
+        self.scales_path = self.directory / "scales.bin"
+        self.ids_path = self.directory / "ids.bin"
+        self.payloads_path = self.directory / "payloads.jsonl"
+        self.chunks_path = self.directory / "chunks.bin"
+        self.meta_path = self.directory / "meta.json"
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.dtype(np.float32), np.dtype(np.int8)):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.row_ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.chunks = ChunkStore()
+        # Payload records whose row has not been read yet (written by another process).
+        self._pending_payloads: Dict[str, Optional[Dict]] = {}
+        self._dead_mask = None
+        self._matrix = None
+        self._scales = None
+        self._payload_offset = 0
+        self._snapshot_records = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        meta = None
+        if self.meta_path.exists():
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        if meta != {'dim': self.dim, 'dtype': self.dtype.name}:
+            if meta is not None and self.ids_path.exists() and self.ids_path.stat().st_size:
+                raise ValueError(
+                    f"Vector store at {self.directory} holds {meta['dtype']} vectors of size {meta['dim']}, "
+                    f"expected {self.dtype.name} of size {self.dim}"
+                )
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                json.dump({'dim': self.dim, 'dtype': self.dtype.name}, f)
+
+        self._load_snapshot()
+        self._read_new_rows()
+        self._save_snapshot_if_due()
+
+    def _load_snapshot(self):
+        """Map chunks.bin if it matches the rows and payload log on disk."""
+        if not self.chunks_path.exists():
+            return
+        try:
+            chunks, last_id = ChunkStore.load(self.chunks_path)
+        except Exception as e:
+            logger.warning("Ignoring chunk store snapshot %s: %s", self.chunks_path, e)
+            return
+        rows = len(chunks)
+        payload_size = self.payloads_path.stat().st_size if self.payloads_path.exists() else 0
+        valid = rows <= self._disk_rows() and chunks.log_offset <= payload_size
+        if valid and rows:
+            with open(self.ids_path, "rb") as f:
+                f.seek((rows - 1) * 16)
+                valid = f.read(16).hex() == last_id
+        if not valid:
+            logger.warning("Chunk store snapshot does not match the vector store, rebuilding from the payload log.")
+            chunks.close()
+            return
+        with open(self.ids_path, "rb") as f:
+            raw_ids = f.read(rows * 16)
+        self.row_ids = [raw_ids[i * 16:(i + 1) * 16].hex() for i in range(rows)]
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(self.row_ids)}
+        self.chunks = chunks
+        self._payload_offset = chunks.log_offset
+        # The rows are known now; map their vectors even if the log has nothing newer to replay.
+        self._map()
+        logger.info("Chunk store snapshot mapped: %s chunks", chunks.live_count)
+
+    def _save_snapshot_if_due(self):
+        # Relative to the store size, so rewriting the snapshot stays amortized O(1) per record.
+        if self._snapshot_records < max(config.VECTOR_STORE_SNAPSHOT_RECORDS, len(self.row_ids) // 4):
+            return
+        if self._pending_payloads:
+            # Records for rows not read yet would be lost behind the snapshot's log offset.
+            return
+        try:
+            self.chunks.save(self.chunks_path, self._payload_offset, self.row_ids[-1] if self.row_ids else "")
+            chunks, _ = ChunkStore.load(self.chunks_path)
+        except OSError as e:
+            # e.g. the old snapshot is still mapped by another process on Windows; retried later.
+            logger.warning("Could not write chunk store snapshot: %s", e)
+            return
+        self.chunks.close()
+        self.chunks = chunks
+        self._snapshot_records = 0
+        logger.info("Chunk store snapshot saved: %s chunks", chunks.live_count)
+
+    def _disk_rows(self) -> int:
+        """Rows complete in every file; a writer appends vectors (and scales) before ids."""
+        if not self.ids_path.exists() or not self.vectors_path.exists():
+            return 0
+        rows = min(
+            self.ids_path.stat().st_size // 16,
+            self.vectors_path.stat().st_size // (self.dim * self.dtype.itemsize)
+        )
+        if self.dtype == np.int8:
+            rows = min(rows, self.scales_path.stat().st_size // 4 if self.scales_path.exists() else 0)
+        return rows
+
+    def _read_new_rows(self) -> bool:
+        """Load rows and payload records appended since the last read, possibly by another process."""
+        rows = self._disk_rows()
+        payload_size = self.payloads_path.stat().st_size if self.payloads_path.exists() else 0
+        if rows < len(self.row_ids) or payload_size < self._payload_offset:
+            # Cleared or rewritten elsewhere: start over.
+            self._reset()
+        changed = False
+        known = len(self.row_ids)
+        if rows > known:
+            with open(self.ids_path, "rb") as f:
+                f.seek(known * 16)
+                raw_ids = f.read((rows - known) * 16)
+            self._add_rows([raw_ids[i * 16:(i + 1) * 16].hex() for i in range(rows - known)])
+            changed = True
+        if payload_size > self._payload_offset:
+            with open(self.payloads_path, "rb") as f:
+                f.seek(self._payload_offset)
+                data = f.read(payload_size - self._payload_offset)
+            # Only whole lines; a record still being written is read next time.
+            complete = data[:data.rfind(b"\n") + 1]
+            for line in complete.splitlines():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._set_payload(record['id'], record['payload'])
+                self._snapshot_records += 1
+            self._payload_offset += len(complete)
+            changed = changed or bool(complete)
+        if changed or (rows == 0 and self._matrix is not None):
+            self._map()
+        return changed
+
+    def _reset(self):
+        self.row_ids = []
+        self.rows = {}
+        self.chunks.close()
+        self.chunks = ChunkStore()
+        self._pending_payloads = {}
+        self._dead_mask = None
+        self._payload_offset = 0
+        self._snapshot_records = 0
+
+    def _add_rows(self, ids: List[str]):
+        for chunk_id in ids:
+            self.rows[chunk_id] = len(self.row_ids)
+            self.row_ids.append(chunk_id)
+        self.chunks.ensure_rows(len(self.row_ids))
+        self._dead_mask = None
+        for chunk_id in ids:
+            if chunk_id in self._pending_payloads:
+                self._set_payload(chunk_id, self._pending_payloads.pop(chunk_id))
+
+    def _set_payload(self, chunk_id: str, payload: Optional[Dict]):
+        """Apply one payload record; None marks the chunk deleted."""
+        row = self.rows.get(chunk_id)
+        if row is None:
+            self._pending_payloads[chunk_id] = payload
+            return
+        if payload is None and not self.chunks.is_live(row):
+            return
+        self.chunks.set(row, chunk_id, payload)
+        self._dead_mask = None
+
+    def _live_mask(self) -> Optional[np.ndarray]:
+        """Boolean mask of deleted rows, or None when nothing is deleted."""
+        if self.chunks.live_count == len(self.row_ids):
+            return None
+        if self._dead_mask is None or len(self._dead_mask) != len(self.row_ids):
+            self._dead_mask = self.chunks.dead_mask()
+        return self._dead_mask
+
+    def _append_payloads(self, ids: List[str], payloads: List[Optional[Dict]]):
+        records = "".join(
+            json.dumps({'id': chunk_id, 'payload': payload}, ensure_ascii=False) + "\n"
+            for chunk_id, payload in zip(ids, payloads)
+        ).encode("utf-8")
+        with open(self.payloads_path, "ab") as f:
+            f.write(records)
+        self._payload_offset += len(records)
+        for chunk_id, payload in zip(ids, payloads):
+            self._set_payload(chunk_id, payload)
+        self._snapshot_records += len(ids)
+        self._save_snapshot_if_due()
+
+    def _drop_torn_tails(self):
+        """Cut anything a crashed writer left past the last complete row or payload record."""
+        rows = len(self.row_ids)
+        self._truncate(self.vectors_path, rows * self.dim * self.dtype.itemsize)
+        self._truncate(self.ids_path, rows * 16)
+        if self.dtype == np.int8:
+            self._truncate(self.scales_path, rows * 4)
+        self._truncate(self.payloads_path, self._payload_offset)
+
+    def refresh(self):
+        with self._lock:
+            self._read_new_rows()
+
+    @staticmethod
+    def _truncate(path: Path, size: int):
+        if path.exists() and path.stat().st_size > size:
+            os.truncate(path, size)
+
+    def _map(self):
+        rows = len(self.row_ids)
+        if not rows:
+            self._matrix = None
+            self._scales = None
+            return
+        self._matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(rows, self.dim))
+        if self.dtype == np.int8:
+            self._scales = np.memmap(self.scales_path, dtype=np.float32, mode="r", shape=(rows,))
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def count(self) -> int:
+        return self.chunks.live_count
+
+    def upsert(self, ids: List[str], vectors: Sequence[Sequence[float]], payloads: List[Dict]):
+        ids = [normalize_chunk_id(chunk_id) for chunk_id in ids]
+        with self._lock:
+            self._read_new_rows()
+            self._drop_torn_tails()
+            # Ids hash the content, so a known id already has its vector; only the payload changes.
+            new_rows = []
+            seen = set()
+            for i, chunk_id in enumerate(ids):
+                if chunk_id not in self.rows and chunk_id not in seen:
+                    seen.add(chunk_id)
+                    new_rows.append(i)
+            if new_rows:
+                matrix = self._normalize([vectors[i] for i in new_rows])
+                if self.dtype == np.int8:
+                    scales = np.abs(matrix).max(axis=1) / 127.0
+                    scales[scales == 0] = 1.0
+                    quantized = np.round(matrix / scales[:, None]).astype(np.int8)
+                    with open(self.scales_path, "ab") as f:
+                        f.write(scales.astype(np.float32).tobytes())
+                    matrix = quantized
+                with open(self.vectors_path, "ab") as f:
+                    f.write(matrix.tobytes())
+                with open(self.ids_path, "ab") as f:
+                    f.write(b"".join(bytes.fromhex(ids[i]) for i in new_rows))
+            self._add_rows([ids[i] for i in new_rows])
+            self._append_payloads(ids, payloads)
+            if new_rows:
+                self._map()
+
+    def _scores(self, matrix, scales, queries: np.ndarray) -> np.ndarray:
+        """Cosine scores, one row per query: (queries, rows)."""
+        if scales is None:
+            return queries @ matrix.T
+        # Block the int8 matrix so the float32 upcast never holds more than one block.
+        scores = np.empty((queries.shape[0], matrix.shape[0]), dtype=np.float32)
+        for start in range(0, matrix.shape[0], self.SEARCH_BLOCK_ROWS):
+            block = matrix[start:start + self.SEARCH_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        return scores * scales
+
+    def search(self, vector: Sequence[float], k: int) -> List[Tuple[Document, float]]:
+        return self.search_many([vector], k)[0]
+
+    def _top_rows(self, vectors: Sequence[Sequence[float]], k: int) -> List[List[Tuple[int, float]]]:
+        """
+        Score every query against the matrix in one matrix product; the top k live rows per query.
+        The shortlist is rescored exactly, one row at a time, so a query ranks the same alone or in
+        a batch (BLAS sums a batch in a different order, which flips near-ties).
+        """
+        with self._lock:
+            matrix, scales = self._matrix, self._scales
+            dead = self._live_mask()
+        if matrix is None or k <= 0 or not len(vectors):
+            return [[] for _ in vectors]
+        rows = matrix.shape[0]
+        queries = self._normalize(vectors)
+        all_scores = self._scores(matrix, scales, queries)
+        if dead is not None:
+            dead = dead[:rows]
+            all_scores[:, dead] = -np.inf
+        shortlist = min(rows, k + self.RESCORE_MARGIN)
+        tops = []
+        for query, scores in zip(queries, all_scores):
+            if shortlist < rows:
+                top = np.argpartition(-scores, shortlist - 1)[:shortlist]
+            else:
+                top = np.arange(rows)
+            if dead is not None:
+                top = top[~dead[top]]
+            top = np.sort(top)
+            candidates = np.asarray(matrix[top], dtype=np.float64)
+            if scales is not None:
+                candidates *= scales[top][:, None]
+            exact = np.einsum("ij,j->i", candidates, query.astype(np.float64))
+            order = np.lexsort((top, -exact))[:k]
+            tops.append([(int(top[i]), float(exact[i])) for i in order])
+        return tops
+
+    def search_many(self, vectors: Sequence[Sequence[float]], k: int) -> List[List[Tuple[Document, float]]]:
+        tops = self._top_rows(vectors, k)
+        # Under the lock, so a concurrent writer never shows half a row.
+        with self._lock:
+            return [
+                [(self.chunks.document(row, self.row_ids[row]) or Document(page_content=""), score) for row, score in top]
+                for top in tops
+            ]
+
+    def search_many_ids(self, vectors: Sequence[Sequence[float]], k: int) -> List[List[Tuple[str, float]]]:
+        row_ids = self.row_ids
+        return [[(row_ids[row], score) for row, score in top] for top in self._top_rows(vectors, k)]
+
+    def retrieve(self, ids: List[str]) -> Dict[str, Document]:
+        results = {}
+        with self._lock:
+            for chunk_id in ids:
+                chunk_id = normalize_chunk_id(chunk_id)
+                row = self.rows.get(chunk_id)
+                document = self.chunks.document(row, chunk_id) if row is not None else None
+                if document is not None:
+                    results[chunk_id] = document
+        return results
+
+    def set_payloads(self, ids: List[str], payloads: List[Dict]):
+        ids = [normalize_chunk_id(chunk_id) for chunk_id in ids]
+        with self._lock:
+            self._read_new_rows()
+            self._drop_torn_tails()
+            known = [(chunk_id, payload) for chunk_id, payload in zip(ids, payloads) if chunk_id in self.rows]
+            if known:
+                self._append_payloads([chunk_id for chunk_id, _ in known], [payload for _, payload in known])
+
+    def ids_for_source(self, source: str) -> List[str]:
+        with self._lock:
+            return [self.row_ids[row] for row in self.chunks.rows_for_source(source)]
+
+    def delete(self, ids: List[str]):
+        ids = [normalize_chunk_id(chunk_id) for chunk_id in ids]
+        with self._lock:
+            self._read_new_rows()
+            self._drop_torn_tails()
+            live = [chunk_id for chunk_id in dict.fromkeys(ids) if chunk_id in self.rows and self.chunks.is_live(self.rows[chunk_id])]
+            if live:
+                self._append_payloads(live, [None] * len(live))
+
+    def scroll(self, batch_size: int) -> Iterator[List[Tuple[str, Dict]]]:
+        with self._lock:
+            live_rows = [row for row in range(len(self.row_ids)) if self.chunks.is_live(row)]
+        for start in range(0, len(live_rows), batch_size):
+            with self._lock:
+                batch = [
+                    (self.row_ids[row], self.chunks.payload(row, self.row_ids[row]) or {})
+                    for row in live_rows[start:start + batch_size]
+                ]
+            yield batch
+
+    def clear(self):
+        with self._lock:
+            self._matrix = None
+            self._scales = None
+            for path in (self.vectors_path, self.scales_path, self.ids_path, self.payloads_path, self.chunks_path):
+                if path.exists():
+                    path.unlink()
+            self._reset()
+
+
+def create_vector_backend(store_type: Optional[str] = None) -> VectorBackend:
+    """Open the vector store selected by VECTOR_STORE_TYPE."""
+    store_type = store_type or config.VECTOR_STORE_TYPE
+    dim = config.EMBEDDING_DIMENSION
+    if store_type == "numpy":
+        logger.info("Opening NumPy vector store at %s (%s)", config.VECTOR_STORE_DIR, config.VECTOR_STORE_DTYPE)
+        return NumpyBackend(config.VECTOR_STORE_DIR, dim, dtype=config.VECTOR_STORE_DTYPE)
+    if store_type == "qdrant_local":
+        logger.info("Opening local Qdrant at %s", config.QDRANT_PATH)
+        return QdrantBackend.open_local(config.QDRANT_PATH, config.QDRANT_COLLECTION_NAME, dim)
+    if store_type != "qdrant":
+        raise ValueError(f"Unknown VECTOR_STORE_TYPE: {store_type}")
+
+    max_retries = config.QDRANT_CONNECT_RETRIES
+    delay = config.QDRANT_CONNECT_BACKOFF
+    for attempt in range(max_retries):
+        try:
+            logger.info("Connecting to Qdrant at %s (Attempt %s/%s)...", config.QDRANT_URL, attempt+1, max_retries)
+            return QdrantBackend.connect(
+                config.QDRANT_URL, config.QDRANT_API_KEY, config.QDRANT_COLLECTION_NAME, dim
+            )
+        except Exception as e:
+            logger.error("Error connecting to Qdrant: %s", e)
+            if attempt < max_retries - 1:
+                # Exponential backoff with jitter, so restarted replicas do not retry in lockstep.
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, config.QDRANT_CONNECT_BACKOFF_MAX)
+    raise ConnectionError(f"Could not connect to Qdrant at {config.QDRANT_URL}")